@@ -1,7 +1,11 @@
 import streamlit as st
 import os
-from main import main_process_generator
-from config import DEEPSEEK_API_KEY, DOUBAO_APP_ID, DOUBAO_TOKEN  # 修改导入项
+import time
+from config import WORKSPACE_CLEANUP, OUTPUT_DIR, JOB_POLL_SECONDS, STREAM_RENDER_INTERVAL_SECONDS, STREAM_RENDER_MAX_PENDING_CHARS  # 修改导入项
+from workspace import JobWorkspace, WorkspaceQuotaError
+from stream_renderer import IncrementalMarkdownRenderer
+from upload_store import get_upload_store
+from job_queue import get_job_store, get_worker_pool, submit_job, resume_job, JOB_QUEUED, JOB_FAILED, TERMINAL_STATUSES
 
 st.set_page_config(page_title="智能笔记 Agent", layout="wide")
 st.title("👨‍💻 智能内容生成 Agent")
@@ -12,22 +16,55 @@ with st.sidebar:
     
     output_filename = st.text_input("请输入希望的笔记文件名 (无需后缀)", value="我的学习笔记")
 
-    query_option = st.selectbox(
+    query_options = st.multiselect(
         "请选择生成内容类型:",
         ("Notes", "Q&A", "Quiz"),
-        index=0,
-        help="选择 'Notes' 生成结构化笔记, 'Q&A' 生成问答对, 'Quiz' 生成测验题。"
+        default=["Notes"],
+        help="选择 'Notes' 生成结构化笔记, 'Q&A' 生成问答对, 'Quiz' 生成测验题。可多选，文件只转录一次，多种内容并行生成。"
     )
 
+    qa_question = ""
+    if "Q&A" in query_options:
+        qa_question = st.text_input(
+            "Q&A 问题 (可选)",
+            help="填写后 Q&A 只回答这个问题，并且只把文字稿中与问题最相关的段落发送给 DeepSeek；留空则生成问答对。"
+        )
+
     st.markdown("---")
     keep_temp_files = st.checkbox(
         "保留中间文件", 
         value=False, 
-        help="勾选后将保留上传的临时文件和语音转文字生成的 `source_transcript.txt`。"
+        help="勾选后将保留本次任务工作目录中的上传文件和语音转文字生成的 `source_transcript.txt`。"
+    )
+    use_generation_cache = st.checkbox(
+        "使用生成缓存",
+        value=True,
+        help="相同文件、相同生成类型与提示词的重复请求将直接回放上次的结果。取消勾选可强制重新生成。"
+    )
+
+    job_priorities = {"高": -1, "普通": 0, "低": 1}
+    job_priority = st.select_slider(
+        "任务优先级",
+        options=list(job_priorities),
+        value="普通",
+        help="同时有多个任务时，优先级高的任务先出队，其语音识别与 DeepSeek 请求也优先获得调用配额。"
     )
 
     st.info("请在上方配置好参数后，上传文件开始处理。")
 
+    # 处理在后台任务队列中执行，刷新页面后可以从这里重新查看进行中或已完成的任务
+    st.markdown("---")
+    st.header("🗂️ 最近任务")
+    status_labels = {"queued": "排队中", "running": "处理中", "succeeded": "已完成", "failed": "失败"}
+    for job in get_job_store().list_jobs(limit=10):
+        input_name = os.path.basename(job["params"]["input_path"])
+        if st.button(f"{status_labels.get(job['status'], job['status'])} · {input_name}", key=f"job_{job['id']}",
+                     help=f"任务 ID: {job['id']}", use_container_width=True):
+            st.query_params["job"] = job["id"]
+
+# 启动（或复用）本进程内的后台工作线程
+get_worker_pool()
+
 video_exts = {'mp4', 'mov','mpeg','webm'}
 audio_exts = {'mp3','m4a','wav','amr','mpga'}
 doc_exts = {'txt','md','mdx','markdown','pdf','html','xlsx','xls','doc','docx','csv','eml','msg','pptx','ppt','xml','epub'}
@@ -47,51 +84,83 @@ uploaded_file = st.file_uploader(
 )
 
 if uploaded_file is not None:
-    if st.button("开始生成", use_container_width=True, type="primary"):
-        
-        st.markdown("---")
-        st.subheader("处理进度")
-        
-        main_progress_bar = st.progress(0)
-        main_progress_text = st.empty()
-        sub_progress_bar = st.progress(0)
-        sub_progress_text = st.empty()
-
-        st.markdown("---")
-
-        processing_headers = {
-            "Notes": "正在生成笔记 (实时输出中...)",
-            "Q&A": "正在进行 Q&A (实时输出中...)",
-            "Quiz": "正在生成测验 (实时输出中...)"
-        }
-        st.subheader(processing_headers.get(query_option, "正在处理..."))
-        st.info(f"当前生成模式: **{query_option}**")
-        
-        llm_output_container = st.empty()
-        full_llm_response = ""
-        
-        final_result_path = None
-        processing_has_failed = False
-
-        temp_dir = "temp_uploads"
-        if not os.path.exists(temp_dir):
-            os.makedirs(temp_dir)
-        temp_file_path = os.path.join(temp_dir, uploaded_file.name)
-        with open(temp_file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-
-        # 使用新的参数调用处理函数
-        generator = main_process_generator(
-            temp_file_path, 
-            DOUBAO_APP_ID, 
-            DOUBAO_TOKEN, 
-            DEEPSEEK_API_KEY,  # 使用 DeepSeek API 密钥
-            output_filename, 
-            query_option
+    if st.button("开始生成", use_container_width=True, type="primary", disabled=not query_options):
+        # 每次处理使用独立的工作目录，并发的任务之间不会覆盖或删除彼此的文件
+        try:
+            workspace = JobWorkspace.create(cleanup="never" if keep_temp_files else WORKSPACE_CLEANUP)
+        except WorkspaceQuotaError as e:
+            st.error(str(e))
+            st.stop()
+        # 上传内容按块写入按内容寻址的存储（边写边计算哈希），再链接到工作目录；相同文件不会重复保存，
+        # 其转录结果也会直接从缓存复用
+        temp_file_path = workspace.file_path(uploaded_file.name)
+        upload_store = get_upload_store()
+        uploaded_file.seek(0)
+        _, _, reused_upload = upload_store.save_stream(uploaded_file, uploaded_file.name, temp_file_path)
+        if reused_upload:
+            st.info("检测到之前上传过相同的文件，已复用已保存的副本与处理结果。")
+
+        # 提交到后台任务队列；任务 ID 写入地址栏，刷新页面后仍可重新接上进度
+        # 生成结果写入 OUTPUT_DIR/<任务ID>/，工作目录只存放中间文件，清理时不会删除结果
+        job_id = submit_job(
+            workspace,
+            temp_file_path,
+            os.path.join(OUTPUT_DIR, workspace.job_id, os.path.basename(output_filename)),
+            query_options,
+            use_cache=use_generation_cache,
+            priority=job_priorities[job_priority],
+            question=qa_question
         )
-        
-        for event_type, value, *rest in generator:
-            text = rest[0] if rest else ""
+        st.query_params["job"] = job_id
+
+def render_job(job_id: str):
+    """轮询任务事件并渲染进度与生成结果；从第一个事件开始重放，因此重新打开页面也能看到完整输出。"""
+    store = get_job_store()
+    job = store.get(job_id)
+    if job is None:
+        st.warning(f"找不到任务 {job_id}")
+        return
+    query_options = job["params"]["queries"]
+
+    st.markdown("---")
+    st.subheader("处理进度")
+    st.caption(f"任务 ID: `{job_id}`（刷新页面不会中断处理）")
+    
+    main_progress_bar = st.progress(0)
+    main_progress_text = st.empty()
+    sub_progress_bar = st.progress(0)
+    sub_progress_text = st.empty()
+
+    st.markdown("---")
+
+    processing_headers = {
+        "Notes": "正在生成笔记 (实时输出中...)",
+        "Q&A": "正在进行 Q&A (实时输出中...)",
+        "Quiz": "正在生成测验 (实时输出中...)"
+    }
+    st.info(f"当前生成模式: **{', '.join(query_options)}**")
+
+    # 每种生成类型一列，并排实时输出；增量按时间或字数合并后渲染，已完成的段落不再重绘
+    llm_renderers = {}
+    for column, mode in zip(st.columns(len(query_options)), query_options):
+        with column:
+            st.subheader(processing_headers.get(mode, "正在处理..."))
+            llm_renderers[mode] = IncrementalMarkdownRenderer(
+                st.container(), STREAM_RENDER_INTERVAL_SECONDS, STREAM_RENDER_MAX_PENDING_CHARS)
+    
+    final_result_paths = {}
+    metrics_table = None
+    processing_has_failed = False
+    last_seq = 0
+
+    while True:
+        # 先读状态再读事件：任务结束前所有事件都已写入，读到结束状态后的这一轮事件就是最后一批
+        job = store.get(job_id)
+        if job["status"] == JOB_QUEUED:
+            main_progress_text.info(f"排队中，前面还有 {store.queue_position(job_id)} 个任务...")
+
+        for seq, event_type, value, text in store.events_since(job_id, last_seq):
+            last_seq = seq
 
             if event_type == "progress":
                 main_progress_bar.progress(float(value))
@@ -101,55 +170,79 @@ if uploaded_file is not None:
                 sub_progress_text.text(text)
             
             elif event_type == "llm_chunk":
-                full_llm_response += value
-                llm_output_container.markdown(full_llm_response + " ▌")
+                llm_renderers[text].feed(value)
+
+            elif event_type == "mode_done":
+                mode = text
+                llm_renderers[mode].finish()
+                final_result_paths[mode] = value
             
+            elif event_type == "metrics":
+                metrics_table = text
+
             elif event_type == "persistent_error":
                 st.error(f"处理失败: {text}")
                 main_progress_text.error("一个关键步骤在多次重试后仍然失败，已停止处理。")
-                llm_output_container.error(f"**错误详情:**\n\n{text}")
-                if st.button("🔄 重新开始"):
-                    st.experimental_rerun()
+                for renderer in llm_renderers.values():
+                    renderer.error(f"**错误详情:**\n\n{text}")
                 processing_has_failed = True
-                break
             
             elif event_type == "error":
                 st.error(text)
-                llm_output_container.error(text)
+                for renderer in llm_renderers.values():
+                    renderer.error(text)
                 processing_has_failed = True
-                break
 
             elif event_type == "done":
                 main_progress_bar.progress(1.0)
                 sub_progress_bar.empty()
                 sub_progress_text.empty()
-                llm_output_container.markdown(full_llm_response)
+                for renderer in llm_renderers.values():
+                    renderer.finish()
                 st.success(text)
-                final_result_path = value
-        
-        if final_result_path and os.path.exists(final_result_path) and not processing_has_failed:
+                final_result_paths = value if isinstance(value, dict) else {query_options[0]: value}
+
+        if job["status"] in TERMINAL_STATUSES:
+            break
+        # 本轮中因节流尚未渲染的增量在等待下一轮之前渲染出来
+        for renderer in llm_renderers.values():
+            renderer.flush()
+        time.sleep(JOB_POLL_SECONDS)
+    
+    if metrics_table:
+        with st.expander("⏱️ 各环节耗时"):
+            st.markdown(metrics_table)
+
+    # 下载内容优先读取任务记录中的结果文件（保存在 OUTPUT_DIR 中，不随工作目录清理），
+    # 文件被手动删除时退回任务事件中的生成文本
+    if job["outputs"]:
+        final_result_paths = job["outputs"] if isinstance(job["outputs"], dict) else {query_options[0]: job["outputs"]}
+    if not processing_has_failed:
+        for mode, final_result_path in final_result_paths.items():
+            try:
+                with open(final_result_path, 'r', encoding='utf-8') as f:
+                    result_text = f.read()
+            except OSError:
+                result_text = llm_renderers[mode].text
             st.download_button(
-                label=f"下载结果 ({os.path.basename(final_result_path)})",
-                data=full_llm_response,
+                label=f"下载{mode}结果 ({os.path.basename(final_result_path)})",
+                data=result_text,
                 file_name=os.path.basename(final_result_path),
                 mime="text/markdown",
-                use_container_width=True
+                use_container_width=True,
+                key=f"download_{mode}"
             )
-        
-        if not keep_temp_files:
-            # 1. 清理上传的临时文件
-            try:
-                if os.path.exists(temp_file_path):
-                    os.remove(temp_file_path)
-            except OSError as e:
-                st.warning(f"无法自动删除临时上传文件 '{temp_file_path}': {e}")
-
-            # 2. 清理生成的文字稿文件
-            transcript_path = "source_transcript.txt"
-            try:
-                if os.path.exists(transcript_path):
-                    os.remove(transcript_path)
-            except OSError as e:
-                st.warning(f"无法自动删除文字稿文件 '{transcript_path}': {e}")
-        else:
-            st.info("已根据您的设置，保留了中间文件。")
\ No newline at end of file
+    
+    # 失败的任务可以在原工作目录中继续，已完成的音频块与生成结果不会重做
+    if job["status"] == JOB_FAILED and st.button("🔄 从检查点继续", key=f"resume_{job_id}"):
+        try:
+            resume_job(job_id)
+            st.rerun()
+        except ValueError as e:
+            st.error(str(e))
+
+    if job["params"]["cleanup"] == "never":
+        st.info(f"已根据您的设置，保留了中间文件: `{os.path.join(job['params']['workspace_root'], job_id)}`")
+
+if "job" in st.query_params:
+    render_job(st.query_params["job"])
@@ -0,0 +1,183 @@
+# bench_asr_upload.py
+# 语音识别提交请求的内存基准测试：同时提交多个音频块到本地模拟服务（见 mock_servers.py），
+# 比较各上传格式下每个在途音频块的峰值内存（RSS）增量、请求体大小与总耗时。
+#   legacy - 改为流式上传之前的做法：整块读入 WAV，Base64 编码后放进字典再 json.dumps，一次性发送
+#   wav    - 未压缩 WAV，请求体流式编码发送
+#   ogg    - Opus 编码 (ASR_UPLOAD_BITRATE)，请求体流式编码发送
+#   mp3    - MP3 编码 (ASR_UPLOAD_BITRATE)，请求体流式编码发送
+#
+# 用法 (在项目根目录运行):
+#   python benchmarks/bench_asr_upload.py --chunks 10 --chunk-seconds 600
+#   python benchmarks/bench_asr_upload.py --formats legacy ogg --bitrate 24k
+#
+# 每种格式在独立的子进程中运行（使用空的缓存）。子进程会从父进程继承 ru_maxrss，
+# 因此峰值 RSS 由后台线程定期读取 /proc/self/statm 采样得到（非 Linux 系统退回 ru_maxrss）。
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from mock_servers import MockDoubaoServer
+from bench_pipeline import _peak_rss_mb
+
+UPLOAD_FORMATS = ["legacy", "wav", "ogg", "mp3"]
+
+def _current_rss_mb() -> float:
+    """当前进程的 RSS，单位 MB；读取不到 /proc/self/statm 时返回峰值 RSS。"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError):
+        return _peak_rss_mb()
+
+class RssSampler:
+    """在后台线程中每隔 interval 秒采样一次 RSS，记录最大值。"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak_mb = _current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, _current_rss_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+def generate_asr_chunks(output_dir: str, count: int, seconds: int) -> list[str]:
+    """生成 count 个内容各不相同（频率不同的正弦波）的 16kHz 单声道 WAV 音频块。"""
+    paths = []
+    for i in range(count):
+        path = os.path.join(output_dir, f"chunk_{i + 1:03d}.wav")
+        subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', f'sine=frequency={220 + 40 * i}:sample_rate=16000:duration={seconds}',
+                        '-ac', '1', '-ar', '16000', '-acodec', 'pcm_s16le', '-y', path], check=True, capture_output=True)
+        paths.append(path)
+    return paths
+
+def run_one(upload_format: str, chunk_paths: list[str]) -> dict:
+    """(子进程中执行) 同时转录所有音频块，返回耗时、峰值 RSS 增量与结果时长是否正确。"""
+    import base64
+    import asyncio
+    from video_processor.transcription_engine import AsyncTranscriptionEngine
+    from video_processor.transcriber import build_submit_payload
+
+    class LegacyUploadEngine(AsyncTranscriptionEngine):
+        """重现改为流式上传之前的请求体构造方式，作为对照。"""
+
+        async def _stream_body(self, upload_path: str, prefix: bytes, suffix: bytes):
+            def build() -> bytes:
+                with open(upload_path, 'rb') as f:
+                    audio_data = f.read()
+                base64_data = base64.b64encode(audio_data).decode('utf-8')
+                return json.dumps(build_submit_payload(base64_data)).encode('utf-8')
+            yield await asyncio.to_thread(build)
+
+    if upload_format == "legacy":
+        engine = LegacyUploadEngine("bench", "bench", upload_format="wav")
+    else:
+        engine = AsyncTranscriptionEngine("bench", "bench", upload_format=upload_format)
+
+    async def transcribe_all():
+        try:
+            return await engine.transcribe_many(chunk_paths)
+        finally:
+            await engine.aclose()
+
+    baseline_mb = _current_rss_mb()
+    started = time.perf_counter()
+    with RssSampler() as sampler:
+        results = asyncio.run(transcribe_all())
+    wall_seconds = time.perf_counter() - started
+    peak_mb = sampler.peak_mb
+    # 模拟服务按收到的音频时长生成话语，最后一条话语的结束时间应与按 WAV 计算的音频块时长一致
+    durations_ok = all(result["utterances"] and abs(result["utterances"][-1]["end_time"] - result["duration_ms"]) <= 1000
+                       for result in results)
+    return {
+        "status": "done",
+        "wall_seconds": wall_seconds,
+        "baseline_rss_mb": baseline_mb,
+        "peak_rss_mb": peak_mb,
+        "rss_per_chunk_mb": (peak_mb - baseline_mb) / len(chunk_paths),
+        "durations_ok": durations_ok,
+    }
+
+def run_scenario(upload_format: str, chunk_paths: list[str], env: dict) -> dict:
+    """在独立子进程中运行一种上传格式，返回其结果记录。"""
+    command = [sys.executable, os.path.abspath(__file__), "--run-one", upload_format, "--chunk-paths", *chunk_paths]
+    completed = subprocess.run(command, cwd=project_root, env=env, capture_output=True, text=True)
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        return {"status": "failed", "error": completed.stderr.strip()[-2000:]}
+    return json.loads(lines[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="语音识别提交请求的内存基准测试（本地模拟语音识别服务）")
+    parser.add_argument('--chunks', type=int, default=10, help="同时在途的音频块数")
+    parser.add_argument('--chunk-seconds', type=int, default=600, help="每个音频块的时长（秒）")
+    parser.add_argument('--formats', nargs='+', default=UPLOAD_FORMATS, choices=UPLOAD_FORMATS, help="要比较的上传方式")
+    parser.add_argument('--bitrate', default="32k", help="压缩格式的码率")
+    parser.add_argument('--block-bytes', type=int, default=192 * 1024, help="流式编码时每次读取的字节数")
+    parser.add_argument('--run-one', metavar='FORMAT', help=argparse.SUPPRESS)
+    parser.add_argument('--chunk-paths', nargs='+', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        # 子进程：处理过程中的日志写到标准错误，标准输出最后一行为结果 JSON
+        original_stdout, sys.stdout = sys.stdout, sys.stderr
+        result = run_one(args.run_one, args.chunk_paths)
+        print(json.dumps(result, ensure_ascii=False), file=original_stdout)
+        return 0
+
+    work_dir = tempfile.mkdtemp(prefix="bench_asr_upload_")
+    asr = MockDoubaoServer(queue_delay=0.5, real_time_factor=0.001)
+    results = {}
+    try:
+        asr.start()
+        chunk_paths = generate_asr_chunks(work_dir, args.chunks, args.chunk_seconds)
+        for upload_format in args.formats:
+            env = {
+                **os.environ,
+                "DOUBAO_ASR_BASE_URL": asr.base_url,
+                "DEEPSEEK_API_KEY": "bench", "DOUBAO_APP_ID": "bench", "DOUBAO_TOKEN": "bench",
+                "CACHE_DIR": os.path.join(work_dir, f"cache_{upload_format}"),
+                "ASR_UPLOAD_BITRATE": args.bitrate,
+                "ASR_UPLOAD_BLOCK_BYTES": str(args.block_bytes),
+                # 所有音频块同时提交，测量的是全部在途时的内存
+                "DOUBAO_REQUESTS_PER_SECOND": "1000",
+                "ASR_HEDGE_ENABLED": "false",
+            }
+            bytes_before = sum(asr.submitted_bytes.values())
+            results[upload_format] = run_scenario(upload_format, chunk_paths, env)
+            results[upload_format]["body_mb_per_chunk"] = (sum(asr.submitted_bytes.values()) - bytes_before) / args.chunks / 1024 / 1024
+    finally:
+        asr.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{args.chunks} 个 {args.chunk_seconds} 秒的音频块同时在途:")
+    print(f"{'上传方式':<10}{'请求体/块':>12}{'RSS 增量/块':>14}{'峰值 RSS':>12}{'总耗时':>10}  时长")
+    for upload_format, result in results.items():
+        if result["status"] != "done":
+            print(f"{upload_format:<10}失败 - {result.get('error', '未知错误')}")
+            continue
+        print(f"{upload_format:<10}{result['body_mb_per_chunk']:>10.1f}MB{result['rss_per_chunk_mb']:>12.1f}MB"
+              f"{result['peak_rss_mb']:>10.0f}MB{result['wall_seconds']:>9.2f}s  {'正确' if result['durations_ok'] else '错误'}")
+    return 0 if all(result["status"] == "done" and result["durations_ok"] for result in results.values()) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+# bench_pipeline.py
+# 端到端基准测试：用 ffmpeg 生成合成媒体，把语音识别与 DeepSeek 请求指向本地模拟服务（见 mock_servers.py），
+# 测量 main_process_generator 的各阶段耗时、峰值内存（RSS）与吞吐量，并与记录的基线对比。
+#
+# 用法 (在项目根目录运行):
+#   python benchmarks/bench_pipeline.py --durations 600 3600 --record-baseline
+#   python benchmarks/bench_pipeline.py --durations 600 3600 --check          # 超出基线容差时返回码为 1
+#   python benchmarks/bench_pipeline.py --durations 7200 --video --error-rate 0.05 --queue-delay 3
+#
+# 每个场景在独立的子进程中运行（使用空的缓存与工作目录），峰值 RSS 互不影响；
+# 模拟服务运行在本进程中，其开销不计入被测进程。
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from mock_servers import MockDoubaoServer, MockDeepSeekServer
+from bench_splitter import generate_synthetic_media
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+# 基线中耗时低于该值的环节不参与回归判断，避免噪声造成误报
+MIN_COMPARED_SECONDS = 0.5
+
+def _peak_rss_mb() -> float:
+    """
+    当前进程的峰值 RSS，单位 MB。Linux 上 ru_maxrss 单位为 KB，macOS 上为字节。
+    不统计 ffmpeg 等子进程：fork 出的子进程会继承父进程的峰值，RUSAGE_CHILDREN 的数值并不反映 ffmpeg 本身的占用。
+    """
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+def run_one(media_path: str, modes: list[str]) -> dict:
+    """(子进程中执行) 运行一次完整处理，返回耗时、峰值内存与吞吐量。"""
+    from main import main_process_generator
+    from video_processor.splitter import get_media_duration
+
+    media_seconds = get_media_duration(media_path) or 0.0
+    started = time.perf_counter()
+    stages, stage_name, stage_started = {}, None, started
+    result = {"status": "failed", "media_seconds": media_seconds}
+    generator = main_process_generator(media_path, "bench", "bench", "bench",
+                                       os.path.splitext(media_path)[0], modes, use_cache=False)
+    for event_type, value, *rest in generator:
+        text = rest[0] if rest else ""
+        if event_type == "progress" and text.startswith("步骤"):
+            # "步骤 k/N: 描述" 标志着新阶段的开始
+            now = time.perf_counter()
+            if stage_name is not None:
+                stages[stage_name] = stages.get(stage_name, 0.0) + now - stage_started
+            stage_name, stage_started = text.split(": ", 1)[-1].rstrip("."), now
+        elif event_type == "metrics":
+            result["spans"] = {stage["name"]: stage["total"] for stage in value["stages"]}
+            result["counters"] = value["counters"]
+            result["llm"] = value["llm"]
+        elif event_type in ("persistent_error", "error"):
+            result["error"] = text
+            break
+        elif event_type == "done":
+            result["status"] = "done"
+
+    now = time.perf_counter()
+    if stage_name is not None:
+        stages[stage_name] = stages.get(stage_name, 0.0) + now - stage_started
+    wall_seconds = now - started
+    result.update({
+        "wall_seconds": wall_seconds,
+        "stages": stages,
+        "peak_rss_mb": _peak_rss_mb(),
+        "realtime_factor": media_seconds / wall_seconds if wall_seconds > 0 else 0.0,
+    })
+    return result
+
+def run_scenario(media_path: str, modes: list[str], env: dict) -> dict:
+    """在独立子进程中运行一个场景，返回其结果记录。"""
+    command = [sys.executable, os.path.abspath(__file__), "--run-one", media_path, "--modes", *modes]
+    completed = subprocess.run(command, cwd=project_root, env=env, capture_output=True, text=True)
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        return {"status": "failed", "error": completed.stderr.strip()[-2000:]}
+    return json.loads(lines[-1])
+
+def compare_with_baseline(name: str, result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """与基线对比总耗时、各环节累计耗时与峰值内存，返回超出容差的项目说明。"""
+    regressions = []
+
+    def check(label: str, current: float, expected: float, unit: str):
+        if current > expected * (1 + tolerance):
+            regressions.append(f"{name}: {label} {current:.2f}{unit}，基线 {expected:.2f}{unit} (+{current / expected - 1:.0%})")
+
+    check("总耗时", result["wall_seconds"], baseline["wall_seconds"], "s")
+    check("峰值 RSS", result["peak_rss_mb"], baseline["peak_rss_mb"], "MB")
+    for span_name, expected in baseline.get("spans", {}).items():
+        if expected >= MIN_COMPARED_SECONDS and span_name in result.get("spans", {}):
+            check(span_name, result["spans"][span_name], expected, "s")
+    return regressions
+
+def print_result(name: str, result: dict):
+    if result["status"] != "done":
+        print(f"{name}: 失败 - {result.get('error', '未知错误')}")
+        return
+    print(f"\n=== {name} ===")
+    print(f"总耗时 {result['wall_seconds']:.2f} 秒, 媒体 {result['media_seconds']:.0f} 秒 "
+          f"({result['realtime_factor']:.1f}x 实时), 峰值 RSS {result['peak_rss_mb']:.0f} MB")
+    for stage_name, seconds in result["stages"].items():
+        print(f"  阶段 {stage_name:<24} {seconds:>8.2f} s")
+    for span_name, seconds in sorted(result.get("spans", {}).items(), key=lambda item: -item[1]):
+        print(f"  环节 {span_name:<24} {seconds:>8.2f} s (累计)")
+    llm = result.get("llm", {})
+    if llm.get("requests"):
+        print(f"  DeepSeek: 首个 token 平均 {llm['mean_first_token_seconds']:.2f} 秒, {llm['tokens_per_second']:.0f} tokens/秒")
+    if result.get("counters"):
+        print("  计数: " + ", ".join(f"{key}={value:g}" for key, value in sorted(result["counters"].items())))
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端基准测试（本地模拟语音识别与 DeepSeek 服务）")
+    parser.add_argument('--durations', type=int, nargs='+', default=[600, 3600], help="合成媒体时长（秒）")
+    parser.add_argument('--video', action='store_true', help="生成带视频轨的合成媒体")
+    parser.add_argument('--modes', nargs='+', default=["Notes"], help="生成内容类型")
+    parser.add_argument('--queue-delay', type=float, default=1.0, help="模拟识别任务的排队时间（秒）")
+    parser.add_argument('--real-time-factor', type=float, default=0.01, help="模拟识别耗时与音频时长之比")
+    parser.add_argument('--first-token-delay', type=float, default=0.5, help="模拟 DeepSeek 首个 token 的延迟（秒）")
+    parser.add_argument('--tokens-per-second', type=float, default=200.0, help="模拟 DeepSeek 输出速度")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="模拟服务返回 429 的概率")
+    parser.add_argument('--seed', type=int, default=0, help="模拟服务错误注入的随机种子")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help="基线文件路径")
+    parser.add_argument('--record-baseline', action='store_true', help="把本次结果写入基线文件")
+    parser.add_argument('--check', action='store_true', help="与基线对比，超出容差时返回码为 1")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="允许相对基线变慢/变大的比例")
+    parser.add_argument('--run-one', metavar='MEDIA', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        # 子进程：处理过程中的日志写到标准错误，标准输出最后一行为结果 JSON
+        original_stdout, sys.stdout = sys.stdout, sys.stderr
+        result = run_one(args.run_one, args.modes)
+        print(json.dumps(result, ensure_ascii=False), file=original_stdout)
+        return 0
+
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    asr = MockDoubaoServer(queue_delay=args.queue_delay, real_time_factor=args.real_time_factor,
+                           error_rate=args.error_rate, seed=args.seed)
+    llm = MockDeepSeekServer(first_token_delay=args.first_token_delay, tokens_per_second=args.tokens_per_second,
+                             error_rate=args.error_rate, seed=args.seed)
+    results = {}
+    try:
+        asr.start()
+        llm.start()
+        for duration in args.durations:
+            name = f"{duration}s-{'video' if args.video else 'audio'}-{'+'.join(args.modes)}"
+            media_path = os.path.join(work_dir, f"synthetic_{duration}.{'mp4' if args.video else 'm4a'}")
+            generate_synthetic_media(media_path, duration, args.video)
+
+            run_dir = os.path.join(work_dir, name)
+            env = {
+                **os.environ,
+                "DOUBAO_ASR_BASE_URL": asr.base_url,
+                "DEEPSEEK_BASE_URL": f"{llm.base_url}/v1",
+                "DEEPSEEK_API_KEY": "bench", "DOUBAO_APP_ID": "bench", "DOUBAO_TOKEN": "bench",
+                "CACHE_DIR": os.path.join(run_dir, "cache"),
+                "WORKSPACE_ROOT": os.path.join(run_dir, "workspaces"),
+                "METRICS_DIR": "",
+                "LLM_CACHE_ENABLED": "false",
+            }
+            results[name] = run_scenario(media_path, args.modes, env)
+            print_result(name, results[name])
+            os.remove(media_path)
+    finally:
+        asr.stop()
+        llm.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n模拟服务: 语音识别 {asr.requests} 次请求 ({asr.errors} 次 429), DeepSeek {llm.requests} 次请求 ({llm.errors} 次 429)")
+    succeeded = {name: result for name, result in results.items() if result["status"] == "done"}
+    exit_code = 0 if len(succeeded) == len(results) else 1
+
+    if args.check:
+        try:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baselines = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"无法读取基线文件 {args.baseline}: {e}")
+            return 1
+        regressions = []
+        for name, result in succeeded.items():
+            if name in baselines:
+                regressions += compare_with_baseline(name, result, baselines[name], args.tolerance)
+            else:
+                print(f"{name}: 基线中没有该场景，跳过对比")
+        for line in regressions:
+            print(f"⚠️ 回归: {line}")
+        if regressions:
+            exit_code = 1
+        else:
+            print(f"✅ 所有场景均在基线的 {args.tolerance:.0%} 容差内")
+
+    if args.record_baseline and succeeded:
+        baselines = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baselines = json.load(f)
+        for name, result in succeeded.items():
+            baselines[name] = {key: result[key] for key in ("wall_seconds", "peak_rss_mb", "stages", "spans") if key in result}
+            baselines[name]["recorded_at"] = time.strftime('%Y-%m-%d %H:%M:%S')
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=2)
+        print(f"已记录基线: {args.baseline}")
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+# bench_splitter.py
+# 对比单次解码切分 (single_pass) 与逐块 ffmpeg 切分 (per_chunk) 的耗时。
+#
+# 用法 (在项目根目录运行):
+#   python benchmarks/bench_splitter.py --durations 1800 3600 7200 --video
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from video_processor.splitter import (
+    split_media_to_audio_chunks_generator,
+    SPLIT_MODE_SINGLE_PASS,
+    SPLIT_MODE_PER_CHUNK,
+)
+
+def generate_synthetic_media(output_path: str, duration: int, with_video: bool = False):
+    """使用 ffmpeg 的 lavfi 源生成指定时长的合成媒体文件（正弦音频，可选低分辨率测试视频）。"""
+    command = ['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=44100:duration={duration}']
+    if with_video:
+        command += ['-f', 'lavfi', '-i', f'testsrc=size=320x240:rate=15:duration={duration}',
+                    '-c:v', 'libx264', '-preset', 'ultrafast']
+    command += ['-c:a', 'aac', '-b:a', '96k', '-shortest', '-y', output_path]
+    subprocess.run(command, check=True, capture_output=True)
+
+def run_split(media_path: str, output_dir: str, chunk_duration: int, mode: str) -> tuple[float, int]:
+    """运行一次切分，返回 (耗时秒数, 音频块数量)。"""
+    shutil.rmtree(output_dir, ignore_errors=True)
+    start = time.perf_counter()
+    chunks = []
+    for event_type, val1, *_ in split_media_to_audio_chunks_generator(media_path, output_dir, chunk_duration, mode=mode):
+        if event_type == 'result':
+            chunks = val1
+        elif event_type == 'error':
+            raise RuntimeError(val1)
+    return time.perf_counter() - start, len(chunks)
+
+def main():
+    parser = argparse.ArgumentParser(description="切分器基准测试：single_pass vs per_chunk")
+    parser.add_argument('--durations', type=int, nargs='+', default=[1800, 3600, 7200], help="合成媒体时长（秒）")
+    parser.add_argument('--chunk-duration', type=int, default=600, help="音频块时长（秒）")
+    parser.add_argument('--video', action='store_true', help="生成带视频轨的合成媒体")
+    parser.add_argument('--repeat', type=int, default=1, help="每种模式重复次数，取最短耗时")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_splitter_")
+    try:
+        print(f"{'时长(s)':>8} | {'模式':>12} | {'块数':>4} | {'耗时(s)':>8}")
+        print("-" * 44)
+        for duration in args.durations:
+            ext = 'mp4' if args.video else 'm4a'
+            media_path = os.path.join(work_dir, f"synthetic_{duration}.{ext}")
+            generate_synthetic_media(media_path, duration, args.video)
+
+            timings = {}
+            for mode in (SPLIT_MODE_PER_CHUNK, SPLIT_MODE_SINGLE_PASS):
+                best, num_chunks = None, 0
+                for _ in range(args.repeat):
+                    elapsed, num_chunks = run_split(media_path, os.path.join(work_dir, f"chunks_{mode}"), args.chunk_duration, mode)
+                    best = elapsed if best is None else min(best, elapsed)
+                timings[mode] = best
+                print(f"{duration:>8} | {mode:>12} | {num_chunks:>4} | {best:>8.2f}")
+
+            speedup = timings[SPLIT_MODE_PER_CHUNK] / max(timings[SPLIT_MODE_SINGLE_PASS], 1e-9)
+            print(f"{'':>8} | {'加速比':>12} | {'':>4} | {speedup:>7.2f}x")
+            os.remove(media_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+# mock_servers.py
+# 基准测试用的本地模拟服务，代替豆包录音文件识别与 DeepSeek 接口：
+#   MockDoubaoServer   - submit / query 两个接口，可配置排队时间、识别速度与错误率
+#   MockDeepSeekServer - OpenAI 兼容的 /v1/chat/completions 流式接口，可配置首 token 延迟、输出速度与错误率
+# 两者都在后台线程中运行，端口为 0 时自动选择空闲端口。
+#
+# 单独运行 (在项目根目录):
+#   python benchmarks/mock_servers.py --asr-port 8765 --llm-port 8766 --queue-delay 2 --error-rate 0.05
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import os
+import json
+import time
+import uuid
+import base64
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 与 video_processor/transcriber.py 中的状态码一致
+STATUS_SUCCESS = "20000000"
+STATUS_PROCESSING = "20000001"
+STATUS_QUEUED = "20000002"
+STATUS_NOT_FOUND = "45000001"
+# 16kHz 单声道 16-bit WAV 每秒音频的字节数，用于从请求体推算音频时长
+WAV_BYTES_PER_SECOND = 16000 * 2
+# 模拟识别结果中每条话语的时长（毫秒）
+UTTERANCE_MS = 5000
+# Ogg Opus 的 granule position 总是以 48kHz 采样数计
+OPUS_GRANULE_RATE = 48000
+
+def audio_duration_seconds(audio: bytes, audio_format: str) -> float:
+    """推算上传音频的时长：WAV 按字节数，Ogg 按最后一页的 granule position，其他格式用 ffprobe。"""
+    if audio_format == "wav":
+        return len(audio) / WAV_BYTES_PER_SECOND
+    if audio_format == "ogg":
+        last_page = audio.rfind(b"OggS")
+        return int.from_bytes(audio[last_page + 6:last_page + 14], "little") / OPUS_GRANULE_RATE if last_page >= 0 else 0.0
+    fd, path = tempfile.mkstemp(suffix=f".{audio_format}")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(audio)
+        completed = subprocess.run(['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+                                    '-of', 'default=noprint_wrappers=1:nokey=1', path], capture_output=True, text=True)
+        return float(completed.stdout.strip() or 0)
+    finally:
+        os.remove(path)
+
+class _MockServer:
+    """在后台线程中运行的 ThreadingHTTPServer，handler 通过 self.server.mock 访问模拟服务的状态。"""
+
+    handler_class = None
+
+    def __init__(self, port: int = 0, error_rate: float = 0.0, seed: int | None = None):
+        self.port = port
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._httpd = None
+        self.requests = 0
+        self.errors = 0
+
+    def should_fail(self) -> bool:
+        """按错误率决定本次请求是否返回限流错误。"""
+        with self._random_lock:
+            self.requests += 1
+            failed = self._random.random() < self.error_rate
+            self.errors += failed
+            return failed
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", self.port), self.handler_class)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name=type(self).__name__, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def send_body(self, status: int, body: bytes, headers: dict | None = None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class _DoubaoHandler(_QuietHandler):
+
+    def do_POST(self):
+        mock = self.server.mock
+        body = self.read_body()
+        task_id = self.headers.get("X-Api-Request-Id", "")
+        if mock.should_fail():
+            self.send_body(429, b"{}", {"Retry-After": str(mock.retry_after), "X-Api-Message": "rate limited"})
+            return
+        if self.path.endswith("/submit"):
+            mock.submit(task_id, body)
+            self.send_body(200, b"{}", {"X-Api-Status-Code": STATUS_SUCCESS, "X-Tt-Logid": uuid.uuid4().hex})
+        elif self.path.endswith("/query"):
+            status, result = mock.query(task_id)
+            self.send_body(200, json.dumps(result, ensure_ascii=False).encode("utf-8"), {"X-Api-Status-Code": status})
+        else:
+            self.send_body(404, b"{}")
+
+class MockDoubaoServer(_MockServer):
+    """
+    模拟录音文件识别接口：任务提交后先排队 queue_delay 秒，再按 音频时长 × real_time_factor 秒“识别”，
+    之后查询返回按音频时长生成的话语列表。error_rate 为任一请求返回 HTTP 429 的概率。
+    """
+
+    handler_class = _DoubaoHandler
+
+    def __init__(self, port: int = 0, queue_delay: float = 1.0, real_time_factor: float = 0.01,
+                 error_rate: float = 0.0, retry_after: float = 0.5, seed: int | None = None):
+        super().__init__(port, error_rate, seed)
+        self.queue_delay = queue_delay
+        self.real_time_factor = real_time_factor
+        self.retry_after = retry_after
+        self._tasks = {}
+        self._tasks_lock = threading.Lock()
+        # 收到的提交请求体总字节数（按上传格式统计）
+        self.submitted_bytes = {}
+
+    def submit(self, task_id: str, body: bytes):
+        try:
+            audio = json.loads(body)["audio"]
+            audio_format = audio.get("format", "wav")
+            audio_seconds = audio_duration_seconds(base64.b64decode(audio["data"]), audio_format)
+        except (ValueError, KeyError, TypeError):
+            audio_format, audio_seconds = "unknown", 0.0
+        with self._tasks_lock:
+            self._tasks[task_id] = (time.monotonic(), audio_seconds)
+            self.submitted_bytes[audio_format] = self.submitted_bytes.get(audio_format, 0) + len(body)
+
+    def query(self, task_id: str) -> tuple[str, dict]:
+        with self._tasks_lock:
+            task = self._tasks.get(task_id)
+        if task is None:
+            return STATUS_NOT_FOUND, {}
+        submitted_at, audio_seconds = task
+        elapsed = time.monotonic() - submitted_at
+        if elapsed < self.queue_delay:
+            return STATUS_QUEUED, {}
+        if elapsed < self.queue_delay + audio_seconds * self.real_time_factor:
+            return STATUS_PROCESSING, {}
+        utterances = [
+            {"text": f"第 {start // 1000} 秒的模拟识别文本。", "start_time": start,
+             "end_time": min(start + UTTERANCE_MS, int(audio_seconds * 1000))}
+            for start in range(0, max(1, int(audio_seconds * 1000)), UTTERANCE_MS)
+        ]
+        return STATUS_SUCCESS, {"result": {"text": "".join(u["text"] for u in utterances), "utterances": utterances}}
+
+class _DeepSeekHandler(_QuietHandler):
+
+    def do_POST(self):
+        mock = self.server.mock
+        request = json.loads(self.read_body() or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self.send_body(404, b"{}")
+            return
+        if mock.should_fail():
+            error = {"error": {"message": "Rate limit reached", "type": "rate_limit_error", "code": "rate_limit"}}
+            self.send_body(429, json.dumps(error).encode("utf-8"), {"Retry-After": str(mock.retry_after)})
+            return
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = request.get("model", "deepseek-chat")
+        num_tokens = min(mock.output_tokens, request.get("max_tokens") or mock.output_tokens)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(payload: str):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta: dict, finish_reason=None) -> str:
+            return json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }, ensure_ascii=False)
+
+        time.sleep(mock.first_token_delay)
+        send_event(chunk({"role": "assistant", "content": ""}))
+        # 每个事件约 TOKENS_PER_EVENT 个 token，按配置的输出速度发送
+        interval = mock.TOKENS_PER_EVENT / mock.tokens_per_second if mock.tokens_per_second > 0 else 0.0
+        for i in range(0, num_tokens, mock.TOKENS_PER_EVENT):
+            send_event(chunk({"content": f"模拟输出第{i // mock.TOKENS_PER_EVENT + 1}段。"}))
+            if interval:
+                time.sleep(interval)
+        send_event(chunk({}, "stop"))
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+class MockDeepSeekServer(_MockServer):
+    """
+    模拟 OpenAI 兼容的流式对话接口：等待 first_token_delay 秒后以 tokens_per_second 的速度输出约 output_tokens 个 token。
+    error_rate 为请求返回 HTTP 429 的概率。base_url 需加上 /v1 作为 OpenAI 客户端的 base_url。
+    """
+
+    handler_class = _DeepSeekHandler
+    # 每个流式事件的文本（“模拟输出第N段。”）约 5 个 token
+    TOKENS_PER_EVENT = 5
+
+    def __init__(self, port: int = 0, first_token_delay: float = 0.5, tokens_per_second: float = 200.0,
+                 output_tokens: int = 800, error_rate: float = 0.0, retry_after: float = 0.5, seed: int | None = None):
+        super().__init__(port, error_rate, seed)
+        self.first_token_delay = first_token_delay
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.retry_after = retry_after
+
+def main():
+    parser = argparse.ArgumentParser(description="启动本地模拟的豆包语音识别与 DeepSeek 服务")
+    parser.add_argument('--asr-port', type=int, default=8765)
+    parser.add_argument('--llm-port', type=int, default=8766)
+    parser.add_argument('--queue-delay', type=float, default=1.0, help="识别任务的排队时间（秒）")
+    parser.add_argument('--real-time-factor', type=float, default=0.01, help="识别耗时与音频时长之比")
+    parser.add_argument('--first-token-delay', type=float, default=0.5, help="DeepSeek 首个 token 的延迟（秒）")
+    parser.add_argument('--tokens-per-second', type=float, default=200.0, help="DeepSeek 输出速度")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="请求返回 429 的概率")
+    args = parser.parse_args()
+
+    asr = MockDoubaoServer(args.asr_port, args.queue_delay, args.real_time_factor, args.error_rate).start()
+    llm = MockDeepSeekServer(args.llm_port, args.first_token_delay, args.tokens_per_second, error_rate=args.error_rate).start()
+    print(f"DOUBAO_ASR_BASE_URL={asr.base_url}")
+    print(f"DEEPSEEK_BASE_URL={llm.base_url}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        asr.stop()
+        llm.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# cache.py
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import metrics
+
+def _update_key_digest(digest, parts):
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        elif not isinstance(part, (bytes, bytearray, memoryview)):
+            part = str(part).encode('utf-8')
+        # 写入长度前缀，避免 ("ab", "c") 与 ("a", "bc") 得到相同的键
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+
+def make_cache_key(*parts) -> str:
+    """将若干部分（字符串或字节）拼接后计算 SHA-256，作为缓存键。"""
+    digest = hashlib.sha256()
+    _update_key_digest(digest, parts)
+    return digest.hexdigest()
+
+def make_file_cache_key(file_path: str, *parts, block_size: int = 1024 * 1024) -> str:
+    """与 make_cache_key(*parts, <文件内容>) 相同的缓存键，但按块读取文件，不把整个文件读入内存。"""
+    digest = hashlib.sha256()
+    _update_key_digest(digest, parts)
+    digest.update(os.path.getsize(file_path).to_bytes(8, 'big'))
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class DiskCache:
+    """
+    基于目录的持久化 JSON 缓存，按总字节数做 LRU 淘汰。
+
+    - 每个条目是 `<cache_dir>/<key[:2]>/<key>.json` 一个文件，写入时先写临时文件再 os.replace，
+      因此并发读写（包括多进程）不会读到半截内容。
+    - 命中时刷新文件的 mtime，淘汰时按 mtime 从旧到新删除，直到总大小不超过 max_bytes。
+    - 进程内的索引与计数器由一把锁保护，可在线程池中安全共享。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, name: str = "cache"):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._sizes = None  # key -> 文件大小，首次使用时扫描目录建立
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _load_index(self):
+        """(需持有锁) 扫描缓存目录，建立条目大小索引。"""
+        if self._sizes is not None:
+            return
+        self._sizes = {}
+        if not os.path.isdir(self.cache_dir):
+            return
+        for root, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                if filename.endswith('.json'):
+                    try:
+                        self._sizes[filename[:-5]] = os.path.getsize(os.path.join(root, filename))
+                    except OSError:
+                        continue
+
+    def get(self, key: str):
+        """读取条目，未命中或条目损坏时返回 None。"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+            os.utime(path)  # 刷新 LRU 时间戳
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            metrics.incr("cache_misses", cache=self.name)
+            return None
+        with self._lock:
+            self.hits += 1
+        metrics.incr("cache_hits", cache=self.name)
+        return value
+
+    def contains(self, key: str) -> bool:
+        """判断条目是否存在（不计入命中/未命中统计）。"""
+        return os.path.exists(self._path(key))
+
+    def set(self, key: str, value):
+        """写入条目，并在超出容量时淘汰最久未使用的条目。写入失败只打印警告，不影响主流程。"""
+        path = self._path(key)
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"警告：写入{self.name}缓存失败: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            self._load_index()
+            self._sizes[key] = size
+            if sum(self._sizes.values()) > self.max_bytes:
+                self._evict()
+
+    def delete(self, key: str):
+        """删除单个条目。"""
+        with self._lock:
+            self._load_index()
+            self._sizes.pop(key, None)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _evict(self):
+        """(需持有锁) 按 mtime 从旧到新删除条目，直到总大小不超过 max_bytes。"""
+        entries = []
+        for key in self._sizes:
+            try:
+                entries.append((os.path.getmtime(self._path(key)), key))
+            except OSError:
+                entries.append((0, key))
+        entries.sort()
+
+        total = sum(self._sizes.values())
+        for _, key in entries:
+            if total <= self.max_bytes:
+                break
+            total -= self._sizes.pop(key)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        """返回命中/未命中计数与当前占用。"""
+        with self._lock:
+            self._load_index()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._sizes),
+                "bytes": sum(self._sizes.values()),
+            }
@@ -0,0 +1,74 @@
+# checkpoint.py
+# 任务检查点：记录已完成的阶段与每个音频块的转录结果，失败后重试或按任务 ID 继续时只重做缺失的部分。
+import os
+import json
+import tempfile
+import metrics
+
+class JobCheckpoint:
+    """
+    保存在任务工作目录 `<workspace>/checkpoints/` 下的检查点：
+    - stage_<名称>.json：已完成阶段的记录（如切分结果、文字稿、各生成类型的输出）；
+    - chunk_<序号>.json：单个音频块的转录结果（文本、带时间戳的话语与时长）。
+    每个文件先写临时文件再 os.replace，进程中途退出也不会留下半截内容。
+    """
+
+    def __init__(self, workspace_path: str):
+        self.path = os.path.join(workspace_path, "checkpoints")
+
+    def _write_atomic(self, filename: str, content: str):
+        """写入检查点文件。写入失败只打印警告：检查点缺失只会让重试多做一些工作，不影响本次处理。"""
+        tmp_path = None
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with metrics.span("file_write", file=filename, bytes=len(content)):
+                fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                os.replace(tmp_path, os.path.join(self.path, filename))
+        except OSError as e:
+            print(f"警告：写入检查点 {filename} 失败: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def save_stage(self, name: str, data: dict):
+        """记录一个阶段已完成及其结果。"""
+        self._write_atomic(f"stage_{name}.json", json.dumps(data, ensure_ascii=False))
+
+    def load_stage(self, name: str) -> dict | None:
+        """读取已完成阶段的记录；阶段未完成或记录损坏时返回 None。"""
+        try:
+            with open(os.path.join(self.path, f"stage_{name}.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_chunk(self, index: int, result: dict):
+        """记录单个音频块（从 0 开始的序号）的转录结果 {"text", "utterances", "duration_ms"}。"""
+        self._write_atomic(f"chunk_{index:05d}.json", json.dumps(result, ensure_ascii=False))
+
+    def load_chunks(self) -> dict[int, dict]:
+        """读取所有已完成音频块的转录结果 {序号: 结果}。"""
+        chunks = {}
+        if not os.path.isdir(self.path):
+            return chunks
+        for filename in os.listdir(self.path):
+            if not (filename.startswith("chunk_") and filename.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.path, filename), 'r', encoding='utf-8') as f:
+                    chunks[int(filename[6:-5])] = json.load(f)
+            except (OSError, ValueError):
+                continue
+        return chunks
+
+    def clear_chunks(self):
+        """删除所有音频块检查点（切分参数变化后旧的序号不再对应）。"""
+        if not os.path.isdir(self.path):
+            return
+        for filename in os.listdir(self.path):
+            if filename.startswith("chunk_"):
+                try:
+                    os.remove(os.path.join(self.path, filename))
+                except OSError:
+                    pass
@@ -0,0 +1,263 @@
+# cli.py
+# 无界面的批量处理入口：处理整个目录或清单中的媒体与文档，适合定时任务（如夜间课程入库）。
+#
+# 用法 (在项目根目录运行):
+#   python cli.py lectures/ --modes Notes Quiz --jobs 4 --max-ffmpeg 4 --max-asr 100 --max-llm 6
+#   python cli.py manifest.txt --progress-log progress.jsonl
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import concurrent.futures
+from main import main_process_generator, output_path_for_mode, transcript_paths_for, SUPPORTED_EXTS, VIDEO_EXTS, AUDIO_EXTS
+from config import DEEPSEEK_API_KEY, DOUBAO_APP_ID, DOUBAO_TOKEN, WORKSPACE_CLEANUP, JOB_DEADLINE_SECONDS
+from workspace import JobWorkspace, WorkspaceQuotaError, CLEANUP_POLICIES
+from limits import set_concurrency_limit
+from scheduler import get_provider_scheduler
+from video_processor.splitter import get_media_duration
+from video_processor.transcription_engine import set_max_in_flight
+
+QUERY_MODES = ("Notes", "Q&A", "Quiz")
+
+def discover_inputs(source: str, recursive: bool = False) -> list[str]:
+    """
+    收集待处理文件：source 为目录时扫描其中支持的文件，否则视为清单文件（每行一个路径，# 开头为注释，
+    相对路径相对于清单所在目录）。目录扫描时会跳过本工具此前写出的结果文件（<文件名>_<模式>.md）与文字稿。
+    """
+    if os.path.isdir(source):
+        candidates = []
+        for root, dirs, files in os.walk(source):
+            candidates.extend(os.path.join(root, name) for name in sorted(files))
+            if not recursive:
+                break
+        candidates = [path for path in candidates if os.path.splitext(path)[1].lower() in SUPPORTED_EXTS]
+        generated = {
+            output_path_for_mode(os.path.splitext(path)[0], mode, True)
+            for path in candidates for mode in QUERY_MODES
+        }
+        generated.update(transcript_paths_for(os.path.splitext(path)[0])[0] for path in candidates)
+        return [path for path in candidates if path not in generated]
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    inputs = []
+    with open(source, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            inputs.append(line if os.path.isabs(line) else os.path.join(base_dir, line))
+    return inputs
+
+class ProgressLog:
+    """线程安全的 JSON Lines 进度输出。"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._lock = threading.Lock()
+
+    def write(self, **record):
+        record = {"ts": round(time.time(), 3), **record}
+        with self._lock:
+            self._stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._stream.flush()
+
+def parse_time_range(value: str) -> tuple[float, float]:
+    """解析 `开始-结束` 形式的时间段，时间可写为秒数、分:秒 或 时:分:秒，例如 `10:00-25:30`。"""
+    def parse_time(text: str) -> float:
+        seconds = 0.0
+        for part in text.strip().split(':'):
+            seconds = seconds * 60 + float(part)
+        return seconds
+    try:
+        start, end = (parse_time(part) for part in value.split('-', 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无法解析时间段: {value}（应为 开始-结束，如 10:00-25:30）")
+    if end <= start:
+        raise argparse.ArgumentTypeError(f"时间段的结束时间必须晚于开始时间: {value}")
+    return start, end
+
+def process_file(input_path: str, modes: list[str], use_cache: bool, progress_log: ProgressLog,
+                 cleanup: str = WORKSPACE_CLEANUP, deadline_seconds: float = JOB_DEADLINE_SECONDS,
+                 question: str = "", time_range: tuple[float, float] | None = None) -> dict:
+    """处理单个文件（中间文件写入独立的任务工作目录），返回包含状态、输出路径与各阶段耗时的结果记录。"""
+    stem = os.path.splitext(input_path)[0]
+    ext = os.path.splitext(input_path)[1].lower()
+    record = {"file": input_path, "status": "failed", "outputs": {}, "stages": {}, "media_seconds": 0.0}
+    if ext in VIDEO_EXTS or ext in AUDIO_EXTS:
+        record["media_seconds"] = get_media_duration(input_path) or 0.0
+
+    started = time.perf_counter()
+    stage_name, stage_started = None, started
+    llm_chunks = 0
+
+    def close_stage(now):
+        if stage_name is not None:
+            record["stages"][stage_name] = record["stages"].get(stage_name, 0.0) + now - stage_started
+
+    try:
+        workspace = JobWorkspace.create(cleanup=cleanup)
+    except (WorkspaceQuotaError, OSError) as e:
+        record["error"], record["seconds"], record["llm_chunks"] = str(e), 0.0, 0
+        progress_log.write(file=input_path, event="finish", status=record["status"], seconds=0.0, text=str(e))
+        return record
+    record["job_id"] = workspace.job_id
+
+    progress_log.write(file=input_path, event="start", job_id=workspace.job_id)
+    generator = main_process_generator(
+        input_path, DOUBAO_APP_ID, DOUBAO_TOKEN, DEEPSEEK_API_KEY, stem, modes,
+        use_cache=use_cache,
+        workspace=workspace,
+        deadline_seconds=deadline_seconds,
+        question=question,
+        time_range=time_range,
+    )
+    try:
+        for event_type, value, *rest in generator:
+            text = rest[0] if rest else ""
+            if event_type == "llm_chunk":
+                llm_chunks += 1
+                continue
+            if event_type == "metrics":
+                record["metrics"] = value
+            if event_type == "progress" and text.startswith("步骤"):
+                # "步骤 k/N: 描述" 标志着新阶段的开始
+                now = time.perf_counter()
+                close_stage(now)
+                stage_name, stage_started = text.split(": ", 1)[-1].rstrip("."), now
+            progress_log.write(file=input_path, event=event_type,
+                               value=value if isinstance(value, (int, float, str, dict)) else str(value), text=text)
+            if event_type in ("persistent_error", "error"):
+                record["error"] = text
+                break
+            if event_type == "done":
+                record["status"] = "done"
+                record["outputs"] = value
+    except Exception as e:
+        record["error"] = str(e)
+        progress_log.write(file=input_path, event="exception", text=str(e))
+    finally:
+        generator.close()
+        workspace.finish(record["status"] == "done")
+
+    now = time.perf_counter()
+    close_stage(now)
+    record["seconds"] = now - started
+    record["llm_chunks"] = llm_chunks
+    progress_log.write(file=input_path, event="finish", status=record["status"], seconds=round(record["seconds"], 3))
+    return record
+
+def print_summary(records: list[dict], wall_seconds: float, stream=sys.stderr):
+    """打印吞吐量与各阶段耗时汇总。"""
+    done = [r for r in records if r["status"] == "done"]
+    media_seconds = sum(r["media_seconds"] for r in done)
+    print("\n===== 批量处理汇总 =====", file=stream)
+    print(f"文件: {len(records)} 个, 成功 {len(done)} 个, 失败 {len(records) - len(done)} 个", file=stream)
+    print(f"总耗时: {wall_seconds:.1f} 秒", file=stream)
+    if wall_seconds > 0:
+        print(f"吞吐量: {len(done) / wall_seconds * 60:.2f} 个文件/分钟, "
+              f"媒体时长 {media_seconds / 3600:.2f} 小时 ({media_seconds / wall_seconds:.1f}x 实时)", file=stream)
+
+    stage_totals = {}
+    for r in records:
+        for name, seconds in r["stages"].items():
+            total, count = stage_totals.get(name, (0.0, 0))
+            stage_totals[name] = (total + seconds, count + 1)
+    if stage_totals:
+        print(f"{'阶段':<24} {'累计(s)':>10} {'平均(s)':>10} {'文件数':>6}", file=stream)
+        for name, (total, count) in stage_totals.items():
+            print(f"{name:<24} {total:>10.1f} {total / count:>10.1f} {count:>6}", file=stream)
+
+    print_metrics_summary([r["metrics"] for r in records if "metrics" in r], stream)
+
+    for r in records:
+        if r["status"] != "done":
+            print(f"失败: {r['file']}: {r.get('error', '未知错误')}", file=stream)
+
+def print_metrics_summary(summaries: list[dict], stream=sys.stderr):
+    """合并各文件的任务指标（见 metrics.py），打印各环节耗时、DeepSeek 输出速度与计数器。"""
+    if not summaries:
+        return
+    merged = {}
+    for summary in summaries:
+        for stage in summary["stages"]:
+            total, count, longest = merged.get(stage["name"], (0.0, 0, 0.0))
+            merged[stage["name"]] = (total + stage["total"], count + stage["count"], max(longest, stage["max"]))
+    print(f"\n{'环节':<24} {'次数':>6} {'累计(s)':>10} {'平均(s)':>10} {'最大(s)':>10}", file=stream)
+    for name, (total, count, longest) in sorted(merged.items(), key=lambda item: -item[1][0]):
+        print(f"{name:<24} {count:>6} {total:>10.2f} {total / count:>10.2f} {longest:>10.2f}", file=stream)
+
+    requests = sum(s["llm"]["requests"] for s in summaries)
+    if requests:
+        tokens = sum(s["llm"]["output_tokens"] for s in summaries)
+        first_token = sum(s["llm"]["mean_first_token_seconds"] * s["llm"]["requests"] for s in summaries) / requests
+        # 各文件的生成速度按 token 数加权平均
+        speed = sum(s["llm"]["tokens_per_second"] * s["llm"]["output_tokens"] for s in summaries) / tokens if tokens else 0.0
+        print(f"DeepSeek: {requests} 次请求, 首个 token 平均 {first_token:.2f} 秒, "
+              f"输出约 {tokens} tokens ({speed:.1f} tokens/秒)", file=stream)
+
+    counters = {}
+    for summary in summaries:
+        for name, value in summary["counters"].items():
+            counters[name] = counters.get(name, 0) + value
+    if counters:
+        print("计数: " + ", ".join(f"{name}={value:g}" for name, value in sorted(counters.items())), file=stream)
+
+def main():
+    parser = argparse.ArgumentParser(description="批量生成笔记 / Q&A / 测验（无界面）")
+    parser.add_argument('source', help="输入目录，或每行一个文件路径的清单文件")
+    parser.add_argument('--modes', nargs='+', default=["Notes"], choices=QUERY_MODES, help="生成内容类型，可多选")
+    parser.add_argument('--recursive', action='store_true', help="递归扫描子目录")
+    parser.add_argument('--jobs', type=int, default=2, help="同时处理的文件数")
+    parser.add_argument('--max-ffmpeg', type=int, default=os.cpu_count(),
+                        help="全局 ffmpeg 进程数上限（切分与上传前的音频编码分别计数）")
+    parser.add_argument('--max-asr', type=int, default=None, help="全局在途语音识别任务上限")
+    parser.add_argument('--max-llm', type=int, default=None, help="全局并发 DeepSeek 调用上限")
+    parser.add_argument('--no-cache', action='store_true', help="不使用生成结果缓存")
+    parser.add_argument('--deadline', type=float, default=JOB_DEADLINE_SECONDS,
+                        help="单个文件的处理时间预算（秒），超时按失败处理，0 表示不限制")
+    parser.add_argument('--cleanup', default=WORKSPACE_CLEANUP, choices=CLEANUP_POLICIES,
+                        help="任务工作目录（上传文件、音频块等中间文件）的清理策略")
+    parser.add_argument('--question', default="",
+                        help="Q&A 模式下要回答的问题：只把文字稿中与问题最相关的段落发送给 DeepSeek")
+    parser.add_argument('--time-range', type=parse_time_range, default=None, metavar='开始-结束',
+                        help="只针对音视频的这一时间段生成内容（如 10:00-25:30），文字稿带时间戳；转录结果来自缓存时不会重新转录")
+    parser.add_argument('--progress-log', default='-', help="JSON Lines 进度输出路径，默认为标准输出")
+    args = parser.parse_args()
+
+    inputs = discover_inputs(args.source, args.recursive)
+    if not inputs:
+        print(f"没有找到可处理的文件: {args.source}", file=sys.stderr)
+        return 1
+
+    set_concurrency_limit("ffmpeg", args.max_ffmpeg)
+    set_concurrency_limit("asr_encode", args.max_ffmpeg)
+    if args.max_llm:
+        get_provider_scheduler("deepseek").configure(max_concurrency=args.max_llm)
+    if args.max_asr:
+        set_max_in_flight(args.max_asr)
+
+    original_stdout = sys.stdout
+    log_stream = original_stdout if args.progress_log == '-' else open(args.progress_log, 'a', encoding='utf-8')
+    progress_log = ProgressLog(log_stream)
+    # main_process_generator 与各模块的 print 日志写到标准错误，避免混入 JSON Lines 输出
+    if log_stream is original_stdout:
+        sys.stdout = sys.stderr
+
+    started = time.perf_counter()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            futures = [executor.submit(process_file, path, args.modes, not args.no_cache, progress_log,
+                                       args.cleanup, args.deadline, args.question, args.time_range) for path in inputs]
+            records = [future.result() for future in futures]
+    finally:
+        sys.stdout = original_stdout
+        if log_stream is not original_stdout:
+            log_stream.close()
+
+    print_summary(records, time.perf_counter() - started)
+    return 0 if all(r["status"] == "done" for r in records) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
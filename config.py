@@ -11,3 +11,97 @@ DOUBAO_TOKEN=os.getenv("DOUBAO_TOKEN")
 
 if not(DEEPSEEK_API_KEY or DOUBAO_TOKEN or DOUBAO_APP_ID):
     raise ValueError("错误：请在 .env 文件中正确设置")
+
+# 服务地址：默认为官方接口，基准测试（benchmarks/bench_pipeline.py）会指向本地的模拟服务
+DOUBAO_ASR_BASE_URL = os.getenv("DOUBAO_ASR_BASE_URL", "https://openspeech.bytedance.com")
+DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1")
+
+# 缓存配置（均可在 .env 中覆盖）
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+ASR_CACHE_MAX_MB = int(os.getenv("ASR_CACHE_MAX_MB", "256"))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "64"))
+LLM_CACHE_TTL_DAYS = float(os.getenv("LLM_CACHE_TTL_DAYS", "30"))
+DOC_CACHE_MAX_MB = int(os.getenv("DOC_CACHE_MAX_MB", "256"))
+RETRIEVAL_CACHE_MAX_MB = int(os.getenv("RETRIEVAL_CACHE_MAX_MB", "64"))
+
+# 文档提取配置：页数较多的 PDF / 幻灯片 / 电子书按 DOC_PAGES_PER_TASK 页一批，分配到 DOC_EXTRACT_WORKERS 个进程并行提取
+DOC_EXTRACT_WORKERS = int(os.getenv("DOC_EXTRACT_WORKERS", str(os.cpu_count() or 4)))
+DOC_PAGES_PER_TASK = int(os.getenv("DOC_PAGES_PER_TASK", "16"))
+
+# 长文本分段生成（map-reduce）配置
+LLM_SINGLE_PASS_MAX_TOKENS = int(os.getenv("LLM_SINGLE_PASS_MAX_TOKENS", "48000"))
+LLM_SECTION_TOKENS = int(os.getenv("LLM_SECTION_TOKENS", "12000"))
+LLM_MAP_WORKERS = int(os.getenv("LLM_MAP_WORKERS", "4"))
+LLM_REDUCE_MAX_TOKENS = int(os.getenv("LLM_REDUCE_MAX_TOKENS", "8000"))
+# DeepSeek 输入价格（元 / 百万 tokens），用于估算文字稿压缩节省的费用
+DEEPSEEK_INPUT_PRICE_PER_MTOKENS = float(os.getenv("DEEPSEEK_INPUT_PRICE_PER_MTOKENS", "2"))
+
+# 异步转录引擎配置
+ASR_MAX_IN_FLIGHT = int(os.getenv("ASR_MAX_IN_FLIGHT", "200"))
+ASR_MAX_CONNECTIONS = int(os.getenv("ASR_MAX_CONNECTIONS", "32"))
+# 上传给语音识别接口的音频格式：mp3 / ogg（Opus 编码，同码率下音质更好但编码较慢）/ wav（不压缩），压缩格式按 ASR_UPLOAD_BITRATE 码率编码；
+# 请求体按 ASR_UPLOAD_BLOCK_BYTES 字节一块边读边做 Base64 编码并流式发送（块大小取 3 的倍数）
+ASR_UPLOAD_FORMAT = os.getenv("ASR_UPLOAD_FORMAT", "mp3").lower()
+ASR_UPLOAD_BITRATE = os.getenv("ASR_UPLOAD_BITRATE", "32k")
+ASR_UPLOAD_BLOCK_BYTES = int(os.getenv("ASR_UPLOAD_BLOCK_BYTES", str(192 * 1024)))
+
+# 按服务商的请求调度配置：每秒请求数（令牌桶，0 表示不限制）与并发任务数，按账号配额设置
+# 豆包的并发数指同时在途（已提交、尚未出结果）的转录任务数，每秒请求数同时限制提交与结果查询
+DOUBAO_REQUESTS_PER_SECOND = float(os.getenv("DOUBAO_REQUESTS_PER_SECOND", "10"))
+DOUBAO_MAX_CONCURRENCY = int(os.getenv("DOUBAO_MAX_CONCURRENCY", str(ASR_MAX_IN_FLIGHT)))
+DEEPSEEK_REQUESTS_PER_SECOND = float(os.getenv("DEEPSEEK_REQUESTS_PER_SECOND", "5"))
+DEEPSEEK_MAX_CONCURRENCY = int(os.getenv("DEEPSEEK_MAX_CONCURRENCY", "16"))
+# 限流后的退避：首次暂停约 RATE_LIMIT_BACKOFF_BASE 秒，连续限流时翻倍，最长 RATE_LIMIT_BACKOFF_MAX 秒
+RATE_LIMIT_BACKOFF_BASE = float(os.getenv("RATE_LIMIT_BACKOFF_BASE", "1"))
+RATE_LIMIT_BACKOFF_MAX = float(os.getenv("RATE_LIMIT_BACKOFF_MAX", "60"))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "6"))
+
+# 音频切分配置
+# SPLIT_PLANNER=fixed 按 CHUNK_DURATION 固定切分；=silence 在 [CHUNK_MIN_SECONDS, CHUNK_MAX_SECONDS]
+# 范围内选择靠近 CHUNK_TARGET_SECONDS 的静音处切分
+SPLIT_PLANNER = os.getenv("SPLIT_PLANNER", "fixed")
+CHUNK_DURATION = int(os.getenv("CHUNK_DURATION", "600"))
+CHUNK_TARGET_SECONDS = float(os.getenv("CHUNK_TARGET_SECONDS", "300"))
+CHUNK_MIN_SECONDS = float(os.getenv("CHUNK_MIN_SECONDS", "180"))
+CHUNK_MAX_SECONDS = float(os.getenv("CHUNK_MAX_SECONDS", "420"))
+
+# 任务工作目录配置：每次处理在 WORKSPACE_ROOT 下使用独立目录
+# WORKSPACE_CLEANUP: always（总是删除）/ on_success（仅成功时删除）/ never（保留）
+# WORKSPACE_QUOTA_MB: 所有工作目录的总磁盘配额，0 表示不限制；超出时先清理已结束的任务，仍不足则拒绝新任务
+# WORKSPACE_RETENTION_HOURS: 保留下来的已结束任务目录在多少小时后被清理
+WORKSPACE_ROOT = os.getenv("WORKSPACE_ROOT", "workspaces")
+WORKSPACE_CLEANUP = os.getenv("WORKSPACE_CLEANUP", "on_success")
+WORKSPACE_QUOTA_MB = float(os.getenv("WORKSPACE_QUOTA_MB", "10240"))
+WORKSPACE_RETENTION_HOURS = float(os.getenv("WORKSPACE_RETENTION_HOURS", "24"))
+# 网页提交的任务的生成结果保存在 OUTPUT_DIR/<任务ID>/ 下，不随工作目录清理
+OUTPUT_DIR = os.getenv("OUTPUT_DIR", "outputs")
+
+# 上传文件存储：上传内容按 UPLOAD_BLOCK_BYTES 大小的块流式写入，按内容哈希保存在 UPLOAD_STORE_DIR 中，
+# 相同文件再次上传时直接复用；总大小超过 UPLOAD_STORE_MAX_MB 时淘汰最久未使用且未被任务引用的文件
+UPLOAD_STORE_DIR = os.getenv("UPLOAD_STORE_DIR", os.path.join(CACHE_DIR, "uploads"))
+UPLOAD_STORE_MAX_MB = float(os.getenv("UPLOAD_STORE_MAX_MB", "20480"))
+UPLOAD_BLOCK_BYTES = int(os.getenv("UPLOAD_BLOCK_BYTES", str(8 * 1024 * 1024)))
+
+# 后台任务队列配置：任务状态与事件保存在 SQLite 数据库中，JOB_WORKERS 为同时执行的任务数
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+# 网页中流式输出的渲染节流：两次渲染至少间隔该秒数，或积累的新文字达到该字数时立即渲染
+STREAM_RENDER_INTERVAL_SECONDS = float(os.getenv("STREAM_RENDER_INTERVAL_SECONDS", "0.2"))
+STREAM_RENDER_MAX_PENDING_CHARS = int(os.getenv("STREAM_RENDER_MAX_PENDING_CHARS", "2000"))
+
+# 对冲请求：某个音频块的转录耗时超过同一任务中已完成音频块耗时的 ASR_HEDGE_PERCENTILE 分位数
+# （且已有至少 ASR_HEDGE_MIN_COMPLETED 个音频块完成、耗时超过 ASR_HEDGE_MIN_SECONDS 秒）时，
+# 再提交一份相同的转录任务，先返回的结果生效
+ASR_HEDGE_ENABLED = os.getenv("ASR_HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+ASR_HEDGE_PERCENTILE = float(os.getenv("ASR_HEDGE_PERCENTILE", "90"))
+ASR_HEDGE_MIN_COMPLETED = int(os.getenv("ASR_HEDGE_MIN_COMPLETED", "3"))
+ASR_HEDGE_MIN_SECONDS = float(os.getenv("ASR_HEDGE_MIN_SECONDS", "10"))
+
+# 单个任务的总时间预算（秒），0 表示不限制；超出预算后不再重试，任务以超时失败结束
+JOB_DEADLINE_SECONDS = float(os.getenv("JOB_DEADLINE_SECONDS", "0"))
+
+# 任务指标导出目录：每个任务结束时写出 <任务ID>.trace.json（Chrome Trace 格式）与 <任务ID>.prom（Prometheus 文本格式），
+# 留空表示不导出（运行结束时的耗时汇总表仍会显示）
+METRICS_DIR = os.getenv("METRICS_DIR", "metrics")
@@ -0,0 +1,376 @@
+# extractor.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import os
+import re
+import email
+import email.policy
+import zipfile
+import posixpath
+import threading
+import concurrent.futures
+import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
+import metrics
+from utils import hash_file
+from cache import DiskCache, make_cache_key
+from config import CACHE_DIR, DOC_CACHE_MAX_MB, DOC_EXTRACT_WORKERS, DOC_PAGES_PER_TASK
+
+# 文档文字提取：按格式选择后端，PDF 逐页、幻灯片逐页、表格逐个工作表、EPUB 逐章节提取。
+# 页数较多时按批次分配到进程池并行提取，并按页序产出；提取结果按文件内容哈希缓存。
+# Office 文档（docx/pptx/xlsx）与 EPUB 本质上是 zip 包中的 XML，直接用标准库解析；PDF 需要 pypdf。
+
+# 提取逻辑变化时修改版本号，使旧的缓存条目失效
+EXTRACTOR_VERSION = "1"
+
+PLAIN_TEXT_EXTS = {'.txt', '.md', '.mdx', '.markdown', '.csv'}
+# 旧版二进制 Office 格式与 Outlook 邮件没有可靠的纯 Python 解析方式，提示用户另存为新格式
+LEGACY_FORMAT_HINTS = {
+    '.doc': '.docx',
+    '.ppt': '.pptx',
+    '.xls': '.xlsx',
+    '.msg': '.eml',
+}
+# 尝试的文本编码顺序：UTF-8（含 BOM）优先，其次是中文 Windows 常见的 GB18030
+TEXT_ENCODINGS = ('utf-8-sig', 'gb18030')
+
+# OOXML / EPUB 中用到的 XML 命名空间
+NS = {
+    'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'p': 'http://schemas.openxmlformats.org/presentationml/2006/main',
+    's': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+    'container': 'urn:oasis:names:tc:opendocument:xmlns:container',
+    'opf': 'http://www.idpf.org/2007/opf',
+}
+
+class DocumentExtractionError(Exception):
+    """文档无法解析（格式不支持、文件损坏或缺少依赖）。"""
+
+# --- 提取结果缓存 ---
+# 以文件内容哈希 + 扩展名 + 提取器版本为键，条目为 {"text", "pages"}。
+_document_cache = DiskCache(os.path.join(CACHE_DIR, "documents"), DOC_CACHE_MAX_MB * 1024 * 1024, name="文档")
+
+def get_document_cache() -> DiskCache:
+    """返回全局共享的文档提取结果缓存（可读取 hits/misses 计数）。"""
+    return _document_cache
+
+def document_cache_key(path: str, ext: str) -> str:
+    return make_cache_key("document", hash_file(path), ext, EXTRACTOR_VERSION)
+
+# 逐页提取是 CPU 密集型工作（PDF 解析尤甚），放到进程池中执行以避开 GIL
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
+
+def _get_extraction_pool() -> concurrent.futures.ProcessPoolExecutor:
+    """惰性创建全局共享的文档提取进程池。"""
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            _extraction_pool = concurrent.futures.ProcessPoolExecutor(max_workers=DOC_EXTRACT_WORKERS)
+        return _extraction_pool
+
+# --- 通用辅助函数 ---
+
+def _decode_text(data: bytes) -> str:
+    for encoding in TEXT_ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode('utf-8', errors='replace')
+
+class _HTMLTextExtractor(HTMLParser):
+    """提取 HTML 中的可见文本，块级元素之间换行，忽略脚本与样式。"""
+
+    BLOCK_TAGS = {'p', 'div', 'br', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'section', 'article', 'blockquote', 'pre'}
+    SKIP_TAGS = {'script', 'style', 'head', 'title'}
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+def html_to_text(html: str) -> str:
+    parser = _HTMLTextExtractor()
+    parser.feed(html)
+    parser.close()
+    return _normalize_whitespace(''.join(parser.parts))
+
+def _normalize_whitespace(text: str) -> str:
+    """合并行内多余空白，最多保留一个空行。"""
+    lines = [re.sub(r'[ \t ]+', ' ', line).strip() for line in text.splitlines()]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+def _paragraph_texts(root: ET.Element, paragraph_tag: str, text_tag: str) -> list[str]:
+    """按文档顺序取出每个段落（w:p / a:p）的文字。"""
+    paragraphs = []
+    for paragraph in root.iter(paragraph_tag):
+        text = ''.join(node.text or '' for node in paragraph.iter(text_tag))
+        if text.strip():
+            paragraphs.append(text)
+    return paragraphs
+
+def _read_relationships(archive: zipfile.ZipFile, part_path: str) -> dict[str, tuple[str, str]]:
+    """读取某个部件的关系文件，返回 {关系 ID: (关系类型, 目标部件的完整路径)}。"""
+    directory, filename = posixpath.split(part_path)
+    rels_path = posixpath.join(directory, '_rels', f"{filename}.rels")
+    if rels_path not in archive.namelist():
+        return {}
+    root = ET.fromstring(archive.read(rels_path))
+    relationships = {}
+    for rel in root.findall('rel:Relationship', NS):
+        target = rel.get('Target', '')
+        full_path = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join(directory, target))
+        relationships[rel.get('Id')] = (rel.get('Type', ''), full_path)
+    return relationships
+
+# --- 各格式的“页”列表与单页提取 ---
+# 每种格式提供 list_units（返回该文档的页/幻灯片/工作表/章节列表，元素需可序列化以传给子进程）
+# 与 extract_unit（提取其中一页的文字）。PDF 的页列表就是页码。
+
+def _pdf_reader(path: str):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise DocumentExtractionError("解析 PDF 需要安装 pypdf：pip install pypdf")
+    try:
+        return PdfReader(path)
+    except Exception as e:
+        raise DocumentExtractionError(f"无法打开 PDF 文件: {e}")
+
+def _list_pdf_pages(path: str) -> list:
+    return list(range(len(_pdf_reader(path).pages)))
+
+def _extract_pdf_pages(path: str, units: list) -> list[str]:
+    reader = _pdf_reader(path)
+    return [reader.pages[index].extract_text() or '' for index in units]
+
+def _list_pptx_slides(path: str) -> list:
+    """按演示文稿中的放映顺序返回幻灯片部件路径。"""
+    with zipfile.ZipFile(path) as archive:
+        presentation = ET.fromstring(archive.read('ppt/presentation.xml'))
+        relationships = _read_relationships(archive, 'ppt/presentation.xml')
+        slides = []
+        for slide_id in presentation.iterfind('p:sldIdLst/p:sldId', NS):
+            rel = relationships.get(slide_id.get(f"{{{NS['r']}}}id"))
+            if rel is not None:
+                slides.append(rel[1])
+        return slides
+
+def _extract_pptx_slides(path: str, units: list) -> list[str]:
+    """提取幻灯片文字及其演讲者备注。"""
+    texts = []
+    with zipfile.ZipFile(path) as archive:
+        for slide_path in units:
+            paragraphs = _paragraph_texts(ET.fromstring(archive.read(slide_path)), f"{{{NS['a']}}}p", f"{{{NS['a']}}}t")
+            for rel_type, target in _read_relationships(archive, slide_path).values():
+                if rel_type.endswith('/notesSlide') and target in archive.namelist():
+                    notes = _paragraph_texts(ET.fromstring(archive.read(target)), f"{{{NS['a']}}}p", f"{{{NS['a']}}}t")
+                    # 备注页的占位符里通常带有幻灯片编号，只有一个纯数字段落时忽略
+                    notes = [line for line in notes if not line.strip().isdigit()]
+                    if notes:
+                        paragraphs.append("备注: " + "\n".join(notes))
+            texts.append("\n".join(paragraphs))
+    return texts
+
+def _list_xlsx_sheets(path: str) -> list:
+    """返回 [(工作表名称, 部件路径), ...]。"""
+    with zipfile.ZipFile(path) as archive:
+        workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+        relationships = _read_relationships(archive, 'xl/workbook.xml')
+        sheets = []
+        for sheet in workbook.iterfind('s:sheets/s:sheet', NS):
+            rel = relationships.get(sheet.get(f"{{{NS['r']}}}id"))
+            if rel is not None:
+                sheets.append((sheet.get('name', ''), rel[1]))
+        return sheets
+
+def _extract_xlsx_sheets(path: str, units: list) -> list[str]:
+    """每个工作表输出为制表符分隔的行，前面加上工作表名称。"""
+    texts = []
+    with zipfile.ZipFile(path) as archive:
+        shared_strings = []
+        if 'xl/sharedStrings.xml' in archive.namelist():
+            root = ET.fromstring(archive.read('xl/sharedStrings.xml'))
+            shared_strings = [''.join(node.text or '' for node in item.iter(f"{{{NS['s']}}}t"))
+                              for item in root.iterfind('s:si', NS)]
+        for sheet_name, sheet_path in units:
+            lines = []
+            root = ET.fromstring(archive.read(sheet_path))
+            for row in root.iterfind('s:sheetData/s:row', NS):
+                cells = []
+                for cell in row.iterfind('s:c', NS):
+                    cell_type = cell.get('t')
+                    if cell_type == 'inlineStr':
+                        value = ''.join(node.text or '' for node in cell.iter(f"{{{NS['s']}}}t"))
+                    else:
+                        value_node = cell.find('s:v', NS)
+                        value = value_node.text if value_node is not None and value_node.text else ''
+                        if cell_type == 's' and value.isdigit() and int(value) < len(shared_strings):
+                            value = shared_strings[int(value)]
+                    cells.append(value)
+                if any(cells):
+                    lines.append("\t".join(cells).rstrip("\t"))
+            texts.append(f"## 工作表: {sheet_name}\n" + "\n".join(lines) if lines else "")
+    return texts
+
+def _list_epub_chapters(path: str) -> list:
+    """按书脊（spine）顺序返回章节部件路径。"""
+    with zipfile.ZipFile(path) as archive:
+        container = ET.fromstring(archive.read('META-INF/container.xml'))
+        rootfile = container.find('container:rootfiles/container:rootfile', NS)
+        if rootfile is None:
+            raise DocumentExtractionError("EPUB 文件缺少内容描述 (OPF)")
+        opf_path = rootfile.get('full-path')
+        package = ET.fromstring(archive.read(opf_path))
+        opf_dir = posixpath.dirname(opf_path)
+        manifest = {item.get('id'): posixpath.normpath(posixpath.join(opf_dir, item.get('href', '')))
+                    for item in package.iterfind('opf:manifest/opf:item', NS)}
+        return [manifest[item.get('idref')] for item in package.iterfind('opf:spine/opf:itemref', NS)
+                if item.get('idref') in manifest]
+
+def _extract_epub_chapters(path: str, units: list) -> list[str]:
+    with zipfile.ZipFile(path) as archive:
+        return [html_to_text(_decode_text(archive.read(chapter))) for chapter in units]
+
+def _extract_docx(path: str) -> str:
+    """按段落顺序提取正文（包括表格单元格中的段落）。"""
+    with zipfile.ZipFile(path) as archive:
+        root = ET.fromstring(archive.read('word/document.xml'))
+    return "\n".join(_paragraph_texts(root, f"{{{NS['w']}}}p", f"{{{NS['w']}}}t"))
+
+def _extract_eml(path: str) -> str:
+    with open(path, 'rb') as f:
+        message = email.message_from_binary_file(f, policy=email.policy.default)
+    header = "\n".join(f"{name}: {message[name]}" for name in ('Subject', 'From', 'To', 'Date') if message[name])
+    body = message.get_body(preferencelist=('plain', 'html'))
+    content = body.get_content() if body is not None else ''
+    if body is not None and body.get_content_type() == 'text/html':
+        content = html_to_text(content)
+    return f"{header}\n\n{content}".strip()
+
+def _extract_single(path: str, ext: str) -> str:
+    """不分页的格式：整份文档作为一页提取。"""
+    if ext == '.docx':
+        return _extract_docx(path)
+    if ext == '.eml':
+        return _extract_eml(path)
+    with open(path, 'rb') as f:
+        text = _decode_text(f.read())
+    if ext in ('.html', '.htm'):
+        return html_to_text(text)
+    if ext == '.xml':
+        root = ET.fromstring(text.encode('utf-8'))
+        return _normalize_whitespace("\n".join(part.strip() for part in root.itertext() if part.strip()))
+    return text
+
+# 分页格式: 扩展名 -> (列出页, 提取若干页, 页标题格式)
+PAGED_BACKENDS = {
+    '.pdf': (_list_pdf_pages, _extract_pdf_pages, None),
+    '.pptx': (_list_pptx_slides, _extract_pptx_slides, "## 第 {} 页幻灯片"),
+    '.xlsx': (_list_xlsx_sheets, _extract_xlsx_sheets, None),
+    '.epub': (_list_epub_chapters, _extract_epub_chapters, None),
+}
+
+def _extract_batch(path: str, ext: str, units: list) -> list[str]:
+    """(进程池工作函数) 提取一批页面的文字。"""
+    if ext in PAGED_BACKENDS:
+        return PAGED_BACKENDS[ext][1](path, units)
+    return [_extract_single(path, ext)]
+
+# --- 对外接口 ---
+
+def extract_document_generator(path: str, use_cache: bool = True, pages_per_task: int = DOC_PAGES_PER_TASK):
+    """
+    (生成器) 提取文档文字，按页序逐页产出。
+    页数超过一批 (pages_per_task) 时，各批在进程池中并行提取，但仍严格按页序产出。
+    产出事件: ('page', 页序号(从0开始), 该页文字)
+              ('progress', 已完成页数, 总页数)
+              ('result', 全文)
+              ('error', 错误信息)
+    命中缓存时不产出 'page' 事件，直接产出进度与全文。
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in LEGACY_FORMAT_HINTS:
+        yield 'error', f"暂不支持旧版 {ext} 格式，请另存为 {LEGACY_FORMAT_HINTS[ext]} 后重新上传。"
+        return
+
+    cache_key = None
+    if use_cache:
+        try:
+            cache_key = document_cache_key(path, ext)
+        except OSError as e:
+            yield 'error', f"无法读取文件: {e}"
+            return
+        cached = _document_cache.get(cache_key)
+        if cached is not None:
+            yield 'progress', cached["pages"], cached["pages"]
+            yield 'result', cached["text"]
+            return
+
+    try:
+        with metrics.span("extract_document", format=ext) as attrs:
+            if ext in PAGED_BACKENDS:
+                list_units, _, title_format = PAGED_BACKENDS[ext]
+                units = list_units(path)
+            else:
+                title_format, units = None, [None]
+            attrs["pages"] = len(units)
+            batches = [units[start:start + pages_per_task] for start in range(0, len(units), max(1, pages_per_task))]
+
+            texts = []
+            if len(batches) <= 1:
+                batch_results = iter([_extract_batch(path, ext, units)] if units else [])
+                futures = []
+            else:
+                pool = _get_extraction_pool()
+                futures = [pool.submit(_extract_batch, path, ext, batch) for batch in batches]
+                # 按提交顺序等待结果：各批并行执行，产出顺序与页序一致
+                batch_results = (future.result() for future in futures)
+            try:
+                for batch_texts in batch_results:
+                    for text in batch_texts:
+                        if title_format and text.strip():
+                            text = f"{title_format.format(len(texts) + 1)}\n{text}"
+                        yield 'page', len(texts), text
+                        texts.append(text)
+                    yield 'progress', len(texts), len(units)
+            finally:
+                for future in futures:
+                    future.cancel()
+    except DocumentExtractionError as e:
+        yield 'error', str(e)
+        return
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        yield 'error', f"文档已损坏或不是有效的 {ext} 文件: {e}"
+        return
+    except Exception as e:
+        yield 'error', f"提取文档文字失败: {e}"
+        return
+
+    full_text = "\n\n".join(text.strip() for text in texts if text.strip())
+    if cache_key is not None and full_text:
+        _document_cache.set(cache_key, {"text": full_text, "pages": len(texts)})
+    yield 'result', full_text
@@ -0,0 +1,395 @@
+# job_queue.py
+# 后台任务队列：处理任务提交到本地工作线程池执行，任务状态与事件持久化在 SQLite 中。
+# 网页刷新或断开连接不会中断任务，重新打开页面后可以按任务 ID 重新接上进度。
+#
+# 独立运行工作进程 (可选，与网页进程共用同一个数据库):
+#   python job_queue.py --workers 4
+import os
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from config import DEEPSEEK_API_KEY, DOUBAO_APP_ID, DOUBAO_TOKEN, JOB_DB_PATH, JOB_WORKERS, WORKSPACE_ROOT, JOB_DEADLINE_SECONDS
+from workspace import JobWorkspace
+from main import main_process_generator
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+TERMINAL_STATUSES = (JOB_SUCCEEDED, JOB_FAILED)
+
+# 连续的 llm_chunk 事件先在内存中合并，达到时间或长度阈值后再写入数据库，避免逐字写库
+EVENT_FLUSH_SECONDS = 0.25
+EVENT_FLUSH_CHARS = 2000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    params TEXT NOT NULL,
+    stage TEXT NOT NULL DEFAULT '',
+    progress REAL NOT NULL DEFAULT 0,
+    outputs TEXT,
+    error TEXT,
+    worker_pid INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority, created_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    event_type TEXT NOT NULL,
+    value TEXT,
+    text TEXT,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+class JobStore:
+    """
+    SQLite 任务存储：jobs 表记录任务参数、状态、当前阶段、进度与输出路径，
+    job_events 表按序号记录 main_process_generator 产出的事件，供客户端轮询或重放。
+    每个线程使用独立连接；WAL 模式下读写互不阻塞，可被多个进程共享。
+    """
+
+    def __init__(self, db_path: str = JOB_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def submit(self, job_id: str, params: dict, priority: int = 0):
+        """登记一个排队中的任务。priority 越小越先执行，相同优先级按提交顺序执行。"""
+        self._connect().execute(
+            "INSERT INTO jobs (id, status, priority, params, created_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, JOB_QUEUED, priority, json.dumps(params, ensure_ascii=False), time.time()))
+
+    def claim_next(self) -> dict | None:
+        """原子地取出下一个排队中的任务并标记为运行中；队列为空时返回 None。"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY priority, created_at LIMIT 1", (JOB_QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker_pid = ?, started_at = ? WHERE id = ?",
+                (JOB_RUNNING, os.getpid(), time.time(), row["id"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(row["id"])
+
+    def requeue(self, job_id: str) -> bool:
+        """把失败的任务重新放回队列（清空其事件记录）；任务不存在或不是失败状态时返回 False。"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            updated = conn.execute(
+                """UPDATE jobs SET status = ?, stage = '', progress = 0, outputs = NULL, error = NULL,
+                          worker_pid = NULL, started_at = NULL, finished_at = NULL
+                   WHERE id = ? AND status = ?""",
+                (JOB_QUEUED, job_id, JOB_FAILED)).rowcount
+            if updated:
+                conn.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return bool(updated)
+
+    def get(self, job_id: str) -> dict | None:
+        """读取任务记录（params 与 outputs 已解析为对象）。"""
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["outputs"] = json.loads(job["outputs"]) if job["outputs"] else None
+        return job
+
+    def queue_position(self, job_id: str) -> int:
+        """排队中的任务前面还有多少个排队任务；任务不在排队时返回 0。"""
+        row = self._connect().execute(
+            """SELECT COUNT(*) FROM jobs AS other, jobs AS this
+               WHERE this.id = ? AND this.status = ? AND other.status = ?
+                 AND (other.priority, other.created_at) < (this.priority, this.created_at)""",
+            (job_id, JOB_QUEUED, JOB_QUEUED)).fetchone()
+        return row[0]
+
+    def list_jobs(self, limit: int = 20) -> list[dict]:
+        """按提交时间倒序列出最近的任务。"""
+        rows = self._connect().execute(
+            "SELECT id, status, stage, progress, params, created_at FROM jobs ORDER BY created_at DESC LIMIT ?",
+            (limit,)).fetchall()
+        return [{**dict(row), "params": json.loads(row["params"])} for row in rows]
+
+    def append_events(self, job_id: str, events: list[tuple]):
+        """追加一批事件 (event_type, value, text)，并同步更新任务的阶段与进度。"""
+        if not events:
+            return
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM job_events WHERE job_id = ?", (job_id,)).fetchone()
+            seq = row[0]
+            for event_type, value, text in events:
+                seq += 1
+                conn.execute(
+                    "INSERT INTO job_events (job_id, seq, event_type, value, text) VALUES (?, ?, ?, ?, ?)",
+                    (job_id, seq, event_type, json.dumps(value, ensure_ascii=False), text))
+                if event_type == "progress":
+                    conn.execute("UPDATE jobs SET stage = ?, progress = ? WHERE id = ?", (text, float(value), job_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def events_since(self, job_id: str, after_seq: int = 0) -> list[tuple]:
+        """返回序号大于 after_seq 的事件列表 [(seq, event_type, value, text), ...]。"""
+        rows = self._connect().execute(
+            "SELECT seq, event_type, value, text FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, after_seq)).fetchall()
+        return [(row["seq"], row["event_type"], json.loads(row["value"]), row["text"]) for row in rows]
+
+    def finish(self, job_id: str, status: str, outputs=None, error: str | None = None):
+        """记录任务的最终状态、输出路径与错误信息。"""
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, outputs = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, json.dumps(outputs, ensure_ascii=False) if outputs is not None else None, error, time.time(), job_id))
+
+    def fail_orphaned_jobs(self):
+        """将工作进程已不存在的运行中任务标记为失败（例如服务重启前未完成的任务），之后可按任务 ID 继续。"""
+        rows = self._connect().execute("SELECT id, worker_pid FROM jobs WHERE status = ?", (JOB_RUNNING,)).fetchall()
+        for row in rows:
+            if row["worker_pid"] == os.getpid() or _pid_alive(row["worker_pid"]):
+                continue
+            self.append_events(row["id"], [("persistent_error", 0, "**任务已中断**\n\n执行该任务的工作进程已退出。")])
+            self.finish(row["id"], JOB_FAILED, error="工作进程已退出")
+
+def _pid_alive(pid: int | None) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # 进程存在但无权限发送信号
+    return True
+
+class _EventWriter:
+    """把生成器事件写入 JobStore，连续的同类型 llm_chunk 合并后按时间/长度阈值批量写入。"""
+
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+        self._pending = []
+        self._buffered_chars = 0
+        self._last_flush = time.monotonic()
+
+    def add(self, event_type: str, value, text: str):
+        if event_type == "llm_chunk":
+            last = self._pending[-1] if self._pending else None
+            if last and last[0] == "llm_chunk" and last[2] == text:
+                self._pending[-1] = ("llm_chunk", last[1] + value, text)
+            else:
+                self._pending.append((event_type, value, text))
+            self._buffered_chars += len(value)
+            if (self._buffered_chars < EVENT_FLUSH_CHARS
+                    and time.monotonic() - self._last_flush < EVENT_FLUSH_SECONDS):
+                return
+        else:
+            self._pending.append((event_type, value, text))
+        self.flush()
+
+    def flush(self):
+        self.store.append_events(self.job_id, self._pending)
+        self._pending = []
+        self._buffered_chars = 0
+        self._last_flush = time.monotonic()
+
+def run_job(store: JobStore, job: dict):
+    """在当前线程中执行一个已领取的任务，事件与最终状态写入 store。"""
+    params = job["params"]
+    writer = _EventWriter(store, job["id"])
+    status, outputs, error = JOB_FAILED, None, None
+    try:
+        workspace = JobWorkspace.open(params["workspace_root"], job["id"], params["cleanup"])
+    except OSError as e:
+        writer.add("persistent_error", 0, f"**无法打开任务工作目录**\n\n{e}")
+        writer.flush()
+        store.finish(job["id"], JOB_FAILED, error=str(e))
+        return
+
+    try:
+        generator = main_process_generator(
+            params["input_path"], DOUBAO_APP_ID, DOUBAO_TOKEN, DEEPSEEK_API_KEY,
+            params["output_filename"], params["queries"],
+            use_cache=params["use_cache"],
+            workspace=workspace,
+            priority=job["priority"],
+            deadline_seconds=params.get("deadline_seconds", JOB_DEADLINE_SECONDS),
+            question=params.get("question", ""),
+        )
+        for event_type, value, *rest in generator:
+            text = rest[0] if rest else ""
+            writer.add(event_type, value, text)
+            if event_type in ("persistent_error", "error"):
+                error = text
+                break
+            if event_type == "done":
+                status, outputs = JOB_SUCCEEDED, value
+    except Exception as e:
+        error = str(e)
+        writer.add("persistent_error", 0, f"**任务执行出错**\n\n**原始错误信息:**\n`{e}`")
+    finally:
+        writer.flush()
+        store.finish(job["id"], status, outputs, error)
+        workspace.finish(status == JOB_SUCCEEDED)
+
+class JobWorkerPool:
+    """
+    固定数量的工作线程，从 SQLite 队列中领取任务执行，并发数即线程数。
+    多个进程（例如网页进程与独立工作进程）可共用同一个数据库，领取操作是原子的。
+    """
+
+    def __init__(self, store: JobStore, num_workers: int = JOB_WORKERS, poll_interval: float = 1.0):
+        self.store = store
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self.store.fail_orphaned_jobs()
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self):
+        """有新任务提交时唤醒空闲的工作线程（其他进程提交的任务靠定时轮询发现）。"""
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            try:
+                job = self.store.claim_next()
+            except sqlite3.Error as e:
+                print(f"警告：读取任务队列失败: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            print(f"开始执行任务 {job['id']}: {job['params']['input_path']}")
+            run_job(self.store, job)
+
+_job_store = None
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+def get_job_store() -> JobStore:
+    """返回进程内共享的任务存储。"""
+    global _job_store
+    with _worker_pool_lock:
+        if _job_store is None:
+            _job_store = JobStore()
+        return _job_store
+
+def get_worker_pool(num_workers: int = JOB_WORKERS) -> JobWorkerPool:
+    """返回进程内共享的工作线程池，首次调用时启动。"""
+    global _worker_pool
+    store = get_job_store()
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = JobWorkerPool(store, num_workers)
+            _worker_pool.start()
+        return _worker_pool
+
+def submit_job(workspace: JobWorkspace, input_path: str, output_filename: str, queries: list[str],
+               use_cache: bool, priority: int = 0, deadline_seconds: float = JOB_DEADLINE_SECONDS,
+               question: str = "") -> str:
+    """提交一个处理任务（输入文件需已放入 workspace），返回任务 ID。"""
+    params = {
+        "input_path": input_path,
+        "output_filename": output_filename,
+        "queries": queries,
+        "use_cache": use_cache,
+        "workspace_root": workspace.root,
+        "cleanup": workspace.cleanup,
+        "deadline_seconds": deadline_seconds,
+        "question": question,
+    }
+    get_job_store().submit(workspace.job_id, params, priority)
+    get_worker_pool().notify()
+    return workspace.job_id
+
+def resume_job(job_id: str):
+    """
+    按任务 ID 继续执行失败的任务：任务在原工作目录中重新运行，
+    检查点中已完成的音频块与生成结果不会重做。工作目录已被清理时抛出 ValueError。
+    """
+    store = get_job_store()
+    job = store.get(job_id)
+    if job is None:
+        raise ValueError(f"找不到任务 {job_id}")
+    if job["status"] == JOB_FAILED:
+        # 重新标记为运行中，避免排队期间被配额清理当作已结束的目录删除
+        try:
+            JobWorkspace.open(job["params"]["workspace_root"], job_id, job["params"]["cleanup"])
+        except OSError:
+            raise ValueError(f"任务 {job_id} 的工作目录已被清理，无法继续，请重新提交")
+    if not store.requeue(job_id):
+        raise ValueError(f"任务 {job_id} 当前状态为 {job['status']}，只有失败的任务可以继续")
+    get_worker_pool().notify()
+
+def main():
+    parser = argparse.ArgumentParser(description="后台任务工作进程")
+    parser.add_argument('--workers', type=int, default=JOB_WORKERS, help="并发执行的任务数")
+    parser.add_argument('--resume', nargs='+', metavar='JOB_ID', default=[], help="启动前先把这些失败的任务重新放回队列")
+    args = parser.parse_args()
+    pool = get_worker_pool(args.workers)
+    for job_id in args.resume:
+        try:
+            resume_job(job_id)
+            print(f"任务 {job_id} 已重新加入队列")
+        except ValueError as e:
+            print(f"错误：{e}")
+    print(f"任务工作进程已启动: {args.workers} 个线程，数据库 {JOB_DB_PATH}，工作目录 {WORKSPACE_ROOT}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pool.stop()
+
+if __name__ == "__main__":
+    main()
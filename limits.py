@@ -0,0 +1,27 @@
+# limits.py
+import threading
+import contextlib
+
+# 进程内全局并发上限，按资源名称区分（如 "ffmpeg"）。
+# 外部 API 的速率与并发由 scheduler.py 中的服务商调度器控制。
+# 未设置上限的资源不做限制，行为与原来一致。
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+def set_concurrency_limit(name: str, limit: int | None):
+    """设置某类资源的全局并发上限；limit 为 None 或 <= 0 时取消限制。"""
+    with _semaphores_lock:
+        if limit is None or limit <= 0:
+            _semaphores.pop(name, None)
+        else:
+            _semaphores[name] = threading.BoundedSemaphore(limit)
+
+@contextlib.contextmanager
+def concurrency_limit(name: str):
+    """在该资源的全局并发上限内执行代码块。"""
+    semaphore = _semaphores.get(name)
+    if semaphore is None:
+        yield
+        return
+    with semaphore:
+        yield
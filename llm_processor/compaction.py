@@ -0,0 +1,132 @@
+# compaction.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import re
+import difflib
+from llm_processor.tokens import estimate_tokens
+
+# 文字稿压缩：在调用 DeepSeek 前去除口语填充词、口吃式重复与近似重复的行，并按各生成类型的 token 预算裁剪。
+# 规则来自 prompts.yml 的 compaction 部分，未配置的项使用下面的默认值。
+
+DEFAULT_RULES = {
+    "enabled": True,
+    # 独立出现（前后都是标点或行首行尾）的填充词才会删除，“那个问题”中的“那个”、“I mean it”中的“I mean”不受影响
+    "filler_words": ["嗯", "呃", "额", "啊", "哦", "唔", "那个", "这个", "就是说", "然后呢", "对吧",
+                     "um", "uh", "erm", "you know", "I mean"],
+    # 连续重复的词语（“我们我们我们”、“the the”）出现至少这么多次时只保留一次，0 表示不处理
+    "repeat_min_count": 2,
+    # 与前 near_duplicate_window 行的相似度不低于该值的行视为重复（音频块重叠处常见），大于 1 表示不处理
+    "near_duplicate_threshold": 0.9,
+    "near_duplicate_window": 5,
+    # 只对不短于该字数的行做近似重复判断；短句只差一两个字时含义就可能不同
+    "near_duplicate_min_chars": 20,
+}
+
+# 填充词前后允许出现的分隔符
+_SEPARATORS = r'，,、。．.！!？?；;：:\s'
+# 填充词之前必须是行首或标点（标点后可以有空白）
+_FILLER_BEFORE = r'，,、。．.！!？?；;：:'
+_CJK_REPEAT_UNIT = r'[\u4e00-\u9fff]{2,10}?'
+# 删除填充词后残留的分隔符：句末标点前或行首的逗号、连续的逗号
+_DANGLING_COMMA = re.compile(r'^[，,、\s]+|[，,、\s]+(?=[。．.！!？?；;]|$)')
+_REPEATED_COMMA = re.compile(r'([，,、])[，,、\s]*[，,、]')
+_DIGITS = re.compile(r'\d+')
+_PUNCTUATION = re.compile(f'[{_SEPARATORS}“”"\'‘’（）()《》…—-]+')
+
+def load_rules(prompts_config: dict) -> dict:
+    """合并 prompts.yml 中的 compaction 配置与默认规则。"""
+    return {**DEFAULT_RULES, **(prompts_config.get('compaction') or {})}
+
+def _filler_pattern(filler_words: list[str]) -> re.Pattern | None:
+    if not filler_words:
+        return None
+    words = '|'.join(re.escape(word) for word in sorted(filler_words, key=len, reverse=True))
+    # 只删除前后都是标点（或行首行尾）、独立成句的填充词，连同其后的逗号一起删除（句末的句号保留给前一句）；
+    # 后面紧跟正文的不删除，“I mean it.” 中的 “I mean” 是正文的一部分。标点后的空白由第 1 组保留
+    return re.compile(f'(?:^|(?<=[{_FILLER_BEFORE}]))(\\s*)(?:{words})(?:[，,、]\\s*|(?=\\s*(?:[。．.！!？?；;]|$)))',
+                      re.IGNORECASE | re.MULTILINE)
+
+def _repeat_patterns(min_count: int) -> list[re.Pattern]:
+    if min_count < 2:
+        return []
+    extra = min_count - 1
+    return [
+        re.compile(f'({_CJK_REPEAT_UNIT})(?:[，,、\\s]*\\1){{{extra},}}'),
+        re.compile(f'\\b([A-Za-z]+(?:\\s+[A-Za-z]+){{0,3}})(?:[,\\s]+\\1\\b){{{extra},}}', re.IGNORECASE),
+    ]
+
+def _normalize_line(line: str) -> str:
+    """近似重复判断用的规范化形式：去掉标点与空白，英文转小写。"""
+    return _PUNCTUATION.sub('', line).lower()
+
+def compact_transcript(text: str, rules: dict | None = None) -> str:
+    """按规则压缩文字稿：删除填充词与口吃式重复、近似重复的行以及空行，保持其余内容与顺序不变。"""
+    rules = {**DEFAULT_RULES, **(rules or {})}
+    if not text or not rules["enabled"]:
+        return text
+
+    filler = _filler_pattern(rules["filler_words"])
+    repeats = _repeat_patterns(int(rules["repeat_min_count"]))
+    threshold = float(rules["near_duplicate_threshold"])
+    window = int(rules["near_duplicate_window"])
+    min_chars = int(rules["near_duplicate_min_chars"])
+
+    kept_lines = []
+    recent = []  # 最近保留的若干行的 (SequenceMatcher, 行中的数字)，用于近似重复判断
+    for line in text.split('\n'):
+        for pattern in repeats:
+            line = pattern.sub(r'\1', line)
+        if filler is not None:
+            line = _REPEATED_COMMA.sub(r'\1', _DANGLING_COMMA.sub('', filler.sub(r'\1', line)))
+        line = line.strip()
+        normalized = _normalize_line(line)
+        # 空行以及与上一行完全相同的行直接删除
+        if not normalized or (kept_lines and normalized == _normalize_line(kept_lines[-1])):
+            continue
+
+        if threshold <= 1 and len(normalized) >= min_chars:
+            # 数字不同的两行（“第 3 步”与“第 4 步”）不视为重复
+            numbers = _DIGITS.findall(normalized)
+            duplicate = False
+            for matcher, matcher_numbers in recent:
+                if matcher_numbers != numbers:
+                    continue
+                matcher.set_seq1(normalized)
+                if (matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold
+                        and matcher.ratio() >= threshold):
+                    duplicate = True
+                    break
+            if duplicate:
+                continue
+            # SequenceMatcher 缓存第二个序列的索引，每个保留的行只建一次
+            recent.append((difflib.SequenceMatcher(None, '', normalized, autojunk=False), numbers))
+            if len(recent) > window:
+                recent.pop(0)
+        kept_lines.append(line)
+    return '\n'.join(kept_lines)
+
+def apply_token_budget(text: str, max_tokens: int) -> str:
+    """
+    将文字稿裁剪到 max_tokens 以内（0 表示不限制）。
+    超出预算时按比例在全文范围内均匀保留行，而不是截掉结尾，使生成内容仍能覆盖整份材料。
+    """
+    if max_tokens <= 0 or estimate_tokens(text) <= max_tokens:
+        return text
+    lines = text.split('\n')
+    line_tokens = [estimate_tokens(line) + 1 for line in lines]  # +1 近似换行符
+    ratio = max_tokens / sum(line_tokens)
+    kept, kept_tokens, seen_tokens = [], 0, 0
+    for line, tokens in zip(lines, line_tokens):
+        seen_tokens += tokens
+        # 已保留的 token 数跟随已读过的 token 数按比例增长
+        if kept_tokens + tokens <= seen_tokens * ratio:
+            kept.append(line)
+            kept_tokens += tokens
+    return '\n'.join(kept)
+
+def get_token_budget(prompts_config: dict, query_key: str) -> int:
+    """prompts.yml 中 token_budgets 为该生成类型配置的文字稿 token 预算，未配置时为 0（不限制）。"""
+    return int((prompts_config.get('token_budgets') or {}).get(query_key) or 0)
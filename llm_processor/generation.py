@@ -0,0 +1,129 @@
+# generation.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import os
+import time
+import openai
+import metrics
+from cache import DiskCache, make_cache_key
+from llm_processor.tokens import estimate_tokens
+from scheduler import get_provider_scheduler, parse_retry_after
+from config import CACHE_DIR, LLM_CACHE_MAX_MB, LLM_CACHE_TTL_DAYS, RATE_LIMIT_MAX_RETRIES, DEEPSEEK_BASE_URL
+
+DEEPSEEK_MODEL = "deepseek-chat"
+DEFAULT_TEMPERATURE = 0.7
+DEFAULT_MAX_TOKENS = 4000
+
+# 命中缓存时按固定长度切片回放，保持与流式输出相同的 llm_chunk 事件形态
+REPLAY_CHUNK_CHARS = 64
+
+# --- 生成结果缓存 ---
+# 以文字稿哈希、操作类型、system role、提示模板哈希、模型与采样参数为键，条目为 {"completion", "created_at"}。
+# 容量按 LRU 淘汰，超过 LLM_CACHE_TTL_DAYS 的条目在读取时视为过期并删除。
+_generation_cache = DiskCache(os.path.join(CACHE_DIR, "llm"), LLM_CACHE_MAX_MB * 1024 * 1024, name="生成")
+
+def get_generation_cache() -> DiskCache:
+    """返回全局共享的生成结果缓存（可读取 hits/misses 计数）。"""
+    return _generation_cache
+
+def generation_cache_key(transcript: str, query_key: str, system_role: str, prompt_template: str,
+                         model: str = DEEPSEEK_MODEL, temperature: float = DEFAULT_TEMPERATURE,
+                         max_tokens: int = DEFAULT_MAX_TOKENS) -> str:
+    """计算一次生成请求的缓存键。"""
+    return make_cache_key(
+        "llm",
+        make_cache_key(transcript),
+        query_key,
+        system_role,
+        make_cache_key(prompt_template),
+        model,
+        temperature,
+        max_tokens,
+    )
+
+def get_cached_completion(cache_key: str) -> str | None:
+    """读取缓存的完整生成结果；未命中或已过期时返回 None。"""
+    entry = _generation_cache.get(cache_key)
+    if entry is None:
+        return None
+    if time.time() - entry.get("created_at", 0) > LLM_CACHE_TTL_DAYS * 86400:
+        _generation_cache.delete(cache_key)
+        return None
+    return entry.get("completion")
+
+def save_completion(cache_key: str, completion: str):
+    """保存一次完整的生成结果。"""
+    _generation_cache.set(cache_key, {"completion": completion, "created_at": time.time()})
+
+def replay_completion(completion: str):
+    """(生成器) 将缓存的生成结果按固定长度切片产出，模拟流式输出。"""
+    for start in range(0, len(completion), REPLAY_CHUNK_CHARS):
+        yield completion[start:start + REPLAY_CHUNK_CHARS]
+
+def is_throttled_error(error: Exception) -> bool:
+    """DeepSeek 返回 429（限流）或 503（服务繁忙）时由调度器退避后重试。"""
+    return isinstance(error, openai.RateLimitError) or (
+        isinstance(error, openai.APIStatusError) and error.status_code == 503)
+
+def stream_chat_completion(client, system_role: str, prompt: str,
+                           model: str = DEEPSEEK_MODEL, temperature: float = DEFAULT_TEMPERATURE,
+                           max_tokens: int = DEFAULT_MAX_TOKENS, priority: int = 0, deadline: float | None = None):
+    """
+    (生成器) 调用 DeepSeek 流式接口，逐段产出生成的文本。
+    请求经 "deepseek" 服务商调度器发出（速率、并发与优先级），整个流式响应期间占用一个并发槽位；
+    被限流时由调度器统一退避后重试（client 应设置 max_retries=0，避免 SDK 自行重试）。
+    deadline: 任务截止时间（time.monotonic() 时间戳）；用作请求超时，超过后不再重试。
+    记录首个 token 的等待时间（llm_first_token）与流式输出的耗时、token 数和速度（llm_stream）。
+    """
+    scheduler = get_provider_scheduler("deepseek")
+    for attempt in range(1, RATE_LIMIT_MAX_RETRIES + 1):
+        with scheduler.slot(priority):
+            request_options = {}
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("已超出任务的时间预算，放弃调用 DeepSeek")
+                request_options["timeout"] = remaining
+            request_started = time.perf_counter()
+            try:
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_role},
+                        {"role": "user", "content": prompt}
+                    ],
+                    stream=True,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    **request_options
+                )
+            except Exception as e:
+                if not is_throttled_error(e) or attempt == RATE_LIMIT_MAX_RETRIES:
+                    raise
+                scheduler.report_throttled(parse_retry_after(e.response.headers.get("Retry-After")))
+                metrics.incr("retries", function="stream_chat_completion")
+                continue
+            scheduler.report_success()
+            job_metrics = metrics.current_job_metrics()
+            with metrics.span("llm_stream", model=model) as attrs:
+                parts = []
+                first_token_at = None
+                for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content is not None:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                            if job_metrics is not None:
+                                job_metrics.record("llm_first_token", request_started, first_token_at - request_started)
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+                if first_token_at is not None:
+                    attrs["output_tokens"] = estimate_tokens(''.join(parts))
+                    attrs["generation_seconds"] = time.perf_counter() - first_token_at
+            return
+
+def complete_chat(client, system_role: str, prompt: str, **kwargs) -> str:
+    """调用 DeepSeek 并返回完整的生成文本。"""
+    return ''.join(stream_chat_completion(client, system_role, prompt, **kwargs))
@@ -0,0 +1,95 @@
+# mapreduce.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import contextvars
+import concurrent.futures
+from llm_processor.generation import DEFAULT_MAX_TOKENS, complete_chat, stream_chat_completion
+from llm_processor.tokens import estimate_tokens, split_text_by_tokens
+
+# 各分段结果之间的分隔符，reduce 阶段按此拼接
+PARTIAL_SEPARATOR = "\n\n---\n\n"
+
+def render_section_prompt(template: str, section: str, index: int, count: int) -> str:
+    """填充分段提示模板。"""
+    return (template
+            .replace('{{transcript}}', section)
+            .replace('{{section_index}}', str(index))
+            .replace('{{section_count}}', str(count)))
+
+def render_reduce_prompt(template: str, partials: list[str]) -> str:
+    """填充合并提示模板。"""
+    return template.replace('{{partials}}', PARTIAL_SEPARATOR.join(partials))
+
+def _group_partials(partials: list[str], max_tokens: int) -> list[list[str]]:
+    """按 token 预算将分段结果分组，每组至少包含一个结果。"""
+    groups, current, current_tokens = [], [], 0
+    for partial in partials:
+        tokens = estimate_tokens(partial) + estimate_tokens(PARTIAL_SEPARATOR)
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(partial)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+def map_reduce_generate(client, system_role: str, transcript: str, section_template: str, reduce_template: str,
+                        section_tokens: int, max_prompt_tokens: int, max_workers: int,
+                        reduce_max_tokens: int = DEFAULT_MAX_TOKENS, priority: int = 0, deadline: float | None = None):
+    """
+    (生成器) 分层生成：将文字稿按 token 预算切段，并发执行分段提示，再合并各段结果。
+    若各段结果合起来仍超出预算，则先分组做中间合并，直到能放入一次最终合并。
+    产出事件: ('section_progress', 已完成数量, 总数量, 阶段描述)
+              ('llm_chunk', 最终合并阶段的流式文本)
+    priority / deadline: 各次 DeepSeek 调用的调度优先级与任务截止时间。
+    """
+    sections = split_text_by_tokens(transcript, section_tokens)
+    section_count = len(sections)
+    partials = [None] * section_count
+
+    # Map: 有界线程池并发处理各分段，按完成顺序报告进度，按原顺序保存结果
+    # （工作线程使用调用方上下文的副本，各次调用的耗时记录到当前任务）
+    yield 'section_progress', 0, section_count, "分段生成"
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_index = {
+            executor.submit(contextvars.copy_context().run, complete_chat, client, system_role,
+                            render_section_prompt(section_template, section, i + 1, section_count),
+                            priority=priority, deadline=deadline): i
+            for i, section in enumerate(sections)
+        }
+        num_done = 0
+        for future in concurrent.futures.as_completed(future_to_index):
+            partials[future_to_index[future]] = future.result()
+            num_done += 1
+            yield 'section_progress', num_done, section_count, "分段生成"
+
+    # 中间合并: 结果过长时分组合并，逐层缩减
+    reduce_overhead = estimate_tokens(reduce_template)
+    while estimate_tokens(PARTIAL_SEPARATOR.join(partials)) + reduce_overhead > max_prompt_tokens and len(partials) > 1:
+        groups = _group_partials(partials, max_prompt_tokens - reduce_overhead)
+        if len(groups) == len(partials):
+            break  # 每组只剩一个结果，无法继续缩减
+        yield 'section_progress', 0, len(groups), "中间合并"
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_to_index = {
+                executor.submit(contextvars.copy_context().run, complete_chat, client, system_role,
+                                render_reduce_prompt(reduce_template, group), priority=priority, deadline=deadline): i
+                for i, group in enumerate(groups)
+            }
+            merged = [None] * len(groups)
+            num_done = 0
+            for future in concurrent.futures.as_completed(future_to_index):
+                merged[future_to_index[future]] = future.result()
+                num_done += 1
+                yield 'section_progress', num_done, len(groups), "中间合并"
+        partials = merged
+
+    # Reduce: 最终合并以流式输出，允许比单次生成更长的输出
+    final_prompt = render_reduce_prompt(reduce_template, partials)
+    for message_text in stream_chat_completion(client, system_role, final_prompt, max_tokens=reduce_max_tokens,
+                                               priority=priority, deadline=deadline):
+        yield 'llm_chunk', message_text
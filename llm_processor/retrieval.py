@@ -0,0 +1,200 @@
+# retrieval.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import os
+import re
+import hashlib
+from collections import Counter
+import numpy as np
+import metrics
+from cache import DiskCache, make_cache_key
+from config import CACHE_DIR, RETRIEVAL_CACHE_MAX_MB
+from llm_processor.tokens import estimate_tokens, split_text_by_tokens
+
+# 本地 BM25 检索：把文字稿切分为若干段落，建立倒排索引（按词项存储的稀疏矩阵，NumPy 数组），
+# 按问题（或未给出问题时按全文最突出的词项）取出最相关的前 k 段放入提示词，而不是发送整份文字稿。
+# 索引按文字稿哈希与切分参数缓存在 CACHE_DIR/retrieval 中（不随任务工作目录清理），
+# 对同一份材料的后续提问（新的任务）直接加载，不重新构建。
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 出现在超过该比例段落中的词项不作为“突出词项”（多为口头禅与虚词）
+SALIENT_MAX_DF_RATIO = 0.5
+INDEX_VERSION = "2"
+
+_index_cache = DiskCache(os.path.join(CACHE_DIR, "retrieval"), RETRIEVAL_CACHE_MAX_MB * 1024 * 1024, name="检索索引")
+
+# prompts.yml 中 retrieval 下某一类型未列出的项使用这些默认值
+DEFAULT_SETTINGS = {
+    "top_k": 8,              # 最多放入的段落数
+    "passage_tokens": 400,   # 每个段落的 token 上限
+    "min_tokens": 4000,      # 文字稿不超过该 token 数时直接使用全文，不做检索
+    "salient_terms": 32,     # 没有问题时用作检索词的突出词项数
+}
+
+_CJK_RUN = re.compile(r'[㐀-䶿一-鿿豈-﫿]+')
+_WORD = re.compile(r'[a-z0-9]+(?:[\'\-][a-z0-9]+)*')
+
+def tokenize(text: str) -> list[str]:
+    """检索用的词项：中文按相邻两字（单字成词时取单字），英文与数字按单词（转小写）。"""
+    terms = []
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    terms.extend(word for word in _WORD.findall(text.lower()) if len(word) > 1 or word.isdigit())
+    return terms
+
+def transcript_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class BM25Index:
+    """
+    段落级 BM25 索引。倒排表按词项连续存放：
+    term_ptr[t]:term_ptr[t+1] 区间内的 doc_ids / term_freqs 为词项 t 出现的段落及次数（即 CSC 格式的稀疏矩阵）。
+    """
+
+    def __init__(self, passages: list[str], vocabulary: list[str], term_ptr: np.ndarray, doc_ids: np.ndarray,
+                 term_freqs: np.ndarray, doc_lengths: np.ndarray, source_hash: str, passage_tokens: int):
+        self.passages = passages
+        self.vocabulary = vocabulary
+        self.term_ids = {term: index for index, term in enumerate(vocabulary)}
+        self.term_ptr = term_ptr
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.source_hash = source_hash
+        self.passage_tokens = passage_tokens
+        num_docs = len(passages)
+        doc_freqs = np.diff(term_ptr)
+        self.idf = np.log1p((num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5))
+        self.avg_length = float(doc_lengths.mean()) if num_docs else 0.0
+
+    @classmethod
+    def build(cls, transcript: str, passage_tokens: int) -> "BM25Index":
+        """按 token 预算切分段落（在行边界处切分）并建立倒排索引。"""
+        passages = split_text_by_tokens(transcript, passage_tokens)
+        counts = [Counter(tokenize(passage)) for passage in passages]
+        vocabulary = sorted(set().union(*counts)) if counts else []
+        term_ids = {term: index for index, term in enumerate(vocabulary)}
+
+        postings = [(term_ids[term], doc, freq) for doc, counter in enumerate(counts) for term, freq in counter.items()]
+        postings_array = np.array(postings, dtype=np.int64).reshape(-1, 3)
+        order = np.lexsort((postings_array[:, 1], postings_array[:, 0]))
+        postings_array = postings_array[order]
+        term_ptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(postings_array[:, 0], minlength=len(vocabulary)), out=term_ptr[1:])
+        doc_lengths = np.array([sum(counter.values()) for counter in counts], dtype=np.float64)
+        return cls(passages, vocabulary, term_ptr, postings_array[:, 1].astype(np.int32),
+                   postings_array[:, 2].astype(np.float32), doc_lengths, transcript_hash(transcript), passage_tokens)
+
+    def scores(self, terms: list[str]) -> np.ndarray:
+        """各段落对一组词项的 BM25 得分（词项重复出现时按次数加权）。"""
+        scores = np.zeros(len(self.passages), dtype=np.float64)
+        if not len(self.passages):
+            return scores
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / max(self.avg_length, 1e-9))
+        for term, weight in Counter(terms).items():
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            begin, end = self.term_ptr[term_id], self.term_ptr[term_id + 1]
+            docs = self.doc_ids[begin:end]
+            freqs = self.term_freqs[begin:end]
+            scores[docs] += weight * self.idf[term_id] * freqs * (BM25_K1 + 1) / (freqs + length_norm[docs])
+        return scores
+
+    def salient_terms(self, count: int) -> list[str]:
+        """全文中最突出的词项（总词频 × idf 最高，且不是纯数字或几乎每段都出现的词项），用作没有问题时的检索词。"""
+        if not self.vocabulary:
+            return []
+        doc_freqs = np.diff(self.term_ptr)
+        total_freqs = np.add.reduceat(self.term_freqs, self.term_ptr[:-1]) if len(self.term_freqs) else np.zeros(len(doc_freqs))
+        weights = np.where(doc_freqs <= max(1, SALIENT_MAX_DF_RATIO * len(self.passages)), total_freqs * self.idf, 0.0)
+        # 纯数字（序号、页码等）不作为突出词项
+        weights[[term.isdigit() for term in self.vocabulary]] = 0.0
+        top = np.argsort(-weights, kind='stable')[:count]
+        return [self.vocabulary[index] for index in top if weights[index] > 0]
+
+    def top_passages(self, terms: list[str], top_k: int, max_tokens: int = 0, require_match: bool = True) -> list[int]:
+        """
+        得分最高的至多 top_k 个段落的序号（按原文顺序返回）；max_tokens 大于 0 时总 token 数不超过该值。
+        require_match 为 True 时只取与词项匹配的段落（没有任何段落匹配时仍按原文顺序取），
+        为 False 时不足 top_k 个的部分按原文顺序用未匹配的段落补足。
+        """
+        scores = self.scores(terms)
+        ranked = [int(index) for index in np.argsort(-scores, kind='stable')]
+        if require_match and scores.any():
+            ranked = [index for index in ranked if scores[index] > 0]
+        selected, total_tokens = [], 0
+        for index in ranked:
+            if len(selected) >= top_k:
+                break
+            tokens = estimate_tokens(self.passages[index])
+            if max_tokens > 0 and selected and total_tokens + tokens > max_tokens:
+                continue
+            selected.append(index)
+            total_tokens += tokens
+        return sorted(selected)
+
+    # --- 序列化（缓存条目为 JSON）---
+
+    def to_dict(self) -> dict:
+        return {
+            "source_hash": self.source_hash,
+            "passage_tokens": self.passage_tokens,
+            "passages": self.passages,
+            "vocabulary": self.vocabulary,
+            "term_ptr": self.term_ptr.tolist(),
+            "doc_ids": self.doc_ids.tolist(),
+            "term_freqs": self.term_freqs.tolist(),
+            "doc_lengths": self.doc_lengths.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BM25Index":
+        return cls(data["passages"], data["vocabulary"], np.array(data["term_ptr"], dtype=np.int64),
+                   np.array(data["doc_ids"], dtype=np.int32), np.array(data["term_freqs"], dtype=np.float32),
+                   np.array(data["doc_lengths"], dtype=np.float64), data["source_hash"], data["passage_tokens"])
+
+def get_retrieval_settings(prompts_config: dict, query_key: str) -> dict | None:
+    """prompts.yml 中 retrieval 为该生成类型配置的检索参数（与默认值合并），未配置时返回 None（不做检索）。"""
+    settings = (prompts_config.get('retrieval') or {}).get(query_key)
+    if settings is None or settings is False:
+        return None
+    merged = {**DEFAULT_SETTINGS, **(settings if isinstance(settings, dict) else {})}
+    return {key: int(value) for key, value in merged.items()}
+
+def get_index_cache() -> DiskCache:
+    """返回全局共享的检索索引缓存。"""
+    return _index_cache
+
+def load_or_build_index(transcript: str, passage_tokens: int) -> BM25Index:
+    """按文字稿哈希与段落大小读取缓存的索引；未命中（或条目损坏）时重新构建并写入缓存。"""
+    cache_key = make_cache_key("retrieval", INDEX_VERSION, transcript_hash(transcript), passage_tokens)
+    cached = _index_cache.get(cache_key)
+    if cached is not None:
+        try:
+            return BM25Index.from_dict(cached)
+        except (KeyError, TypeError, ValueError):
+            _index_cache.delete(cache_key)
+    with metrics.span("build_retrieval_index") as attrs:
+        index = BM25Index.build(transcript, passage_tokens)
+        attrs.update(passages=len(index.passages), terms=len(index.vocabulary))
+    _index_cache.set(cache_key, index.to_dict())
+    return index
+
+def retrieve_passages(index: BM25Index, question: str, top_k: int, max_tokens: int = 0, salient_terms: int = 32) -> str:
+    """
+    按问题检索相关段落并按原文顺序拼接。
+    question 为空时以全文最突出的词项作为检索词，并总是取满 top_k 个段落，使生成的问答对覆盖足够的内容。
+    """
+    has_question = bool(question.strip())
+    terms = tokenize(question) if has_question else index.salient_terms(salient_terms)
+    with metrics.span("retrieve_passages", top_k=top_k):
+        selected = index.top_passages(terms, top_k, max_tokens, require_match=has_question)
+    return "\n\n".join(index.passages[i] for i in selected)
@@ -0,0 +1,51 @@
+# tokens.py
+import re
+import math
+
+# DeepSeek 官方给出的换算经验值：1 个中文字符约 0.6 个 token，1 个英文字符约 0.3 个 token。
+# 这里不依赖具体的分词器，只用于切分与预算估算。
+CJK_TOKENS_PER_CHAR = 0.6
+OTHER_TOKENS_PER_CHAR = 0.3
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+def estimate_tokens(text: str) -> int:
+    """估算一段文本的 token 数。"""
+    if not text:
+        return 0
+    cjk_chars = len(_CJK_PATTERN.findall(text))
+    other_chars = len(text) - cjk_chars
+    return math.ceil(cjk_chars * CJK_TOKENS_PER_CHAR + other_chars * OTHER_TOKENS_PER_CHAR)
+
+def _hard_split(line: str, max_tokens: int) -> list[str]:
+    """将超过预算的单行按字符数硬切分（按最坏情况的中文换算比例估算长度）。"""
+    max_chars = max(1, int(max_tokens / CJK_TOKENS_PER_CHAR))
+    return [line[i:i + max_chars] for i in range(0, len(line), max_chars)]
+
+def split_text_by_tokens(text: str, max_tokens: int) -> list[str]:
+    """
+    按 token 预算将文本切分为若干段，尽量在行边界处切分（ASR 文字稿每行是一句话）。
+    每段的估算 token 数不超过 max_tokens。
+    """
+    sections = []
+    current_lines = []
+    current_tokens = 0
+
+    for line in text.split('\n'):
+        line_tokens = estimate_tokens(line) + 1  # +1 近似换行符
+        if line_tokens > max_tokens:
+            pieces = _hard_split(line, max_tokens)
+        else:
+            pieces = [line]
+
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece) + 1
+            if current_lines and current_tokens + piece_tokens > max_tokens:
+                sections.append('\n'.join(current_lines))
+                current_lines, current_tokens = [], 0
+            current_lines.append(piece)
+            current_tokens += piece_tokens
+
+    if current_lines:
+        sections.append('\n'.join(current_lines))
+    return [section for section in sections if section.strip()]
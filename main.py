@@ -1,21 +1,144 @@
 import concurrent.futures
 import os
+import time
 import shutil
 import yaml  # 导入YAML库
-from video_processor.splitter import split_media_to_audio_chunks_generator
-from video_processor.transcriber import transcribe_single_audio_chunk
+import metrics
+from utils import multiplex_generators
+from video_processor.splitter import split_media_to_audio_chunks_generator, get_media_duration
+from video_processor.boundary_planner import FixedBoundaryPlanner, SilenceBoundaryPlanner
+from video_processor.transcription_engine import submit_transcription, SiblingStats
+from video_processor.transcript_store import TimedTranscript, format_timestamp
+from video_processor.transcriber import (
+    get_asr_cache,
+    media_cache_key,
+    get_cached_media_transcripts,
+    save_media_chunk_manifest,
+)
+from llm_processor.generation import (
+    DEEPSEEK_BASE_URL,
+    DEEPSEEK_MODEL,
+    DEFAULT_TEMPERATURE,
+    DEFAULT_MAX_TOKENS,
+    generation_cache_key,
+    get_cached_completion,
+    save_completion,
+    replay_completion,
+    stream_chat_completion,
+)
+from llm_processor.mapreduce import map_reduce_generate
+from llm_processor.tokens import estimate_tokens
+from llm_processor.compaction import load_rules, compact_transcript, apply_token_budget, get_token_budget
+from llm_processor.retrieval import get_retrieval_settings, load_or_build_index, retrieve_passages
+from document_processor.extractor import extract_document_generator
+from config import LLM_CACHE_ENABLED, LLM_SINGLE_PASS_MAX_TOKENS, LLM_SECTION_TOKENS, LLM_MAP_WORKERS, LLM_REDUCE_MAX_TOKENS
+from config import DEEPSEEK_INPUT_PRICE_PER_MTOKENS
+from config import SPLIT_PLANNER, CHUNK_DURATION, CHUNK_TARGET_SECONDS, CHUNK_MIN_SECONDS, CHUNK_MAX_SECONDS
+from config import JOB_DEADLINE_SECONDS, METRICS_DIR
+from workspace import JobWorkspace, WorkspaceQuotaError, estimate_job_bytes
+from checkpoint import JobCheckpoint
 from openai import OpenAI  # 使用与DeepSeek兼容的OpenAI SDK
 
-def main_process_generator(input_path: str, doubao_app_id: str, doubao_token: str, deepseek_api_key: str, output_filename: str, query: str):
+VIDEO_EXTS = {'.mp4', '.mov', '.mpeg', '.webm'}
+AUDIO_EXTS = {'.mp3', '.m4a', '.wav', '.amr', '.mpga'}
+TEXT_EXTS = {'.txt', '.md', '.mdx', '.markdown', '.pdf', '.html', '.htm', '.xlsx', '.xls', '.doc', '.docx', '.csv', '.eml', '.msg', '.pptx', '.ppt', '.xml', '.epub'}
+SUPPORTED_EXTS = VIDEO_EXTS | AUDIO_EXTS | TEXT_EXTS
+
+def build_boundary_planner():
+    """根据配置创建音频切分点规划器。"""
+    if SPLIT_PLANNER == "silence":
+        return SilenceBoundaryPlanner(CHUNK_TARGET_SECONDS, CHUNK_MIN_SECONDS, CHUNK_MAX_SECONDS)
+    return FixedBoundaryPlanner(CHUNK_DURATION)
+
+def output_path_for_mode(output_filename: str, query: str, multi_mode: bool) -> str:
+    """单一模式沿用 `<文件名>.md`；多模式时每种模式写入 `<文件名>_<模式>.md`。"""
+    if not multi_mode:
+        return f"{output_filename}.md"
+    mode_slug = query.lower().replace('&', '')
+    return f"{output_filename}_{mode_slug}.md"
+
+def transcript_paths_for(output_filename: str) -> tuple[str, str]:
+    """音视频文字稿与其时间索引的保存路径 `<文件名>_transcript.txt` / `<文件名>_transcript.idx`，与生成结果放在一起。"""
+    return f"{output_filename}_transcript.txt", f"{output_filename}_transcript.idx"
+
+def main_process_generator(input_path: str, doubao_app_id: str, doubao_token: str, deepseek_api_key: str, output_filename: str, query: str | list[str], use_cache: bool = LLM_CACHE_ENABLED,
+                           workspace: JobWorkspace | None = None, priority: int = 0,
+                           deadline_seconds: float = JOB_DEADLINE_SECONDS, question: str = "",
+                           time_range: tuple[float, float] | None = None):
+    """
+    处理入口，参数与事件含义见 _process_in_workspace。
+    workspace: 本次任务的工作目录（音频块与文字稿写入其中）。未传入时自动创建，并在结束时按配置的清理策略处理；
+               由调用方传入时，清理由调用方负责（例如上传文件也放在同一目录中）。
+    在最终事件（done / persistent_error）之前产出 ("metrics", 汇总字典, Markdown 耗时表)；
+    "error" 事件不一定结束任务（如文字稿保存失败后仍继续生成），没有最终事件就结束时在最后产出 metrics。
+    任务结束后各环节的耗时与计数导出到 METRICS_DIR（见 metrics.py）。
+    """
+    owns_workspace = workspace is None
+    if owns_workspace:
+        try:
+            workspace = JobWorkspace.create()
+        except (WorkspaceQuotaError, OSError) as e:
+            yield "persistent_error", 0, f"**无法创建任务工作目录**\n\n{e}"
+            return
+
+    job_metrics = metrics.JobMetrics(workspace.job_id)
+    succeeded = False
+    try:
+        events = job_metrics.run_generator(_process_in_workspace(
+            input_path, doubao_app_id, doubao_token, deepseek_api_key,
+            output_filename, query, use_cache, workspace, priority, deadline_seconds, question, time_range))
+        metrics_emitted = False
+        for event in events:
+            if event[0] in ("done", "persistent_error") and not metrics_emitted:
+                summary = job_metrics.summary()
+                yield "metrics", summary, metrics.format_summary_table(summary)
+                metrics_emitted = True
+            if event[0] == "done":
+                succeeded = True
+            yield event
+        if not metrics_emitted:
+            summary = job_metrics.summary()
+            yield "metrics", summary, metrics.format_summary_table(summary)
+    finally:
+        if METRICS_DIR:
+            exported = job_metrics.export(METRICS_DIR)
+            if exported:
+                print(f"任务指标已导出: {exported[0]}, {exported[1]}")
+        if owns_workspace:
+            workspace.finish(succeeded)
+
+def _process_in_workspace(input_path: str, doubao_app_id: str, doubao_token: str, deepseek_api_key: str, output_filename: str, query: str | list[str], use_cache: bool,
+                          workspace: JobWorkspace, priority: int = 0, deadline_seconds: float = 0, question: str = "",
+                          time_range: tuple[float, float] | None = None):
     """
     修改版：使用 DeepSeek API 替代 Dify 和 OpenAI，并从外部 YAML 文件加载提示。
+    query: 单个生成类型（如 "Notes"），或多个生成类型的集合（如 ["Notes", "Q&A", "Quiz"]）。
+           传入集合时只转录一次，各类型的 DeepSeek 调用并发执行：
+           - "llm_chunk" 事件的第三个元素为所属类型；
+           - 每种类型完成时产出 ("mode_done", 保存路径, 类型)；
+           - 最终 "done" 事件的值为 {类型: 保存路径} 字典（单一类型时仍为保存路径）。
+    use_cache: 是否使用生成结果缓存；为 False 时总是重新调用 DeepSeek 且不写入缓存。
+    workspace: 本次任务的工作目录，音频块等中间文件写入其中，并发任务互不干扰。
+               已完成的阶段与音频块记录为检查点，对同一工作目录重新运行时只重做缺失的部分。
+               音视频的文字稿与时间索引不放在工作目录中，而是与生成结果一起保存（见 transcript_paths_for）。
+    priority: 本任务对语音识别与 DeepSeek 请求的调度优先级，数值越小越优先（见 scheduler.py）。
+    deadline_seconds: 本任务的总时间预算（秒），0 表示不限制。预算传给各层重试与轮询，
+                      剩余时间不足时不再重试，任务以超时失败结束。
+    question: 用户的问题（可为空）。Q&A 等在 prompts.yml 的 retrieval 中配置了检索的类型只放入与问题最相关的段落，
+              并使用 question_prompts 中的模板回答该问题；为空时按全文最突出的内容检索，仍生成问答对。
+    time_range: (开始秒, 结束秒)，只对音视频有效：按时间索引只取这一时间段的话语（每行带 [时:分:秒] 时间戳）
+                生成内容。转录结果来自缓存时不会重新转录，可用于只针对某一段重新生成笔记。
     """
-    output_dir = "output_chunks"
-    final_notes_save_path = f"{output_filename}.md"
+    deadline = time.monotonic() + deadline_seconds if deadline_seconds > 0 else None
+    output_dir = workspace.chunks_dir
+    transcript_save_path, transcript_index_path = transcript_paths_for(output_filename)
+    checkpoint = JobCheckpoint(workspace.path)
+    multi_mode = not isinstance(query, str)
+    queries = list(dict.fromkeys(query)) if multi_mode else [query]
     
-    video_exts = {'.mp4', '.mov', '.mpeg', '.webm'}
-    audio_exts = {'.mp3', '.m4a', '.wav', '.amr', '.mpga'}
-    text_exts = {'.txt', '.md', '.mdx', '.markdown', '.pdf', '.html', '.xlsx', '.xls', '.doc', '.docx', '.csv', '.eml', '.msg', '.pptx', '.ppt', '.xml', '.epub'}
+    video_exts = VIDEO_EXTS
+    audio_exts = AUDIO_EXTS
+    text_exts = TEXT_EXTS
 
     file_ext = os.path.splitext(input_path)[1].lower()
     current_progress = 0
@@ -34,14 +157,9 @@ def main_process_generator(input_path: str, doubao_app_id: str, doubao_token: st
     # --- 结束新增 ---
 
     # --- DeepSeek API 调用函数 ---
-    def run_deepseek_and_yield_results():
-        """直接调用 DeepSeek API 生成结果"""
+    def run_deepseek_and_yield_results(query: str, final_notes_save_path: str, transcript: str):
+        """直接调用 DeepSeek API 生成结果；transcript 为已压缩并按该类型预算裁剪的文字稿"""
         try:
-            client = OpenAI(
-                api_key=deepseek_api_key,
-                base_url="https://api.deepseek.com/v1"
-            )
-            
             # --- 修改: 从配置文件动态构建提示 ---
             query_key = query.lower()
             
@@ -51,40 +169,87 @@ def main_process_generator(input_path: str, doubao_app_id: str, doubao_token: st
                 yield "persistent_error", 0, f"**无效的操作类型**\n\n请求的操作 '{query}' 不是一个有效的选项。有效选项为: {valid_options}"
                 return
 
+            # 本任务此前已生成过该类型的内容（重试或继续执行时），直接回放保存的结果
+            stage_name = f"llm_{query_key.replace('&', '')}"
+            if checkpoint.load_stage(stage_name) is not None and os.path.exists(final_notes_save_path):
+                with open(final_notes_save_path, 'r', encoding='utf-8') as f:
+                    saved_response = f.read()
+                yield "sub_progress", 1.0, "✅ 已从检查点恢复生成结果"
+                for message_text in replay_completion(saved_response):
+                    yield "llm_chunk", message_text
+                yield "save_path", final_notes_save_path
+                return
+
             # 获取对应的 system role 和 user prompt 模板
             system_role = prompts_config['system_roles'].get(query_key, "你是一个通用的AI助手。")
             user_prompt_template = prompts_config['user_prompts'][query_key]
+            question_template = (prompts_config.get('question_prompts') or {}).get(query_key)
+            if question.strip() and question_template:
+                # 问题写入模板后再参与缓存键计算，不同问题不会命中彼此的结果
+                user_prompt_template = question_template.replace('{{question}}', question.strip())
             
             # 将文本内容替换到模板的占位符中
-            prompt = user_prompt_template.replace('{{transcript}}', full_transcript)
+            prompt = user_prompt_template.replace('{{transcript}}', transcript)
             # --- 结束修改 ---
-            
-            # 调用 DeepSeek API（流式响应）
-            response = client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": system_role},
-                    {"role": "user", "content": prompt}
-                ],
-                stream=True,
-                max_tokens=4000,
-                temperature=0.7
-            )
-            
-            # 处理流式响应
+
+            # 超出单次上下文预算的长文本改用分段生成 (map-reduce)
+            section_template = prompts_config.get('section_prompts', {}).get(query_key)
+            reduce_template = prompts_config.get('reduce_prompts', {}).get(query_key)
+            use_map_reduce = (estimate_tokens(prompt) > LLM_SINGLE_PASS_MAX_TOKENS
+                              and section_template is not None and reduce_template is not None)
+            prompt_version = user_prompt_template
+            if use_map_reduce:
+                prompt_version = "\n".join([user_prompt_template, section_template, reduce_template])
+
+            # 相同文字稿、操作类型、提示模板与模型参数的请求直接回放缓存结果
+            cache_key = generation_cache_key(transcript, query_key, system_role, prompt_version,
+                                             DEEPSEEK_MODEL, DEFAULT_TEMPERATURE, DEFAULT_MAX_TOKENS)
+            cached_completion = get_cached_completion(cache_key) if use_cache else None
+
             collected_messages = []
-            
-            for chunk in response:
-                if chunk.choices[0].delta.content is not None:
-                    message_text = chunk.choices[0].delta.content
+            if cached_completion is not None:
+                print("命中生成缓存，回放已保存的结果。")
+                for message_text in replay_completion(cached_completion):
                     collected_messages.append(message_text)
                     yield "llm_chunk", message_text
+            else:
+                client = OpenAI(
+                    api_key=deepseek_api_key,
+                    base_url=DEEPSEEK_BASE_URL,
+                    max_retries=0  # 限流重试由调度器统一处理
+                )
+
+                if use_map_reduce:
+                    print(f"文字稿约 {estimate_tokens(transcript)} tokens，超出单次预算，使用分段生成。")
+                    mapreduce_gen = map_reduce_generate(
+                        client, system_role, transcript, section_template, reduce_template,
+                        LLM_SECTION_TOKENS, LLM_SINGLE_PASS_MAX_TOKENS, LLM_MAP_WORKERS, LLM_REDUCE_MAX_TOKENS,
+                        priority=priority, deadline=deadline
+                    )
+                    for event_type, value, *rest in mapreduce_gen:
+                        if event_type == 'section_progress':
+                            total, stage = rest
+                            yield "sub_progress", value / total if total else 1.0, f"正在{stage}... ({value}/{total})"
+                        elif event_type == 'llm_chunk':
+                            collected_messages.append(value)
+                            yield "llm_chunk", value
+                else:
+                    # 调用 DeepSeek API（流式响应）
+                    for message_text in stream_chat_completion(client, system_role, prompt, priority=priority, deadline=deadline):
+                        collected_messages.append(message_text)
+                        yield "llm_chunk", message_text
+
+                if use_cache and collected_messages:
+                    save_completion(cache_key, ''.join(collected_messages))
             
             # 保存完整响应
             full_response = ''.join(collected_messages)
             try:
-                with open(final_notes_save_path, 'w', encoding='utf-8') as f:
-                    f.write(full_response)
+                os.makedirs(os.path.dirname(final_notes_save_path) or ".", exist_ok=True)
+                with metrics.span("file_write", file=os.path.basename(final_notes_save_path), bytes=len(full_response)):
+                    with open(final_notes_save_path, 'w', encoding='utf-8') as f:
+                        f.write(full_response)
+                checkpoint.save_stage(stage_name, {"path": final_notes_save_path})
                 yield "save_path", final_notes_save_path
             except IOError as e:
                 user_friendly_error = f"**保存最终文件失败**\n\n无法将生成的内容写入本地文件。\n\n**原始错误信息:**\n`{e}`"
@@ -94,21 +259,97 @@ def main_process_generator(input_path: str, doubao_app_id: str, doubao_token: st
             error_type = type(e).__name__
             if "Authentication" in error_type or "401" in str(e):
                 user_friendly_error = "**认证失败**\n\nDeepSeek API密钥无效或过期。请检查您的API密钥配置。"
+            elif "Timeout" in error_type and deadline is not None:
+                user_friendly_error = f"**超出时间预算**\n\n任务未能在 {deadline_seconds:.0f} 秒的时间预算内完成内容生成。"
             elif "RateLimit" in error_type:
                 user_friendly_error = "**请求限制**\n\n已达到DeepSeek API的速率限制。请稍后再试。"
             else:
                 user_friendly_error = f"**API错误**\n\n调用DeepSeek API时发生错误：\n`{str(e)}`"
             yield "persistent_error", 0, user_friendly_error
 
+    def select_transcript(compacted: str, query_key: str) -> str:
+        """
+        某一类型使用的文字稿：配置了检索且文字稿足够长时，只取与问题最相关的前 top_k 个段落
+        （索引按文字稿哈希缓存在 CACHE_DIR 中，文字稿不变时不重新构建）；否则按 token 预算在全文范围内裁剪。
+        配置了分段生成模板（section_prompts 与 reduce_prompts）的类型不做预算裁剪，超长文字稿交给分段生成处理。
+        """
+        budget = get_token_budget(prompts_config, query_key)
+        settings = get_retrieval_settings(prompts_config, query_key)
+        if settings is None or estimate_tokens(compacted) <= settings["min_tokens"]:
+            has_map_reduce = (query_key in (prompts_config.get('section_prompts') or {})
+                              and query_key in (prompts_config.get('reduce_prompts') or {}))
+            return compacted if has_map_reduce else apply_token_budget(compacted, budget)
+        with metrics.span("retrieval", mode=query_key):
+            index = load_or_build_index(compacted, settings["passage_tokens"])
+            return retrieve_passages(index, question, settings["top_k"], budget, settings["salient_terms"])
+
+    def prepare_transcripts(compact: bool):
+        """
+        (生成器) 压缩文字稿并按各类型的 token 预算裁剪（或检索相关段落），产出压缩前后的 token 数与预计节省的费用。
+        compact: 是否删除填充词与重复内容（只用于语音识别得到的文字稿），预算裁剪与检索总是生效。
+        返回 {类型: 该类型使用的文字稿}。
+        """
+        with metrics.span("compact_transcript") as attrs:
+            compacted = compact_transcript(full_transcript, load_rules(prompts_config)) if compact else full_transcript
+            transcripts = {q: select_transcript(compacted, q.lower()) for q in queries}
+            tokens_before = estimate_tokens(full_transcript)
+            tokens_after = {q: estimate_tokens(text) for q, text in transcripts.items()}
+            attrs.update(tokens_before=tokens_before, tokens_after=sum(tokens_after.values()))
+
+        # 每种类型都会发送一次文字稿，节省量按所有类型累计
+        saved_tokens = sum(tokens_before - tokens for tokens in tokens_after.values())
+        metrics.incr("transcript_tokens_saved", saved_tokens)
+        if saved_tokens > 0:
+            saved_cost = saved_tokens / 1_000_000 * DEEPSEEK_INPUT_PRICE_PER_MTOKENS
+            after_text = ", ".join(f"{q} {tokens}" for q, tokens in tokens_after.items()) if multi_mode else str(tokens_after[queries[0]])
+            message = (f"文字稿已压缩: 约 {tokens_before} → {after_text} tokens，"
+                       f"共节省约 {saved_tokens} 个输入 tokens (约 ¥{saved_cost:.4f})")
+            print(message)
+            yield "progress", current_progress / total_steps, message
+        return transcripts
+
+    def run_all_modes_and_yield_results(compact: bool = True):
+        """并发生成所有请求的内容类型，并将各自的事件按类型标记后多路复用"""
+        transcripts = yield from prepare_transcripts(compact)
+        generators = {
+            q: run_deepseek_and_yield_results(q, output_path_for_mode(output_filename, q, multi_mode), transcripts[q])
+            for q in queries
+        }
+        save_paths = {}
+        for mode, (event_type, value, *rest) in multiplex_generators(generators):
+            if event_type == "persistent_error":
+                prefix = f"**[{mode}]** " if multi_mode else ""
+                yield event_type, value, prefix + (rest[0] if rest else "")
+                return
+            elif event_type == "llm_chunk":
+                yield event_type, value, mode
+            elif event_type == "sub_progress":
+                yield event_type, value, f"[{mode}] {rest[0]}" if multi_mode else rest[0]
+            elif event_type == "save_path":
+                save_paths[mode] = value
+                yield "mode_done", value, mode
+        yield "save_paths", save_paths
+
     # === 文本文件工作流 ===
     if file_ext in text_exts:
         total_steps = 2
         yield "progress", 0 / total_steps, "步骤 1/2: 正在读取文本文档..."
-        try:
-            with open(input_path, 'r', encoding='utf-8') as f:
-                full_transcript = f.read()
-        except Exception as e:
-            user_friendly_error = f"**读取文件失败**\n\n无法读取您上传的文本文档 '{os.path.basename(input_path)}'。\n\n**原始错误信息:**\n`{e}`"
+        full_transcript = None
+        # 逐页的 'page' 事件不转发：生成需要完整的文字，界面上只显示页数进度，全文在 'result' 事件中取得
+        for event_type, *payload in extract_document_generator(input_path):
+            if event_type == "progress":
+                done_pages, total_pages = payload
+                if total_pages > 1:
+                    yield "sub_progress", done_pages / total_pages, f"正在提取文档文字... ({done_pages}/{total_pages} 页)"
+            elif event_type == "result":
+                full_transcript = payload[0]
+            elif event_type == "error":
+                user_friendly_error = f"**读取文件失败**\n\n无法读取您上传的文本文档 '{os.path.basename(input_path)}'。\n\n**原始错误信息:**\n`{payload[0]}`"
+                yield "persistent_error", 0, user_friendly_error
+                return
+        if not full_transcript or not full_transcript.strip():
+            user_friendly_error = (f"**读取文件失败**\n\n未能从 '{os.path.basename(input_path)}' 中提取到任何文字。"
+                                   "如果是扫描版 PDF，请先进行文字识别 (OCR) 后再上传。")
             yield "persistent_error", 0, user_friendly_error
             return
         
@@ -116,15 +357,16 @@ def main_process_generator(input_path: str, doubao_app_id: str, doubao_token: st
         yield "progress", current_progress / total_steps, "步骤 2/2: 正在调用DeepSeek模型生成内容..."
         
         final_path = None
-        deepseek_gen = run_deepseek_and_yield_results()
+        deepseek_gen = run_all_modes_and_yield_results(compact=False)
         for event_type, value, *rest in deepseek_gen:
             if event_type == "persistent_error":
                 yield event_type, value, rest[0] if rest else ""
                 return
-            elif event_type == "llm_chunk":
-                yield event_type, value
-            elif event_type == "save_path":
-                final_path = value
+            elif event_type == "save_paths":
+                if len(value) == len(queries):
+                    final_path = value if multi_mode else value[queries[0]]
+            else:
+                yield event_type, value, *rest
                 
         if final_path:
             current_progress += 1
@@ -138,77 +380,206 @@ def main_process_generator(input_path: str, doubao_app_id: str, doubao_token: st
         total_steps = 4 if is_video else 3
         
         step_name = "视频" if is_video else "音频"
-        yield "progress", current_progress / total_steps, f"步骤 {current_progress + 1}/{total_steps}: 正在切分{step_name}为音频块..."
+        planner = build_boundary_planner()
+
+        # 检查点中的音频块序号只对同一套切分参数有效，参数变化时丢弃旧的音频块检查点
+        plan_checkpoint = checkpoint.load_stage("plan")
+        if plan_checkpoint is None or plan_checkpoint.get("signature") != planner.cache_signature:
+            checkpoint.clear_chunks()
+            checkpoint.save_stage("plan", {"signature": planner.cache_signature})
+            split_checkpoint = None
+        else:
+            split_checkpoint = checkpoint.load_stage("split")
+        checkpointed_transcripts = checkpoint.load_chunks()
+        num_checkpointed_chunks = split_checkpoint["num_chunks"] if split_checkpoint else None
+
+        # 整份媒体的转录结果已全部缓存时，跳过切分与转录，直接进入 DeepSeek 步骤
+        restored_from_checkpoint = bool(num_checkpointed_chunks) and all(
+            i in checkpointed_transcripts for i in range(num_checkpointed_chunks))
+        media_key, cached_transcripts = None, None
+        if not restored_from_checkpoint:
+            try:
+                media_key = media_cache_key(input_path, planner.cache_signature)
+                cached_transcripts = get_cached_media_transcripts(media_key)
+            except OSError as e:
+                print(f"警告：查询转录缓存失败: {e}")
+
+        if restored_from_checkpoint:
+            all_transcripts = [checkpointed_transcripts[i] for i in range(num_checkpointed_chunks)]
+            current_progress += 2
+            yield "sub_progress", 1.0, f"✅ 已从检查点恢复全部 {len(all_transcripts)} 个音频块的转录结果"
+            yield "progress", current_progress / total_steps, "所有音频块转录完成！"
+        elif cached_transcripts is not None:
+            all_transcripts = cached_transcripts
+            current_progress += 2
+            yield "sub_progress", 1.0, f"✅ 命中转录缓存，跳过切分与转录 ({len(all_transcripts)} 个音频块)"
+            yield "progress", current_progress / total_steps, "所有音频块转录完成！"
+        else:
+            # 切分出的音频块会写入工作目录，开始前确认磁盘配额足够
+            try:
+                workspace.reserve(estimate_job_bytes(input_path, get_media_duration(input_path)))
+            except WorkspaceQuotaError as e:
+                yield "persistent_error", 0, f"**磁盘空间不足**\n\n{e}"
+                return
+
+            yield "progress", current_progress / total_steps, f"步骤 {current_progress + 1}/{total_steps}: 正在切分{step_name}并同步转录音频块..."
+            
+            # 切分与转录流水线并行：每写完一个音频块就立即提交给异步转录引擎
+            # 检查点中已转录的音频块不再提交；切分已完成且音频块文件仍在时连切分也跳过
+            audio_chunks = []
+            future_to_index = {}
+            transcripts_by_index = dict(checkpointed_transcripts)
+            failed_chunks = {}
+            siblings = SiblingStats()  # 同批音频块的转录耗时，用于对冲拖后腿的音频块
+            num_split, num_expected = 0, 0
+            if split_checkpoint and all(os.path.exists(chunk) for chunk in split_checkpoint["chunks"]):
+                splitter_generator = iter([
+                    *(('chunk', index, chunk) for index, chunk in enumerate(split_checkpoint["chunks"])),
+                    ('progress', num_checkpointed_chunks, num_checkpointed_chunks),
+                    ('result', split_checkpoint["chunks"]),
+                ])
+            else:
+                splitter_generator = split_media_to_audio_chunks_generator(input_path, output_dir, planner=planner)
+            if transcripts_by_index:
+                yield "sub_progress", 0.0, f"✅ 已从检查点恢复 {len(transcripts_by_index)} 个音频块的转录结果，只转录其余部分"
+
+            def collect_transcripts(futures):
+                """收集已完成的转录结果并写入检查点；失败的音频块记录在 failed_chunks 中，不影响其他块。"""
+                for future in futures:
+                    index = future_to_index[future]
+                    try:
+                        result = future.result()
+                        if result is None:
+                            raise Exception(f"转录任务未返回有效文本 (块索引: {index})。")
+                    except concurrent.futures.CancelledError:
+                        continue
+                    except Exception as e:
+                        failed_chunks[index] = e
+                        continue
+                    transcripts_by_index[index] = result
+                    checkpoint.save_chunk(index, result)
+
+            def pipeline_status():
+                """两个阶段各自的进度，作为 sub_progress 事件。"""
+                total = max(num_expected, len(future_to_index), 1)
+                fraction = (num_split + len(transcripts_by_index)) / (2 * total)
+                return "sub_progress", fraction, f"正在切分... ({num_split}/{total}) | 正在转录... ({len(transcripts_by_index)}/{total})"
+
+            try:
+                for event_type, val1, *val2 in splitter_generator:
+                    if event_type == 'chunk':
+                        if val1 not in transcripts_by_index:
+                            future_to_index[submit_transcription(
+                                val2[0], doubao_app_id, doubao_token, priority, deadline=deadline, siblings=siblings)] = val1
+                    elif event_type == 'progress':
+                        num_split, num_expected = val1, val2[0]
+                    elif event_type == 'result':
+                        audio_chunks = val1
+                        checkpoint.save_stage("split", {"chunks": audio_chunks, "num_chunks": len(audio_chunks)})
+                    elif event_type == 'error':
+                        # 已完成的转录先写入检查点，再取消其余任务
+                        collect_transcripts([f for f in future_to_index if f.done()])
+                        for future in future_to_index:
+                            future.cancel()
+                        user_friendly_error = f"**媒体文件切分失败**\n\n无法处理您上传的媒体文件。\n\n**原始错误信息:**\n`{val1}`"
+                        yield "persistent_error", 0, user_friendly_error
+                        return
+
+                    collect_transcripts([f for f in future_to_index if f.done()
+                                         and future_to_index[f] not in transcripts_by_index
+                                         and future_to_index[f] not in failed_chunks])
+                    if event_type == 'progress':
+                        yield pipeline_status()
         
-        splitter_generator = split_media_to_audio_chunks_generator(input_path, output_dir, 600)
-        audio_chunks = []
+                if not audio_chunks:
+                    yield "persistent_error", 0, f"**{step_name}切分失败**\n\n未能从您的文件中提取出任何音频块。"
+                    return
         
-        for event_type, val1, *val2 in splitter_generator:
-            if event_type == 'progress':
-                completed, total = val1, val2[0]
-                yield "sub_progress", completed / total, f"正在切分... ({completed}/{total})"
-            elif event_type == 'result':
-                audio_chunks = val1
-            elif event_type == 'error':
-                user_friendly_error = f"**媒体文件切分失败**\n\n无法处理您上传的媒体文件。\n\n**原始错误信息:**\n`{val1}`"
+                current_progress += 1
+                yield "progress", current_progress / total_steps, f"✅ {step_name}切分完成，等待剩余 {len(audio_chunks) - len(transcripts_by_index)} 个音频块转录..."
+
+                # 某个音频块失败时继续等待其余音频块完成，让它们的结果进入检查点
+                pending = [f for f in future_to_index
+                           if future_to_index[f] not in transcripts_by_index and future_to_index[f] not in failed_chunks]
+                remaining_budget = deadline - time.monotonic() if deadline is not None else None
+                for future in concurrent.futures.as_completed(pending, timeout=remaining_budget):
+                    collect_transcripts([future])
+                    yield pipeline_status()
+
+            except concurrent.futures.TimeoutError:
+                for future in future_to_index:
+                    future.cancel()
+                user_friendly_error = (
+                    f"**超出时间预算**\n\n任务未能在 {deadline_seconds:.0f} 秒的时间预算内完成转录，"
+                    f"已完成的 {len(transcripts_by_index)} 个音频块已保存，重试时只会转录其余部分。")
                 yield "persistent_error", 0, user_friendly_error
                 return
-        
-        if not audio_chunks:
-            yield "persistent_error", 0, f"**{step_name}切分失败**\n\n未能从您的文件中提取出任何音频块。"
-            return
-        
-        yield "sub_progress", 1.0, f"✅ {step_name}切分全部完成！"
-        current_progress += 1
-        yield "progress", current_progress / total_steps, f"✅ {step_name}切分完成，准备开始转录..."
 
-        yield "progress", current_progress / total_steps, f"步骤 {current_progress + 1}/{total_steps}: 正在并行转录 {len(audio_chunks)} 个音频块..."
-        all_transcripts = [None] * len(audio_chunks)
-        num_transcribed = 0
+            except Exception as e:
+                for future in future_to_index:
+                    future.cancel()
+                user_friendly_error = f"**音频转录失败**\n\n在连接语音识别服务进行语音转文字时发生错误。\n\n**原始错误信息:**\n`{e}`"
+                yield "persistent_error", 0, user_friendly_error
+                return
 
-        try:
-            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                future_to_index = {
-                    executor.submit(transcribe_single_audio_chunk, chunk, doubao_app_id, doubao_token): i
-                    for i, chunk in enumerate(audio_chunks)
-                }
-                for future in concurrent.futures.as_completed(future_to_index):
-                    index = future_to_index[future]
-                    result = future.result() 
-                    if result is not None:
-                        all_transcripts[index] = result
-                    else:
-                        raise Exception(f"转录任务未返回有效文本 (块索引: {index})。")
-                    
-                    num_transcribed += 1
-                    yield "sub_progress", num_transcribed / len(audio_chunks), f"正在转录... ({num_transcribed}/{len(audio_chunks)})"
+            if failed_chunks:
+                first_error = failed_chunks[min(failed_chunks)]
+                user_friendly_error = (
+                    f"**音频转录失败**\n\n{len(failed_chunks)} 个音频块在多次尝试后仍然转录失败，"
+                    f"其余 {len(transcripts_by_index)} 个音频块的结果已保存，重试时只会转录失败的部分。"
+                    f"\n\n**原始错误信息:**\n`{first_error}`")
+                yield "persistent_error", 0, user_friendly_error
+                return
 
-        except Exception as e:
-            user_friendly_error = f"**音频转录失败**\n\n在连接语音识别服务进行语音转文字时发生错误。\n\n**原始错误信息:**\n`{e}`"
-            yield "persistent_error", 0, user_friendly_error
-            return
-        
-        if any(t is None for t in all_transcripts):
-            yield "persistent_error", 0, "**音频转录不完整**\n\n部分音频块在多次尝试后仍然转录失败。"
-            return
+            # 按块顺序重新拼装文字稿
+            all_transcripts = [transcripts_by_index.get(i) for i in range(len(audio_chunks))]
+            if any(t is None for t in all_transcripts):
+                yield "persistent_error", 0, "**音频转录不完整**\n\n部分音频块在多次尝试后仍然转录失败。"
+                return
 
-        yield "sub_progress", 1.0, "✅ 音频转录全部完成！"
-        current_progress += 1
-        yield "progress", current_progress / total_steps, "所有音频块转录完成！"
-        shutil.rmtree(output_dir, ignore_errors=True)
+            yield "sub_progress", 1.0, "✅ 音频转录全部完成！"
+            current_progress += 1
+            yield "progress", current_progress / total_steps, "所有音频块转录完成！"
+            if media_key is not None:
+                try:
+                    save_media_chunk_manifest(media_key, audio_chunks)
+                except OSError as e:
+                    print(f"警告：记录转录缓存清单失败: {e}")
+            stats = get_asr_cache().stats()
+            print(f"转录缓存: 命中 {stats['hits']} 次, 未命中 {stats['misses']} 次")
+            if siblings.hedges:
+                print(f"对冲请求: {siblings.hedges} 个拖后腿的音频块发送了备份请求")
+            shutil.rmtree(output_dir, ignore_errors=True)
 
         if is_video:
             yield "progress", current_progress / total_steps, f"步骤 {current_progress + 1}/{total_steps}: 正在汇总文字稿并保存..."
         
-        full_transcript = "\n\n".join(filter(None, all_transcripts))
+        full_transcript = "\n\n".join(filter(None, (result["text"] for result in all_transcripts)))
         
-        transcript_save_path = "source_transcript.txt"
         try:
-            with open(transcript_save_path, 'w', encoding='utf-8') as f:
-                f.write(full_transcript)
+            os.makedirs(os.path.dirname(transcript_save_path) or ".", exist_ok=True)
+            with metrics.span("file_write", file=os.path.basename(transcript_save_path), bytes=len(full_transcript)):
+                with open(transcript_save_path, 'w', encoding='utf-8') as f:
+                    f.write(full_transcript)
         except IOError as e:
             yield "error", 0, f"无法保存文字稿文件: {e}"
 
+        # 带时间戳的话语另存为按时间索引的二进制文件（见 video_processor/transcript_store.py）
+        timed_transcript = TimedTranscript.from_chunks(all_transcripts)
+        try:
+            timed_transcript.save(transcript_index_path)
+        except OSError as e:
+            print(f"警告：保存文字稿时间索引失败: {e}")
+
+        # 指定了时间段时只用这一段的话语生成内容，每行带时间戳，生成的笔记可以引用时间点
+        if time_range is not None:
+            start_ms, end_ms = (round(seconds * 1000) for seconds in time_range)
+            full_transcript = timed_transcript.text_between(start_ms, end_ms, timestamps=True)
+            if not full_transcript.strip():
+                yield "persistent_error", 0, (f"**无法按时间段生成**\n\n{format_timestamp(start_ms)} - {format_timestamp(end_ms)} "
+                                              f"内没有识别到任何话语（全长 {format_timestamp(timed_transcript.duration_ms)}）。")
+                return
+
         if is_video:
             current_progress += 1
             yield "progress", current_progress / total_steps, "文字稿汇总完成。"
@@ -216,15 +587,16 @@ def main_process_generator(input_path: str, doubao_app_id: str, doubao_token: st
         yield "progress", current_progress / total_steps, f"步骤 {current_progress + 1}/{total_steps}: 正在调用DeepSeek模型生成内容..."
 
         final_path = None
-        deepseek_gen = run_deepseek_and_yield_results()
+        deepseek_gen = run_all_modes_and_yield_results()
         for event_type, value, *rest in deepseek_gen:
             if event_type == "persistent_error":
                 yield event_type, value, rest[0] if rest else ""
                 return
-            elif event_type == "llm_chunk":
-                yield event_type, value
-            elif event_type == "save_path":
-                final_path = value
+            elif event_type == "save_paths":
+                if len(value) == len(queries):
+                    final_path = value if multi_mode else value[queries[0]]
+            else:
+                yield event_type, value, *rest
         
         if final_path:
             current_progress += 1
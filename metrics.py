@@ -0,0 +1,245 @@
+# metrics.py
+# 任务级的计时与计数：记录各处理环节的耗时区间（span）以及重试、缓存命中、限流等计数器，
+# 任务结束时导出为 JSON 跟踪文件（Chrome Trace 格式，可在 chrome://tracing 或 Perfetto 中打开）
+# 与 Prometheus 文本格式的指标文件，并汇总为各环节耗时表。
+#
+# 当前任务与音频块通过 contextvars 传递，各模块只需调用 span() / incr()，不必层层传参；
+# 不在任务中调用时（例如单独使用某个模块）这些调用不做任何记录。
+# 跨线程时需要显式复制上下文（contextvars.copy_context().run），asyncio 任务与 asyncio.to_thread 会自动继承。
+import os
+import json
+import time
+import threading
+import contextlib
+import contextvars
+
+METRIC_PREFIX = "learning_assistant"
+
+_current_job = contextvars.ContextVar("job_metrics", default=None)
+_current_chunk = contextvars.ContextVar("chunk_id", default=None)
+
+class JobMetrics:
+    """单个任务的耗时区间与计数器，可在多个线程和事件循环中同时记录。"""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans = []
+        self.counters = {}
+
+    def record(self, name: str, start: float, duration: float, chunk: str | None = None, **attrs):
+        """记录一个耗时区间；start 为 time.perf_counter() 时间戳。"""
+        span = {
+            "name": name,
+            "job_id": self.job_id,
+            "chunk": chunk,
+            "start": start - self._origin,
+            "duration": duration,
+            "thread": threading.current_thread().name,
+            "attrs": attrs,
+        }
+        with self._lock:
+            self.spans.append(span)
+
+    def incr(self, name: str, amount: float = 1, **labels):
+        """计数器加 amount；labels 区分同名计数器的不同维度（如缓存名称、函数名）。"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def run_generator(self, generator):
+        """
+        (生成器) 在绑定本任务的独立上下文中驱动 generator，原样产出其事件。
+        生成器的每一步都可能在不同线程中被调用，因此不用 ContextVar.set/reset，而是每一步都进入同一个上下文。
+        """
+        context = contextvars.copy_context()
+        context.run(_current_job.set, self)
+        try:
+            while True:
+                try:
+                    item = context.run(next, generator)
+                except StopIteration:
+                    return
+                yield item
+        finally:
+            context.run(generator.close)
+
+    # --- 汇总与导出 ---
+
+    def summary(self) -> dict:
+        """按区间名称汇总次数与耗时，并附上计数器与 DeepSeek 输出速度。"""
+        with self._lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+
+        durations = {}
+        for span in spans:
+            durations.setdefault(span["name"], []).append(span["duration"])
+        stages = []
+        for name, values in durations.items():
+            values.sort()
+            stages.append({
+                "name": name,
+                "count": len(values),
+                "total": sum(values),
+                "mean": sum(values) / len(values),
+                "p95": values[max(0, -(-95 * len(values) // 100) - 1)],
+                "max": values[-1],
+            })
+
+        llm_spans = [span for span in spans if span["name"] == "llm_stream"]
+        llm_tokens = sum(span["attrs"].get("output_tokens", 0) for span in llm_spans)
+        llm_seconds = sum(span["attrs"].get("generation_seconds", 0) for span in llm_spans)
+        first_token = durations.get("llm_first_token", [])
+        return {
+            "job_id": self.job_id,
+            "wall_seconds": time.perf_counter() - self._origin,
+            "stages": stages,
+            "counters": {_format_counter(name, labels): value for (name, labels), value in counters.items()},
+            "llm": {
+                "requests": len(llm_spans),
+                "output_tokens": llm_tokens,
+                "tokens_per_second": llm_tokens / llm_seconds if llm_seconds > 0 else 0.0,
+                "mean_first_token_seconds": sum(first_token) / len(first_token) if first_token else 0.0,
+            },
+        }
+
+    def to_trace(self) -> dict:
+        """导出为 Chrome Trace 事件格式；每个线程一行，区间属性放在 args 中。"""
+        with self._lock:
+            spans = list(self.spans)
+        thread_ids = {}
+        events = []
+        for span in spans:
+            tid = thread_ids.setdefault(span["thread"], len(thread_ids) + 1)
+            args = {"job_id": span["job_id"], **span["attrs"]}
+            if span["chunk"] is not None:
+                args["chunk"] = span["chunk"]
+            events.append({
+                "name": span["name"], "ph": "X", "pid": 1, "tid": tid,
+                "ts": round(span["start"] * 1e6), "dur": round(span["duration"] * 1e6), "args": args,
+            })
+        for thread_name, tid in thread_ids.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": thread_name}})
+        return {"traceEvents": events, "otherData": {"job_id": self.job_id, "started_at": self.started_at}}
+
+    def to_prometheus(self) -> str:
+        """导出为 Prometheus 文本格式：各环节耗时为 summary（_sum/_count），计数器为 counter。"""
+        summary = self.summary()
+        job_label = f'job_id="{_escape_label(self.job_id)}"'
+        lines = [
+            f"# HELP {METRIC_PREFIX}_stage_seconds 各处理环节的耗时",
+            f"# TYPE {METRIC_PREFIX}_stage_seconds summary",
+        ]
+        for stage in summary["stages"]:
+            labels = f'{job_label},stage="{_escape_label(stage["name"])}"'
+            lines.append(f"{METRIC_PREFIX}_stage_seconds_sum{{{labels}}} {stage['total']:.6f}")
+            lines.append(f"{METRIC_PREFIX}_stage_seconds_count{{{labels}}} {stage['count']}")
+
+        with self._lock:
+            counters = dict(self.counters)
+        for name in sorted({name for name, _ in counters}):
+            metric = f"{METRIC_PREFIX}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (counter_name, labels), value in sorted(counters.items()):
+                if counter_name != name:
+                    continue
+                label_text = "".join(f',{key}="{_escape_label(str(val))}"' for key, val in labels)
+                lines.append(f"{metric}{{{job_label}{label_text}}} {value:g}")
+
+        llm = summary["llm"]
+        lines.append(f"# TYPE {METRIC_PREFIX}_llm_tokens_per_second gauge")
+        lines.append(f"{METRIC_PREFIX}_llm_tokens_per_second{{{job_label}}} {llm['tokens_per_second']:.3f}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_job_wall_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_job_wall_seconds{{{job_label}}} {summary['wall_seconds']:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, output_dir: str) -> tuple[str, str] | None:
+        """将跟踪文件与指标文件写入 output_dir，返回两者路径；写入失败只打印警告。"""
+        trace_path = os.path.join(output_dir, f"{self.job_id}.trace.json")
+        metrics_path = os.path.join(output_dir, f"{self.job_id}.prom")
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            with open(trace_path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_trace(), f, ensure_ascii=False)
+            with open(metrics_path, 'w', encoding='utf-8') as f:
+                f.write(self.to_prometheus())
+        except OSError as e:
+            print(f"警告：导出任务指标失败: {e}")
+            return None
+        return trace_path, metrics_path
+
+def _format_counter(name: str, labels: tuple) -> str:
+    if not labels:
+        return name
+    return f"{name}{{{','.join(f'{key}={value}' for key, value in labels)}}}"
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_summary_table(summary: dict) -> str:
+    """把 JobMetrics.summary() 的结果格式化为 Markdown 表格（Streamlit 与命令行共用）。"""
+    lines = [
+        f"任务 `{summary['job_id']}` 总耗时 {summary['wall_seconds']:.1f} 秒",
+        "",
+        "| 环节 | 次数 | 累计(s) | 平均(s) | P95(s) | 最大(s) |",
+        "| --- | ---: | ---: | ---: | ---: | ---: |",
+    ]
+    for stage in sorted(summary["stages"], key=lambda s: -s["total"]):
+        lines.append(f"| {stage['name']} | {stage['count']} | {stage['total']:.2f} | {stage['mean']:.2f} "
+                     f"| {stage['p95']:.2f} | {stage['max']:.2f} |")
+    llm = summary["llm"]
+    if llm["requests"]:
+        lines.append("")
+        lines.append(f"DeepSeek: {llm['requests']} 次请求, 首个 token 平均 {llm['mean_first_token_seconds']:.2f} 秒, "
+                     f"输出约 {llm['output_tokens']} tokens ({llm['tokens_per_second']:.1f} tokens/秒)")
+    if summary["counters"]:
+        lines.append("")
+        lines.append("计数: " + ", ".join(f"{name}={value:g}" for name, value in sorted(summary["counters"].items())))
+    return "\n".join(lines)
+
+# --- 在任务上下文中记录 ---
+
+def current_job_metrics() -> JobMetrics | None:
+    """当前上下文所属任务的 JobMetrics；不在任务中时返回 None。"""
+    return _current_job.get()
+
+def current_chunk_id() -> str | None:
+    return _current_chunk.get()
+
+@contextlib.contextmanager
+def chunk_scope(chunk_id: str):
+    """在代码块内把之后记录的区间归属到指定音频块。"""
+    token = _current_chunk.set(chunk_id)
+    try:
+        yield
+    finally:
+        _current_chunk.reset(token)
+
+@contextlib.contextmanager
+def span(name: str, chunk: str | None = None, **attrs):
+    """
+    记录代码块的耗时；产出的字典可在代码块内补充属性（如 token 数）。
+    代码块抛出异常时记录 error 属性后继续向上抛出。
+    """
+    metrics = _current_job.get()
+    if metrics is None:
+        yield attrs
+        return
+    chunk = chunk if chunk is not None else _current_chunk.get()
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        metrics.record(name, start, time.perf_counter() - start, chunk, **attrs)
+
+def incr(name: str, amount: float = 1, **labels):
+    """当前任务的计数器加 amount；不在任务中时忽略。"""
+    metrics = _current_job.get()
+    if metrics is not None:
+        metrics.incr(name, amount, **labels)
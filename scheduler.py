@@ -0,0 +1,263 @@
+# scheduler.py
+# 按服务商（豆包语音识别、DeepSeek）共享的请求调度器：
+# 令牌桶限制每秒请求数，槽位限制并发任务数，等待中的请求按任务优先级排队；
+# 收到限流（429 / 配额类状态码）反馈时，整个服务商暂停一段指数增长的时间并降低发送速率，
+# 之后随着请求成功逐步恢复，避免所有调用方在固定的重试间隔后同时再次打满接口。
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+import contextlib
+import metrics
+from config import (
+    DOUBAO_REQUESTS_PER_SECOND, DOUBAO_MAX_CONCURRENCY,
+    DEEPSEEK_REQUESTS_PER_SECOND, DEEPSEEK_MAX_CONCURRENCY,
+    RATE_LIMIT_BACKOFF_BASE, RATE_LIMIT_BACKOFF_MAX,
+)
+
+# 限流后发送速率降为原来的比例，以及每次成功后恢复的比例（相对于配置的速率）
+THROTTLE_RATE_FACTOR = 0.5
+RECOVERY_RATE_STEP = 0.05
+# 限流降速后的最低速率（相对于配置的速率）
+MIN_RATE_FRACTION = 0.05
+
+class RateLimitedError(Exception):
+    """服务商返回限流或配额不足，retry_after 为服务端建议的等待秒数（可能为 None）。"""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def parse_retry_after(value) -> float | None:
+    """解析 Retry-After 响应头（秒数），无法解析时返回 None。"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+class _Waiter:
+    """一个等待槽位的请求；grant 在调度线程中被调用，通知等待方可以发送请求。"""
+
+    def __init__(self, grant):
+        self.grant = grant
+        self.cancelled = False
+
+class ProviderScheduler:
+    """
+    单个服务商的调度器。
+    - 令牌桶：容量为 burst，按 requests_per_second 补充，每个请求消耗一个令牌；
+      requests_per_second <= 0 表示不限制速率（只受并发槽位与限流暂停约束）；
+    - 并发槽位：同时进行中的任务数不超过 max_concurrency（任务结束时 release）；
+    - 优先级：等待中的请求按 (priority, 提交顺序) 出队，数值越小越优先；
+    - 只取令牌：acquire_token_async 只消耗令牌、不占用并发槽位，用于查询已提交任务的结果等请求，
+      使这些请求同样受每秒请求数与限流暂停的约束；
+    - 限流反馈：report_throttled 暂停发放令牌 retry_after 或指数退避的时间，并把速率减半；
+      report_success 逐步把速率恢复到配置值。
+    同一个调度器可以同时被线程（acquire）与 asyncio 协程（acquire_async）使用。
+    """
+
+    def __init__(self, name: str, requests_per_second: float, max_concurrency: int, burst: float | None = None):
+        self.name = name
+        self.requests_per_second = requests_per_second
+        self.max_concurrency = max_concurrency
+        self.burst = burst if burst is not None else max(1.0, requests_per_second)
+        self._rate = requests_per_second
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._consecutive_throttles = 0
+        self._active = 0
+        self._waiters = []
+        self._token_waiters = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._dispatcher = None
+        self.granted = 0
+        self.tokens_granted = 0
+        self.throttled = 0
+
+    def configure(self, requests_per_second: float | None = None, max_concurrency: int | None = None):
+        """调整速率或并发上限（对之后的请求生效）。"""
+        with self._condition:
+            if requests_per_second is not None:
+                self.requests_per_second = requests_per_second
+                self._rate = requests_per_second
+                self.burst = max(1.0, requests_per_second)
+                self._tokens = min(self._tokens, self.burst)
+            if max_concurrency is not None:
+                self.max_concurrency = max_concurrency
+            self._condition.notify_all()
+
+    # --- 获取与释放槽位 ---
+
+    def _enqueue(self, priority: int, grant, needs_slot: bool = True) -> _Waiter:
+        waiter = _Waiter(grant)
+        with self._condition:
+            heapq.heappush(self._waiters if needs_slot else self._token_waiters, (priority, next(self._sequence), waiter))
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name=f"{self.name}-scheduler", daemon=True)
+                self._dispatcher.start()
+            self._condition.notify_all()
+        return waiter
+
+    def acquire(self, priority: int = 0):
+        """(阻塞) 等待获得一个令牌与一个并发槽位。"""
+        granted = threading.Event()
+        self._enqueue(priority, granted.set)
+        granted.wait()
+
+    async def acquire_async(self, priority: int = 0):
+        """(协程) 等待获得一个令牌与一个并发槽位；等待期间被取消时不会占用槽位。"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enqueue(priority, grant)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._condition:
+                waiter.cancelled = True
+                granted = waiter.grant is None
+            if granted:
+                self.release()
+            raise
+
+    async def acquire_token_async(self, priority: int = 0):
+        """(协程) 只等待一个令牌（不占用并发槽位，无需 release），例如查询已提交任务的结果。"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enqueue(priority, grant, needs_slot=False)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._condition:
+                waiter.cancelled = True
+            raise
+
+    def release(self):
+        """任务结束，归还并发槽位。"""
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, priority: int = 0):
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextlib.asynccontextmanager
+    async def async_slot(self, priority: int = 0):
+        await self.acquire_async(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    # --- 限流反馈 ---
+
+    @property
+    def rate_limited(self) -> bool:
+        """是否限制每秒请求数（requests_per_second <= 0 时不限制）。"""
+        return self.requests_per_second > 0
+
+    @property
+    def paused(self) -> bool:
+        """是否处于限流后的暂停期。"""
+        with self._condition:
+            return time.monotonic() < self._paused_until
+
+    def report_throttled(self, retry_after: float | None = None):
+        """服务商返回限流：暂停发放令牌并降低速率。连续限流时暂停时间指数增长。"""
+        with self._condition:
+            self.throttled += 1
+            self._consecutive_throttles += 1
+            backoff = min(RATE_LIMIT_BACKOFF_MAX, RATE_LIMIT_BACKOFF_BASE * 2 ** (self._consecutive_throttles - 1))
+            pause = retry_after if retry_after is not None else random.uniform(backoff / 2, backoff)
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            self._rate = max(self.requests_per_second * MIN_RATE_FRACTION, self._rate * THROTTLE_RATE_FACTOR)
+            self._tokens = 0.0
+            rate_text = f"速率降至 {self._rate:.2f} 次/秒" if self.rate_limited else "不限速"
+            print(f"  > ⚠️ {self.name} 触发限流，暂停 {pause:.1f} 秒，{rate_text}")
+            self._condition.notify_all()
+        metrics.incr("throttled", provider=self.name)
+
+    def report_success(self):
+        """请求成功：清零连续限流计数，并逐步恢复速率。"""
+        with self._condition:
+            self._consecutive_throttles = 0
+            if self._rate < self.requests_per_second:
+                self._rate = min(self.requests_per_second, self._rate + self.requests_per_second * RECOVERY_RATE_STEP)
+
+    # --- 调度线程 ---
+
+    def _refill(self, now: float):
+        """(需持有锁) 按当前速率补充令牌。"""
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+
+    def _dispatch_loop(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                # 丢弃已取消的等待者
+                for waiters in (self._waiters, self._token_waiters):
+                    while waiters and waiters[0][2].cancelled:
+                        heapq.heappop(waiters)
+
+                # 并发槽位已满时，只取令牌的请求仍可出队
+                ready = [waiters for waiters in (self._waiters, self._token_waiters) if waiters
+                         and (waiters is self._token_waiters or self._active < self.max_concurrency)]
+                if not ready:
+                    self._condition.wait()
+                    continue
+                if now < self._paused_until:
+                    self._condition.wait(self._paused_until - now)
+                    continue
+                if self.rate_limited and self._tokens < 1:
+                    self._condition.wait((1 - self._tokens) / self._rate)
+                    continue
+
+                waiters = min(ready, key=lambda queue: queue[0][:2])
+                _, _, waiter = heapq.heappop(waiters)
+                if self.rate_limited:
+                    self._tokens -= 1
+                if waiters is self._waiters:
+                    self._active += 1
+                    self.granted += 1
+                else:
+                    self.tokens_granted += 1
+                grant, waiter.grant = waiter.grant, None
+                grant()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "granted": self.granted,
+                "tokens_granted": self.tokens_granted,
+                "throttled": self.throttled,
+                "active": self._active,
+                "waiting": len(self._waiters) + len(self._token_waiters),
+                "rate": self._rate,
+            }
+
+_providers = {
+    "doubao": ProviderScheduler("doubao", DOUBAO_REQUESTS_PER_SECOND, DOUBAO_MAX_CONCURRENCY),
+    "deepseek": ProviderScheduler("deepseek", DEEPSEEK_REQUESTS_PER_SECOND, DEEPSEEK_MAX_CONCURRENCY),
+}
+
+def get_provider_scheduler(name: str) -> ProviderScheduler:
+    """返回进程内共享的服务商调度器（"doubao" 或 "deepseek"）。"""
+    return _providers[name]
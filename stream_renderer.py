@@ -0,0 +1,97 @@
+# stream_renderer.py
+# 流式输出的增量渲染：把 DeepSeek 的增量文本合并后按时间或字数节流渲染，
+# 已完成的 Markdown 段落（空行分隔、不在代码块内）各自固定在独立的元素中不再重绘，
+# 每次只重新渲染末尾尚未完成的段落，渲染开销与已输出的总长度无关。
+import io
+import time
+
+# 末尾未完成段落后显示的光标
+CURSOR = " ▌"
+_FENCE_MARKERS = ("```", "~~~")
+
+def split_completed_blocks(text: str) -> int:
+    """
+    返回 text 中最后一个已完成段落的结束位置（其后的空行之后）；没有已完成的段落时返回 0。
+    代码块内的空行不算段落边界。text 需从代码块之外开始。
+    """
+    boundary, position, in_fence = 0, 0, False
+    for line in text.splitlines(keepends=True):
+        position += len(line)
+        if not line.endswith('\n'):
+            break  # 最后一行尚未输出完整
+        stripped = line.strip()
+        if stripped.startswith(_FENCE_MARKERS):
+            in_fence = not in_fence
+        elif not stripped and not in_fence:
+            boundary = position
+    return boundary
+
+class IncrementalMarkdownRenderer:
+    """
+    在 Streamlit 容器中增量渲染流式 Markdown。
+    container 需提供 empty()（例如 st.container()）；feed() 只把增量写入缓冲区，
+    距上次渲染超过 min_interval 秒或积累的文字超过 max_pending_chars 时才渲染一次；
+    轮询结束时调用 flush()，生成完成时调用 finish()。
+    """
+
+    def __init__(self, container, min_interval: float = 0.2, max_pending_chars: int = 2000):
+        self.container = container
+        self.min_interval = min_interval
+        self.max_pending_chars = max_pending_chars
+        self._frozen_blocks = []     # 已固定渲染的段落文本
+        self._tail = ""              # 末尾未完成的段落
+        self._pending = io.StringIO()
+        self._pending_chars = 0
+        self._placeholder = None     # 末尾段落所在的元素
+        self._last_render = 0.0
+        self.renders = 0
+
+    @property
+    def text(self) -> str:
+        """到目前为止收到的全部文本。"""
+        return "".join(self._frozen_blocks) + self._tail + self._pending.getvalue()
+
+    def feed(self, delta: str):
+        """追加一段增量文本，必要时渲染。"""
+        self._pending.write(delta)
+        self._pending_chars += len(delta)
+        if (self._pending_chars >= self.max_pending_chars
+                or time.monotonic() - self._last_render >= self.min_interval):
+            self.flush()
+
+    def flush(self, cursor: bool = True, force: bool = False):
+        """立即渲染缓冲区中的增量；没有新增内容且未指定 force 时不做任何事。"""
+        if not self._pending_chars and not force:
+            return
+        self._tail += self._pending.getvalue()
+        self._pending = io.StringIO()
+        self._pending_chars = 0
+
+        # 已完成的段落写入当前元素后固定下来，剩余部分在其后新建的元素中继续渲染
+        boundary = split_completed_blocks(self._tail)
+        if boundary:
+            completed, self._tail = self._tail[:boundary], self._tail[boundary:]
+            self._current_placeholder().markdown(completed)
+            self._frozen_blocks.append(completed)
+            self._placeholder = None
+        placeholder = self._current_placeholder()
+        if self._tail:
+            placeholder.markdown(self._tail + CURSOR if cursor else self._tail)
+        else:
+            placeholder.empty()
+        self._last_render = time.monotonic()
+        self.renders += 1
+
+    def finish(self):
+        """生成结束：渲染剩余内容并去掉光标。"""
+        self.flush(cursor=False, force=True)
+
+    def error(self, message: str):
+        """在已输出内容之后显示错误信息。"""
+        self.flush(cursor=False, force=True)
+        self.container.error(message)
+
+    def _current_placeholder(self):
+        if self._placeholder is None:
+            self._placeholder = self.container.empty()
+        return self._placeholder
@@ -0,0 +1,92 @@
+# test_boundary_planner.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import wave
+import shutil
+import numpy as np
+import pytest
+from video_processor import boundary_planner
+from video_processor.boundary_planner import (
+    SilenceBoundaryPlanner, pick_silence_boundaries, ENVELOPE_SAMPLE_RATE, FRAME_SECONDS
+)
+
+TARGET, MIN_LEN, MAX_LEN = 30.0, 20.0, 40.0
+DURATION = 100.0
+# 静音段（开始秒, 结束秒）：10 秒处的静音落在第一个候选窗口 [20, 40] 之外，不应被选中
+SILENT_GAPS = [(9.5, 10.5), (24.5, 25.5), (61.5, 62.5)]
+
+def synthetic_signal(duration: float, gaps: list[tuple[float, float]], sample_rate: int = ENVELOPE_SAMPLE_RATE) -> np.ndarray:
+    """持续的噪声模拟语音，gaps 内的样本置零。"""
+    rng = np.random.default_rng(0)
+    samples = rng.normal(0, 3000, int(duration * sample_rate)).clip(-32768, 32767).astype(np.int16)
+    for start, end in gaps:
+        samples[int(start * sample_rate):int(end * sample_rate)] = 0
+    return samples
+
+def frame_energy_db(samples: np.ndarray) -> np.ndarray:
+    """与 compute_frame_energy_db 相同的帧能量计算，省去 ffmpeg 解码。"""
+    frame_samples = int(ENVELOPE_SAMPLE_RATE * FRAME_SECONDS)
+    usable = samples.size - samples.size % frame_samples
+    frames = samples[:usable].astype(np.float32).reshape(-1, frame_samples)
+    return 10 * np.log10(np.mean(frames * frames, axis=1) / (32768.0 ** 2) + 1e-10)
+
+def assert_chunk_lengths_in_range(boundaries: list[float], duration: float):
+    edges = [0.0] + boundaries + [duration]
+    for start, end in zip(edges, edges[1:]):
+        assert MIN_LEN <= end - start <= MAX_LEN
+
+def test_cuts_land_in_silent_gaps():
+    frame_db = frame_energy_db(synthetic_signal(DURATION, SILENT_GAPS))
+    boundaries = pick_silence_boundaries(frame_db, FRAME_SECONDS, DURATION, TARGET, MIN_LEN, MAX_LEN)
+    assert len(boundaries) == 2
+    assert 24.5 <= boundaries[0] <= 25.5
+    assert 61.5 <= boundaries[1] <= 62.5
+    assert_chunk_lengths_in_range(boundaries, DURATION)
+
+def test_no_silence_falls_back_to_target_cuts():
+    duration = 3 * TARGET
+    frame_db = frame_energy_db(synthetic_signal(duration, []))
+    boundaries = pick_silence_boundaries(frame_db, FRAME_SECONDS, duration, TARGET, MIN_LEN, MAX_LEN)
+    # 能量没有明显低谷时，距离惩罚让切分点落在目标时长附近，相当于固定时长切分
+    assert len(boundaries) == 2
+    assert boundaries[0] == pytest.approx(TARGET, abs=1.0)
+    assert boundaries[1] == pytest.approx(2 * TARGET, abs=2.0)
+    assert_chunk_lengths_in_range(boundaries, duration)
+
+def test_short_tail_moves_last_cut_earlier():
+    # 在 40 秒处切分会留下 5 秒的尾巴，最后一个切分点应前移，保证尾块不短于 MIN_LEN
+    duration = 45.0
+    frame_db = frame_energy_db(synthetic_signal(duration, [(39.5, 40.5)]))
+    boundaries = pick_silence_boundaries(frame_db, FRAME_SECONDS, duration, TARGET, MIN_LEN, MAX_LEN)
+    assert boundaries == [duration - MIN_LEN]
+    assert_chunk_lengths_in_range(boundaries, duration)
+
+def test_empty_envelope_means_no_cuts():
+    assert pick_silence_boundaries(np.zeros(0), FRAME_SECONDS, DURATION, TARGET, MIN_LEN, MAX_LEN) == []
+
+def test_planner_skips_decoding_for_short_media(monkeypatch):
+    def fail_decode(media_path):
+        raise AssertionError("不超过 max_duration 的媒体不需要解码")
+
+    monkeypatch.setattr(boundary_planner, "compute_frame_energy_db", fail_decode)
+    assert SilenceBoundaryPlanner(TARGET, MIN_LEN, MAX_LEN).plan("short.wav", MAX_LEN) == []
+
+def test_planner_rejects_inconsistent_durations():
+    with pytest.raises(ValueError):
+        SilenceBoundaryPlanner(target_duration=10, min_duration=20, max_duration=40)
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="需要 ffmpeg")
+def test_planner_decodes_media_with_ffmpeg(tmp_path):
+    media_path = str(tmp_path / "lecture.wav")
+    with wave.open(media_path, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(16000)
+        wav_file.writeframes(synthetic_signal(DURATION, SILENT_GAPS, sample_rate=16000).tobytes())
+    boundaries = SilenceBoundaryPlanner(TARGET, MIN_LEN, MAX_LEN).plan(media_path, DURATION)
+    assert len(boundaries) == 2
+    assert 24.5 <= boundaries[0] <= 25.5
+    assert 61.5 <= boundaries[1] <= 62.5
@@ -0,0 +1,25 @@
+# test_compaction.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import pytest
+from llm_processor.compaction import compact_transcript
+
+@pytest.mark.parametrize("text, expected", [
+    # 后面紧跟正文的多词填充词是正文的一部分，不能删除
+    ("I mean it.", "I mean it."),
+    ("You know the answer, right?", "You know the answer, right?"),
+    ("That is what I mean.", "That is what I mean."),
+    # 前后都是标点（或行首行尾）的填充词删除
+    ("Well, you know, it works.", "Well, it works."),
+    ("It is good, you know.", "It is good."),
+    ("嗯，嗯，好的。", "好的。"),
+    ("好的。嗯，我们开始吧", "好的。我们开始吧"),
+    ("我们今天讲，对吧，梯度下降。", "我们今天讲，梯度下降。"),
+    # 作为词语一部分的填充词保留
+    ("那个问题很难。", "那个问题很难。"),
+])
+def test_filler_words_removed_only_when_standalone(text, expected):
+    assert compact_transcript(text) == expected
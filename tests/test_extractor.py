@@ -0,0 +1,145 @@
+# test_extractor.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import io
+import zipfile
+import pytest
+from document_processor.extractor import extract_document_generator, NS
+
+def write_zip(path: Path, parts: dict[str, str]) -> str:
+    """把 {部件路径: XML 文本} 打包为 zip 文件（OOXML / EPUB 的容器格式）。"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, content in parts.items():
+            archive.writestr(name, content)
+    path.write_bytes(buffer.getvalue())
+    return str(path)
+
+def relationships(*targets: tuple[str, str, str]) -> str:
+    entries = "".join(f'<Relationship Id="{rel_id}" Type="{rel_type}" Target="{target}"/>'
+                      for rel_id, rel_type, target in targets)
+    return f'<Relationships xmlns="{NS["rel"]}">{entries}</Relationships>'
+
+def extract(path: str, **kwargs) -> tuple[list[tuple], str | None]:
+    """返回 (全部事件, 全文)；出错时全文为 None。"""
+    events = list(extract_document_generator(path, use_cache=False, **kwargs))
+    results = [payload[0] for event_type, *payload in events if event_type == 'result']
+    return events, results[0] if results else None
+
+def error_of(events: list[tuple]) -> str:
+    errors = [payload[0] for event_type, *payload in events if event_type == 'error']
+    assert len(errors) == 1
+    return errors[0]
+
+SLIDE_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/slide"
+NOTES_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/notesSlide"
+SHEET_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"
+
+def slide(*paragraphs: str) -> str:
+    body = "".join(f"<a:p><a:r><a:t>{text}</a:t></a:r></a:p>" for text in paragraphs)
+    return f'<p:sld xmlns:p="{NS["p"]}" xmlns:a="{NS["a"]}"><p:cSld><p:spTree><p:sp><p:txBody>{body}</p:txBody></p:sp></p:spTree></p:cSld></p:sld>'
+
+@pytest.fixture
+def pptx_path(tmp_path):
+    # 放映顺序与部件文件名顺序相反：slide2.xml 是第 1 页
+    return write_zip(tmp_path / "deck.pptx", {
+        "ppt/presentation.xml": (
+            f'<p:presentation xmlns:p="{NS["p"]}" xmlns:r="{NS["r"]}"><p:sldIdLst>'
+            '<p:sldId id="256" r:id="rId2"/><p:sldId id="257" r:id="rId1"/></p:sldIdLst></p:presentation>'),
+        "ppt/_rels/presentation.xml.rels": relationships(("rId1", SLIDE_REL, "slides/slide1.xml"),
+                                                         ("rId2", SLIDE_REL, "slides/slide2.xml")),
+        "ppt/slides/slide1.xml": slide("梯度下降", "学习率"),
+        "ppt/slides/slide2.xml": slide("课程概览"),
+        "ppt/slides/_rels/slide1.xml.rels": relationships(("rId1", NOTES_REL, "../notesSlides/notesSlide1.xml")),
+        "ppt/notesSlides/notesSlide1.xml": slide("先讲直觉", "2"),
+    })
+
+def test_docx_paragraphs_include_tables(tmp_path):
+    w = NS["w"]
+    path = write_zip(tmp_path / "notes.docx", {
+        "word/document.xml": (
+            f'<w:document xmlns:w="{w}"><w:body>'
+            '<w:p><w:r><w:t>第一段</w:t></w:r><w:r><w:t>继续</w:t></w:r></w:p>'
+            '<w:p></w:p>'
+            '<w:tbl><w:tr><w:tc><w:p><w:r><w:t>表格单元格</w:t></w:r></w:p></w:tc></w:tr></w:tbl>'
+            '</w:body></w:document>'),
+    })
+    _, text = extract(str(path))
+    assert text == "第一段继续\n表格单元格"
+
+def test_pptx_slides_in_presentation_order_with_notes(pptx_path):
+    events, text = extract(pptx_path)
+    assert text == "## 第 1 页幻灯片\n课程概览\n\n## 第 2 页幻灯片\n梯度下降\n学习率\n备注: 先讲直觉"
+    assert [payload for event_type, *payload in events if event_type == 'progress'] == [[2, 2]]
+
+def test_paged_extraction_in_process_pool_keeps_page_order(pptx_path):
+    events, text = extract(pptx_path, pages_per_task=1)
+    assert [payload[0] for event_type, *payload in events if event_type == 'page'] == [0, 1]
+    assert [payload for event_type, *payload in events if event_type == 'progress'] == [[1, 2], [2, 2]]
+    assert text == extract(pptx_path)[1]
+
+def test_xlsx_sheets_with_shared_and_inline_strings(tmp_path):
+    s, r = NS["s"], NS["r"]
+    path = write_zip(tmp_path / "grades.xlsx", {
+        "xl/workbook.xml": (
+            f'<workbook xmlns="{s}" xmlns:r="{r}"><sheets>'
+            '<sheet name="成绩" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+        "xl/_rels/workbook.xml.rels": relationships(("rId1", SHEET_REL, "worksheets/sheet1.xml")),
+        "xl/sharedStrings.xml": f'<sst xmlns="{s}"><si><t>姓名</t></si><si><t>分数</t></si><si><t>张三</t></si></sst>',
+        "xl/worksheets/sheet1.xml": (
+            f'<worksheet xmlns="{s}"><sheetData>'
+            '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="s"><v>1</v></c></row>'
+            '<row r="2"><c r="A2" t="s"><v>2</v></c><c r="B2"><v>95</v></c></row>'
+            '<row r="3"><c r="A3" t="inlineStr"><is><t>李四</t></is></c><c r="B3"/></row>'
+            '</sheetData></worksheet>'),
+    })
+    _, text = extract(str(path))
+    assert text == "## 工作表: 成绩\n姓名\t分数\n张三\t95\n李四"
+
+def test_epub_chapters_in_spine_order(tmp_path):
+    path = write_zip(tmp_path / "book.epub", {
+        "META-INF/container.xml": (
+            f'<container xmlns="{NS["container"]}"><rootfiles>'
+            '<rootfile full-path="OEBPS/content.opf"/></rootfiles></container>'),
+        "OEBPS/content.opf": (
+            f'<package xmlns="{NS["opf"]}"><manifest>'
+            '<item id="ch1" href="text/ch1.xhtml"/><item id="ch2" href="text/ch2.xhtml"/></manifest>'
+            '<spine><itemref idref="ch2"/><itemref idref="ch1"/></spine></package>'),
+        "OEBPS/text/ch1.xhtml": "<html><body><h1>第二章</h1><p>正文二</p></body></html>",
+        "OEBPS/text/ch2.xhtml": ("<html><head><title>目录</title><style>p {}</style></head>"
+                                 "<body><h1>第一章</h1><p>正文一</p><script>var x;</script></body></html>"),
+    })
+    _, text = extract(str(path))
+    assert text == "第一章\n\n正文一\n\n第二章\n\n正文二"
+
+def test_gb18030_text(tmp_path):
+    path = tmp_path / "lecture.txt"
+    path.write_bytes("梯度下降是一种优化算法。".encode('gb18030'))
+    _, text = extract(str(path))
+    assert text == "梯度下降是一种优化算法。"
+
+@pytest.mark.parametrize("filename", ["page.html", "page.htm"])
+def test_html_visible_text(tmp_path, filename):
+    path = tmp_path / filename
+    path.write_text("<html><head><title>标题</title></head><body><p>第一段</p><p>第二  段</p></body></html>",
+                    encoding='utf-8')
+    _, text = extract(str(path))
+    assert text == "第一段\n\n第二 段"
+
+@pytest.mark.parametrize("ext, replacement", [(".doc", ".docx"), (".ppt", ".pptx"), (".xls", ".xlsx"), (".msg", ".eml")])
+def test_legacy_formats_get_save_as_message(tmp_path, ext, replacement):
+    path = tmp_path / f"old{ext}"
+    path.write_bytes(b"\xd0\xcf\x11\xe0")
+    events, text = extract(str(path))
+    assert text is None
+    assert f"另存为 {replacement}" in error_of(events)
+
+def test_corrupt_archive_reports_error(tmp_path):
+    path = tmp_path / "broken.docx"
+    path.write_bytes(b"not a zip file")
+    events, text = extract(str(path))
+    assert text is None
+    assert "已损坏" in error_of(events)
@@ -0,0 +1,42 @@
+# test_job_queue.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import os
+import main
+from job_queue import JobStore, run_job, JOB_SUCCEEDED
+from workspace import JobWorkspace
+
+def test_successful_job_keeps_outputs(tmp_path, monkeypatch):
+    # prompts.yml 按相对路径读取；DeepSeek 调用替换为固定输出，指标不导出
+    monkeypatch.chdir(project_root)
+    monkeypatch.setattr(main, "METRICS_DIR", "")
+    monkeypatch.setattr(main, "stream_chat_completion", lambda *args, **kwargs: iter(["# 笔记\n", "内容"]))
+
+    store = JobStore(str(tmp_path / "jobs.db"))
+    workspace = JobWorkspace.create(str(tmp_path / "workspaces"), cleanup="on_success", quota_mb=0)
+    input_path = workspace.file_path("lecture.txt")
+    with open(input_path, 'w', encoding='utf-8') as f:
+        f.write("梯度下降是一种优化算法。")
+    output_stem = str(tmp_path / "outputs" / workspace.job_id / "notes")
+    store.submit(workspace.job_id, {
+        "input_path": input_path,
+        "output_filename": output_stem,
+        "queries": ["Notes", "Quiz"],
+        "use_cache": False,
+        "workspace_root": workspace.root,
+        "cleanup": workspace.cleanup,
+    })
+
+    run_job(store, store.claim_next())
+
+    job = store.get(workspace.job_id)
+    assert job["status"] == JOB_SUCCEEDED
+    # 成功后工作目录按 on_success 策略删除，任务记录中的结果文件仍然存在
+    assert not os.path.exists(workspace.path)
+    assert set(job["outputs"]) == {"Notes", "Quiz"}
+    for path in job["outputs"].values():
+        with open(path, 'r', encoding='utf-8') as f:
+            assert f.read() == "# 笔记\n内容"
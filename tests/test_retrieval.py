@@ -0,0 +1,103 @@
+# test_retrieval.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import pytest
+from cache import DiskCache, make_cache_key
+from llm_processor import retrieval
+from llm_processor.retrieval import BM25Index, INDEX_VERSION, load_or_build_index, retrieve_passages, tokenize, transcript_hash
+
+# 每行的 token 数都超过 PASSAGE_TOKENS 的一半，切分后每行是一个段落
+PASSAGE_TOKENS = 15
+LINES = [
+    "lesson 12 starts with a course overview",
+    "gradient descent minimizes the loss value",
+    "gradient descent uses the gradient again",
+    "the learning rate controls each step size",
+    "momentum speeds up the learning process",
+]
+TRANSCRIPT = "\n".join(LINES)
+
+@pytest.fixture
+def index():
+    index = BM25Index.build(TRANSCRIPT, PASSAGE_TOKENS)
+    assert index.passages == LINES
+    return index
+
+@pytest.fixture
+def index_cache(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / "retrieval"), 10 * 1024 * 1024, name="检索索引")
+    monkeypatch.setattr(retrieval, "_index_cache", cache)
+    return cache
+
+@pytest.fixture
+def builds(monkeypatch):
+    """记录 load_or_build_index 实际构建索引的次数。"""
+    calls = []
+    original_build = BM25Index.build
+
+    def counting_build(transcript, passage_tokens):
+        calls.append((transcript_hash(transcript), passage_tokens))
+        return original_build(transcript, passage_tokens)
+
+    monkeypatch.setattr(BM25Index, "build", counting_build)
+    return calls
+
+def test_tokenize_mixes_cjk_bigrams_and_words():
+    assert tokenize("梯度下降 Gradient-based 学") == ["梯度", "度下", "下降", "学", "gradient-based"]
+
+def test_scores_rank_by_term_frequency(index):
+    scores = index.scores(["gradient"])
+    assert scores[2] > scores[1] > 0
+    assert scores[0] == scores[3] == scores[4] == 0
+
+def test_rare_terms_outweigh_common_ones(index):
+    # "learning" 出现在两个段落中，"momentum" 只出现在一个段落中
+    scores = index.scores(["momentum", "learning"])
+    assert scores[4] > scores[3] > 0
+
+def test_top_passages_keep_original_order(index):
+    assert index.top_passages(["gradient"], top_k=1) == [2]
+    assert index.top_passages(["gradient"], top_k=5) == [1, 2]
+    # 不要求匹配时按得分取满，未匹配的段落按原文顺序补足
+    assert index.top_passages(["gradient"], top_k=3, require_match=False) == [0, 1, 2]
+
+def test_question_retrieves_matching_passages(index):
+    assert retrieve_passages(index, "What is momentum?", top_k=2) == LINES[4]
+
+def test_salient_terms_skip_common_terms_and_numbers(index):
+    salient = index.salient_terms(100)
+    assert salient[0] == "gradient"
+    # "the" 出现在超过一半的段落中，"12" 是纯数字
+    assert "the" not in salient and "12" not in salient
+
+def test_empty_question_uses_salient_terms_and_fills_top_k(index):
+    assert retrieve_passages(index, "", top_k=2, salient_terms=1) == "\n\n".join(LINES[1:3])
+    assert len(retrieve_passages(index, "  ", top_k=4, salient_terms=1).split("\n\n")) == 4
+
+def test_cached_index_is_reused(index_cache, builds):
+    first = load_or_build_index(TRANSCRIPT, PASSAGE_TOKENS)
+    second = load_or_build_index(TRANSCRIPT, PASSAGE_TOKENS)
+    assert len(builds) == 1
+    assert second.passages == first.passages
+    assert second.top_passages(["gradient"], top_k=5) == first.top_passages(["gradient"], top_k=5)
+    assert index_cache.contains(make_cache_key("retrieval", INDEX_VERSION, transcript_hash(TRANSCRIPT), PASSAGE_TOKENS))
+
+def test_changed_transcript_or_passage_size_rebuilds(index_cache, builds):
+    load_or_build_index(TRANSCRIPT, PASSAGE_TOKENS)
+    edited = load_or_build_index(TRANSCRIPT + "\nadam combines momentum with scaling", PASSAGE_TOKENS)
+    resized = load_or_build_index(TRANSCRIPT, 400)
+    assert len(builds) == 3
+    assert len(edited.passages) == len(LINES) + 1
+    assert edited.source_hash != transcript_hash(TRANSCRIPT)
+    assert resized.passages == [TRANSCRIPT]
+
+def test_corrupt_cache_entry_is_rebuilt(index_cache, builds):
+    cache_key = make_cache_key("retrieval", INDEX_VERSION, transcript_hash(TRANSCRIPT), PASSAGE_TOKENS)
+    index_cache.set(cache_key, {"passages": LINES})
+    index = load_or_build_index(TRANSCRIPT, PASSAGE_TOKENS)
+    assert len(builds) == 1
+    assert index.passages == LINES
+    assert index_cache.get(cache_key)["source_hash"] == transcript_hash(TRANSCRIPT)
@@ -0,0 +1,74 @@
+# test_scheduler.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import time
+import asyncio
+import threading
+import pytest
+from scheduler import ProviderScheduler
+
+def _acquire_all(scheduler: ProviderScheduler, count: int, timeout: float = 2.0) -> int:
+    """在多个线程中各获取并立即释放一次槽位，返回 timeout 秒内完成的数量。"""
+    done = threading.Semaphore(0)
+
+    def worker():
+        with scheduler.slot():
+            pass
+        done.release()
+
+    for _ in range(count):
+        threading.Thread(target=worker, daemon=True).start()
+    return sum(done.acquire(timeout=timeout) for _ in range(count))
+
+@pytest.mark.parametrize("requests_per_second", [0, -1])
+def test_non_positive_rate_means_unlimited(requests_per_second):
+    scheduler = ProviderScheduler("test", requests_per_second, max_concurrency=4)
+    assert _acquire_all(scheduler, 50) == 50
+
+def test_configure_rate_to_zero_removes_limit():
+    scheduler = ProviderScheduler("test", 1, max_concurrency=4)
+    scheduler.configure(requests_per_second=0)
+    assert _acquire_all(scheduler, 20) == 20
+
+def test_throttle_with_unlimited_rate_keeps_dispatching():
+    scheduler = ProviderScheduler("test", 0, max_concurrency=4)
+    scheduler.report_throttled(retry_after=0.05)
+    assert _acquire_all(scheduler, 10) == 10
+
+def test_token_only_requests_ignore_concurrency_slots():
+    scheduler = ProviderScheduler("test", 0, max_concurrency=1)
+    scheduler.acquire()  # 唯一的并发槽位被占用
+
+    async def poll_many():
+        for _ in range(5):
+            await asyncio.wait_for(scheduler.acquire_token_async(), timeout=1.0)
+
+    asyncio.run(poll_many())
+    assert scheduler.stats()["tokens_granted"] == 5
+    assert scheduler.stats()["active"] == 1
+
+def test_token_only_requests_respect_rate():
+    scheduler = ProviderScheduler("test", 20, max_concurrency=1, burst=1)
+
+    async def poll_many():
+        for _ in range(5):
+            await scheduler.acquire_token_async()
+
+    started = time.monotonic()
+    asyncio.run(poll_many())
+    # 桶容量为 1：第一个令牌立即可用，其余 4 个按每秒 20 个补充
+    assert time.monotonic() - started >= 4 / 20 * 0.9
+
+def test_token_only_requests_wait_while_paused():
+    scheduler = ProviderScheduler("test", 0, max_concurrency=1)
+    scheduler.report_throttled(retry_after=0.2)
+
+    async def poll_once():
+        await scheduler.acquire_token_async()
+
+    started = time.monotonic()
+    asyncio.run(poll_once())
+    assert time.monotonic() - started >= 0.15
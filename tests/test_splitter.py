@@ -0,0 +1,45 @@
+# test_splitter.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import shutil
+import threading
+import subprocess
+import pytest
+from limits import concurrency_limit, set_concurrency_limit
+from video_processor.splitter import split_media_to_audio_chunks_generator
+from video_processor.boundary_planner import FixedBoundaryPlanner
+
+pytestmark = pytest.mark.skipif(shutil.which('ffmpeg') is None or shutil.which('ffprobe') is None,
+                                reason="需要 ffmpeg / ffprobe")
+
+@pytest.fixture
+def ffmpeg_limit_of_one():
+    set_concurrency_limit("ffmpeg", 1)
+    yield
+    set_concurrency_limit("ffmpeg", None)
+
+def test_single_pass_does_not_hold_ffmpeg_slot_while_consumer_runs(tmp_path, ffmpeg_limit_of_one):
+    media_path = str(tmp_path / "tone.wav")
+    subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'sine=duration=12', '-ar', '16000', '-y', media_path],
+                   check=True, capture_output=True)
+
+    chunks = []
+    for event_type, value, *rest in split_media_to_audio_chunks_generator(
+            media_path, str(tmp_path / "chunks"), planner=FixedBoundaryPlanner(5)):
+        assert event_type != 'error', value
+        if event_type == 'chunk':
+            chunks.append(rest[0])
+            if len(chunks) == 1:
+                # 调用方在处理音频块时需要另一个 ffmpeg 名额（如编码），切分进程结束后应能拿到
+                acquired = threading.Event()
+
+                def other_ffmpeg_work():
+                    with concurrency_limit("ffmpeg"):
+                        acquired.set()
+
+                threading.Thread(target=other_ffmpeg_work, daemon=True).start()
+                assert acquired.wait(timeout=10)
+    assert len(chunks) == 3
@@ -0,0 +1,114 @@
+# test_stream_renderer.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import pytest
+from stream_renderer import IncrementalMarkdownRenderer, split_completed_blocks, CURSOR
+
+class FakeElement:
+    """记录最后一次渲染内容的 st.empty() 元素。"""
+
+    def __init__(self):
+        self.content = ""
+
+    def markdown(self, text: str):
+        self.content = text
+
+    def empty(self):
+        self.content = ""
+
+class FakeContainer:
+    def __init__(self):
+        self.elements = []
+        self.errors = []
+
+    def empty(self) -> FakeElement:
+        element = FakeElement()
+        self.elements.append(element)
+        return element
+
+    def error(self, message: str):
+        self.errors.append(message)
+
+    @property
+    def rendered(self) -> str:
+        return "".join(element.content for element in self.elements)
+
+MARKDOWN = (
+    "# 标题\n\n"
+    "第一段文字。\n\n"
+    "```python\n"
+    "def f():\n"
+    "\n"
+    "    return 1\n"
+    "```\n\n"
+    "~~~\n"
+    "未闭合的代码块\n"
+    "\n"
+    "仍在代码块内\n"
+)
+
+def fence_lines(text: str) -> int:
+    return sum(line.strip().startswith(("```", "~~~")) for line in text.splitlines())
+
+def feed_in_pieces(renderer: IncrementalMarkdownRenderer, text: str, size: int):
+    for start in range(0, len(text), size):
+        renderer.feed(text[start:start + size])
+
+@pytest.mark.parametrize("text, expected", [
+    ("", 0),
+    ("第一段\n\n第二段", len("第一段\n\n")),
+    # 最后一行尚未输出完整，其后的空行还不能算边界
+    ("第一段\n", 0),
+    # 代码块内的空行不是段落边界
+    ("```\ncode\n\nmore\n", 0),
+    ("```\ncode\n\nmore\n```\n\nnext", len("```\ncode\n\nmore\n```\n\n")),
+])
+def test_split_completed_blocks(text, expected):
+    assert split_completed_blocks(text) == expected
+
+@pytest.mark.parametrize("size", [1, 3, 7, len(MARKDOWN)])
+def test_open_fence_is_never_split(size):
+    container = FakeContainer()
+    renderer = IncrementalMarkdownRenderer(container, min_interval=0)
+    feed_in_pieces(renderer, MARKDOWN, size)
+    # 固定下来的段落中代码块标记成对出现；未闭合的代码块整体留在末尾元素中
+    for element in container.elements[:-1]:
+        assert fence_lines(element.content) % 2 == 0
+    assert container.elements[-1].content.startswith("~~~\n")
+
+@pytest.mark.parametrize("size", [1, 5, len(MARKDOWN)])
+def test_final_text_equals_concatenated_input(size):
+    container = FakeContainer()
+    renderer = IncrementalMarkdownRenderer(container, min_interval=0)
+    feed_in_pieces(renderer, MARKDOWN, size)
+    assert renderer.text == MARKDOWN
+    assert container.rendered == MARKDOWN + CURSOR
+    renderer.finish()
+    assert renderer.text == MARKDOWN
+    assert container.rendered == MARKDOWN
+
+def test_feed_is_throttled_until_flush():
+    container = FakeContainer()
+    renderer = IncrementalMarkdownRenderer(container, min_interval=3600, max_pending_chars=10)
+    renderer.feed("一二三")  # 首次 feed 距上次渲染已超过 min_interval，立即渲染
+    renderer.feed("四五")
+    renderer.feed("六")
+    assert renderer.renders == 1
+    assert renderer.text == "一二三四五六"
+    renderer.feed("七" * 10)  # 积累的文字达到 max_pending_chars
+    assert renderer.renders == 2
+    renderer.flush()
+    assert renderer.renders == 2  # 没有新增内容
+    assert container.rendered == "一二三四五六" + "七" * 10 + CURSOR
+
+def test_error_follows_rendered_text():
+    container = FakeContainer()
+    renderer = IncrementalMarkdownRenderer(container, min_interval=3600)
+    renderer.feed("已输出")
+    renderer.feed("的内容")
+    renderer.error("生成失败")
+    assert container.rendered == "已输出的内容"
+    assert container.errors == ["生成失败"]
@@ -0,0 +1,65 @@
+# test_transcript_store.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import numpy as np
+import pytest
+from video_processor.transcript_store import TimedTranscript, format_timestamp
+
+# 两个音频块：第一块 60 秒，第二块 30 秒；话语时间相对于所在音频块
+CHUNKS = [
+    {"text": "第一句 第二句", "duration_ms": 60_000, "utterances": [
+        {"text": "第一句", "start_time": 0, "end_time": 4_000},
+        {"text": "第二句", "start_time": 50_000, "end_time": 59_000},
+    ]},
+    {"text": "third one", "duration_ms": 30_000, "utterances": [
+        {"text": "third one", "start_time": 5_000, "end_time": 9_000},
+    ]},
+]
+
+@pytest.fixture
+def transcript():
+    return TimedTranscript.from_chunks(CHUNKS)
+
+def test_from_chunks_offsets_utterances_by_chunk(transcript):
+    assert len(transcript) == 3
+    assert transcript.duration_ms == 90_000
+    assert transcript.start_ms.tolist() == [0, 50_000, 65_000]
+    assert transcript.chunk.tolist() == [0, 0, 1]
+
+def test_save_and_load_round_trip(transcript, tmp_path):
+    path = str(tmp_path / "lecture_transcript.idx")
+    transcript.save(path)
+    loaded = TimedTranscript.load(path)
+    for name in ("chunk_offsets_ms", "chunk", "start_ms", "end_ms", "text_offsets"):
+        assert np.array_equal(getattr(loaded, name), getattr(transcript, name))
+    assert [loaded.text_of(i) for i in range(len(loaded))] == ["第一句", "第二句", "third one"]
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / "not_an_index.idx"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        TimedTranscript.load(str(path))
+
+@pytest.mark.parametrize("start_ms, end_ms, expected", [
+    (0, 90_000, ["第一句", "第二句", "third one"]),
+    # 与时间段有重叠的话语都会取出，包括跨越开始时间的那一句
+    (55_000, 66_000, ["第二句", "third one"]),
+    (5_000, 50_000, []),
+    (60_000, 90_000, ["third one"]),
+])
+def test_utterances_between(transcript, start_ms, end_ms, expected):
+    assert [text for _, _, text in transcript.utterances_between(start_ms, end_ms)] == expected
+
+def test_text_between_with_timestamps(transcript):
+    assert transcript.text_between(50_000, 70_000, timestamps=True) == "[00:00:50] 第二句\n[00:01:05] third one"
+
+def test_chunks_between(transcript):
+    assert transcript.chunks_between(0, 10_000) == [0]
+    assert transcript.chunks_between(59_000, 61_000) == [0, 1]
+    assert transcript.chunks_between(70_000, 90_000) == [1]
+
+def test_format_timestamp():
+    assert format_timestamp(3_725_000) == "01:02:05"
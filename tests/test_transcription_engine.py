@@ -0,0 +1,160 @@
+# test_transcription_engine.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import os
+import time
+import wave
+import asyncio
+import pytest
+from scheduler import ProviderScheduler, RateLimitedError
+from config import RATE_LIMIT_MAX_RETRIES
+from video_processor import transcription_engine
+from video_processor.transcription_engine import AsyncTranscriptionEngine, SiblingStats
+
+class FakeScheduler:
+    """只提供 transcribe_hedged 用到的 paused 属性。"""
+
+    def __init__(self, paused: bool = False):
+        self.paused = paused
+
+class ScriptedEngine(AsyncTranscriptionEngine):
+    """
+    用预设的脚本代替真实的提交与轮询：每次调用 transcribe 依次取出一项 (提交前等待秒数, 提交后耗时秒数, 结果或异常)。
+    提交前等待模拟排队等待调度槽位，提交后调用 on_submitted。
+    """
+
+    def __init__(self, script: list[tuple], paused: bool = False):
+        super().__init__("app", "token", upload_format="wav")
+        self._scheduler = FakeScheduler(paused)
+        self.script = list(script)
+        self.calls = []
+
+    async def transcribe(self, audio_path, priority=0, deadline=None, on_submitted=None):
+        queued, running, outcome = self.script.pop(0)
+        call = {"cancelled": False}
+        self.calls.append(call)
+        try:
+            await asyncio.sleep(queued)
+            if on_submitted is not None:
+                on_submitted()
+            await asyncio.sleep(running)
+        except asyncio.CancelledError:
+            call["cancelled"] = True
+            raise
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+@pytest.fixture(autouse=True)
+def fast_hedge_checks(monkeypatch):
+    monkeypatch.setattr(transcription_engine, "HEDGE_CHECK_INTERVAL", 0.01)
+
+def siblings_with(durations, percentile=90, min_completed=3, min_seconds=0.0) -> SiblingStats:
+    siblings = SiblingStats(percentile, min_completed, min_seconds)
+    for seconds in durations:
+        siblings.record(seconds)
+    return siblings
+
+def run_hedged(engine: ScriptedEngine, siblings: SiblingStats):
+    return asyncio.run(engine.transcribe_hedged("chunk_001.wav", siblings))
+
+# --- SiblingStats ---
+
+def test_threshold_needs_min_completed():
+    assert siblings_with([1.0, 2.0], min_completed=3).hedge_threshold() is None
+    assert siblings_with([1.0, 2.0, 3.0], min_completed=3).hedge_threshold() == 3.0
+
+def test_threshold_uses_nearest_rank_percentile():
+    durations = [float(seconds) for seconds in range(1, 11)]
+    assert siblings_with(durations, percentile=90).hedge_threshold() == 9.0
+    assert siblings_with(durations, percentile=50).hedge_threshold() == 5.0
+
+def test_threshold_is_at_least_min_seconds():
+    assert siblings_with([0.1, 0.2, 0.3], min_seconds=10.0).hedge_threshold() == 10.0
+
+# --- transcribe_hedged ---
+
+def test_slow_chunk_is_hedged_and_loser_cancelled():
+    engine = ScriptedEngine([(0, 5.0, {"text": "slow"}), (0, 0.01, {"text": "hedge"})])
+    siblings = siblings_with([0.05, 0.05, 0.05])
+    assert run_hedged(engine, siblings) == {"text": "hedge"}
+    assert siblings.hedges == 1
+    assert engine.calls[0]["cancelled"]
+
+def test_no_hedge_before_min_completed():
+    engine = ScriptedEngine([(0, 0.2, {"text": "only"})])
+    siblings = siblings_with([0.01, 0.01], min_completed=3)
+    assert run_hedged(engine, siblings) == {"text": "only"}
+    assert siblings.hedges == 0 and len(engine.calls) == 1
+
+def test_no_hedge_below_min_seconds():
+    engine = ScriptedEngine([(0, 0.2, {"text": "only"})])
+    siblings = siblings_with([0.01, 0.01, 0.01], min_seconds=5.0)
+    assert run_hedged(engine, siblings) == {"text": "only"}
+    assert siblings.hedges == 0
+
+def test_no_hedge_while_scheduler_paused():
+    engine = ScriptedEngine([(0, 0.2, {"text": "only"})], paused=True)
+    siblings = siblings_with([0.01, 0.01, 0.01])
+    assert run_hedged(engine, siblings) == {"text": "only"}
+    assert siblings.hedges == 0
+
+def test_queueing_before_submit_does_not_count():
+    # 排队 0.3 秒后才提交，提交后 0.02 秒完成：从提交时算起没有超过阈值，不对冲
+    engine = ScriptedEngine([(0.3, 0.02, {"text": "queued"})])
+    siblings = siblings_with([0.1, 0.1, 0.1])
+    assert run_hedged(engine, siblings) == {"text": "queued"}
+    assert siblings.hedges == 0
+    # 记录的耗时从提交时算起
+    assert siblings.durations[-1] < 0.1
+
+def test_hedge_result_wins_when_original_fails():
+    engine = ScriptedEngine([(0, 0.1, RuntimeError("original failed")), (0, 0.2, {"text": "hedge"})])
+    siblings = siblings_with([0.02, 0.02, 0.02])
+    assert run_hedged(engine, siblings) == {"text": "hedge"}
+
+def test_error_raised_when_all_attempts_fail():
+    engine = ScriptedEngine([(0, 0.1, RuntimeError("first")), (0, 0.1, RuntimeError("second"))])
+    siblings = siblings_with([0.02, 0.02, 0.02])
+    with pytest.raises(RuntimeError):
+        run_hedged(engine, siblings)
+
+# --- 截止时间与限流重试 ---
+
+class ThrottledEngine(AsyncTranscriptionEngine):
+    """每次提交都被限流的引擎，记录提交次数。"""
+
+    def __init__(self):
+        super().__init__("app", "token", upload_format="wav")
+        self._scheduler = ProviderScheduler("test", 0, max_concurrency=4)
+        self.submits = 0
+
+    async def submit(self, upload_path, upload_format="wav"):
+        self.submits += 1
+        raise RateLimitedError("提交被限流", retry_after=0)
+
+@pytest.fixture
+def asr_ready_wav(tmp_path):
+    # 内容随机，不会命中转录缓存
+    path = str(tmp_path / "chunk_001.wav")
+    with wave.open(path, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(16000)
+        wav_file.writeframes(os.urandom(3200))
+    return path
+
+def test_throttled_submit_retries_until_max(asr_ready_wav):
+    engine = ThrottledEngine()
+    with pytest.raises(RateLimitedError):
+        asyncio.run(engine.transcribe(asr_ready_wav))
+    assert engine.submits == RATE_LIMIT_MAX_RETRIES
+
+def test_expired_deadline_stops_retries(asr_ready_wav):
+    engine = ThrottledEngine()
+    with pytest.raises(RateLimitedError):
+        asyncio.run(engine.transcribe(asr_ready_wav, deadline=time.monotonic()))
+    assert engine.submits == 1
@@ -0,0 +1,78 @@
+# test_upload_store.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import io
+import os
+import hashlib
+import pytest
+import utils
+import upload_store
+from upload_store import UploadStore
+
+def stored_files(store: UploadStore) -> list[str]:
+    return sorted(str(path) for path in Path(store.store_dir).rglob("*") if path.is_file())
+
+def save(store: UploadStore, data: bytes, dest_path, filename: str = "lecture.MP4"):
+    return store.save_stream(io.BytesIO(data), filename, str(dest_path))
+
+@pytest.fixture
+def store(tmp_path):
+    # 块很小，确保内容分多块写入
+    return UploadStore(str(tmp_path / "store"), max_bytes=0, block_size=4)
+
+def test_hash_on_write(store, tmp_path, monkeypatch):
+    data = b"lecture video bytes"
+    path, digest, reused = save(store, data, tmp_path / "job.mp4")
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert not reused
+    assert path == os.path.join(store.store_dir, digest[:2], f"{digest}.mp4")
+    assert (tmp_path / "job.mp4").read_bytes() == data
+    assert not [name for name in stored_files(store) if name.endswith('.part')]
+
+    # 写入时已登记哈希，hash_file 不需要再读取文件
+    def fail_open(*args, **kwargs):
+        raise AssertionError("hash_file 重新读取了文件")
+
+    monkeypatch.setattr(utils, "open", fail_open, raising=False)
+    assert utils.hash_file(path) == digest
+
+def test_same_content_is_reused(store, tmp_path):
+    data = b"same upload"
+    first_path, first_digest, first_reused = save(store, data, tmp_path / "job1.mp4")
+    second_path, second_digest, second_reused = save(store, data, tmp_path / "job2.mp4", filename="renamed.mp4")
+    assert (first_reused, second_reused) == (False, True)
+    assert (second_path, second_digest) == (first_path, first_digest)
+    assert stored_files(store) == [first_path]
+    # 两个工作目录都硬链接到同一份存储文件
+    assert os.stat(first_path).st_nlink == 3
+    assert (tmp_path / "job2.mp4").read_bytes() == data
+
+def test_falls_back_to_copy_when_hard_link_fails(store, tmp_path, monkeypatch):
+    def cross_device_link(src, dst):
+        raise OSError(18, "Invalid cross-device link")
+
+    monkeypatch.setattr(upload_store.os, "link", cross_device_link)
+    path, _, _ = save(store, b"copied upload", tmp_path / "job.mp4")
+    assert (tmp_path / "job.mp4").read_bytes() == b"copied upload"
+    assert os.stat(path).st_nlink == 1
+
+def test_eviction_skips_files_linked_from_workspaces(tmp_path):
+    store = UploadStore(str(tmp_path / "store"), max_bytes=10, block_size=4)
+    linked_path, _, _ = save(store, b"A" * 8, tmp_path / "job_a.mp4")
+    unlinked_path, _, _ = save(store, b"B" * 8, tmp_path / "job_b.mp4")
+    os.remove(tmp_path / "job_b.mp4")  # 任务 B 的工作目录已清理
+    # 两个文件都比新文件旧；超出上限时只能淘汰不再被引用的 B
+    os.utime(linked_path, (1, 1))
+    os.utime(unlinked_path, (2, 2))
+
+    newest_path, _, _ = save(store, b"C" * 8, tmp_path / "job_c.mp4")
+    assert stored_files(store) == sorted([linked_path, newest_path])
+
+    # 任务 A 的工作目录清理后，A 也可以被淘汰
+    os.remove(tmp_path / "job_a.mp4")
+    os.remove(tmp_path / "job_c.mp4")
+    latest_path, _, _ = save(store, b"D" * 8, tmp_path / "job_d.mp4")
+    assert stored_files(store) == [latest_path]
@@ -0,0 +1,26 @@
+# test_workspace.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import pytest
+from workspace import JobWorkspace, WorkspaceQuotaError
+
+MB = 1024 * 1024
+
+def test_concurrent_reservations_share_quota(tmp_path):
+    first = JobWorkspace.create(str(tmp_path), cleanup="always", quota_mb=10)
+    second = JobWorkspace.create(str(tmp_path), cleanup="always", quota_mb=10)
+    first.reserve(6 * MB, quota_mb=10)
+    # 第一个任务预留的空间尚未写入磁盘，也要计入配额
+    with pytest.raises(WorkspaceQuotaError):
+        second.reserve(6 * MB, quota_mb=10)
+
+def test_finish_releases_reservation(tmp_path):
+    first = JobWorkspace.create(str(tmp_path), cleanup="always", quota_mb=10)
+    second = JobWorkspace.create(str(tmp_path), cleanup="always", quota_mb=10)
+    first.reserve(6 * MB, quota_mb=10)
+    first.finish(succeeded=True)
+    second.reserve(6 * MB, quota_mb=10)
+    second.finish(succeeded=True)
@@ -0,0 +1,110 @@
+# upload_store.py
+# 按内容寻址的上传文件存储：上传内容按固定大小的块流式写入磁盘，边写边计算 SHA-256，
+# 以哈希值命名保存在 UPLOAD_STORE_DIR 中。相同内容再次上传时复用已有文件，
+# 通过硬链接放入任务工作目录，不再占用额外空间；哈希值登记到 utils.hash_file 的记录中，
+# 转录缓存等按文件哈希查找的环节不必重新读取整个文件，直接命中上次的结果。
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+from utils import remember_file_hash
+from config import UPLOAD_STORE_DIR, UPLOAD_STORE_MAX_MB, UPLOAD_BLOCK_BYTES
+
+class UploadStore:
+    """
+    `<store_dir>/<哈希前两位>/<哈希><扩展名>` 形式的上传文件存储，按总字节数做 LRU 淘汰。
+    仍被工作目录硬链接引用（链接数大于 1）的文件不会被淘汰。
+    复用检查、刷新时间戳与链接到工作目录在同一把锁内完成，与淘汰互斥，
+    避免文件在判断为“已存在”之后、建立链接之前被其他任务的淘汰删除。
+    """
+
+    def __init__(self, store_dir: str = UPLOAD_STORE_DIR, max_bytes: int = UPLOAD_STORE_MAX_MB * 1024 * 1024,
+                 block_size: int = UPLOAD_BLOCK_BYTES):
+        self.store_dir = store_dir
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self._lock = threading.Lock()
+
+    def _path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.store_dir, digest[:2], f"{digest}{ext}")
+
+    def save_stream(self, source, filename: str, dest_path: str) -> tuple[str, str, bool]:
+        """
+        将可读的二进制流 source（如 Streamlit 的 UploadedFile）按块写入存储，并放到任务工作目录中的 dest_path。
+        写入与计算哈希只额外占用一个块的内存；Streamlit 的 UploadedFile 本身已把整个上传内容放在内存中，
+        这里只是不再复制出第二份。
+        返回 (存储路径, SHA-256 哈希, 是否复用了已有文件)。
+        """
+        ext = os.path.splitext(filename)[1].lower()
+        os.makedirs(self.store_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.store_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for block in iter(lambda: source.read(self.block_size), b''):
+                    digest.update(block)
+                    f.write(block)
+            path = self._path(digest.hexdigest(), ext)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with self._lock:
+                reused = os.path.exists(path)
+                if reused:
+                    os.remove(tmp_path)
+                    os.utime(path)  # 刷新 LRU 时间戳
+                else:
+                    os.replace(tmp_path, path)
+                self._link_into(path, dest_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        remember_file_hash(path, digest.hexdigest())
+        if not reused:
+            self._evict(keep=path)
+        return path, digest.hexdigest(), reused
+
+    def _link_into(self, stored_path: str, dest_path: str):
+        """把存储中的文件放到任务工作目录：优先硬链接（不占额外空间），跨文件系统时复制。"""
+        try:
+            os.link(stored_path, dest_path)
+        except OSError:
+            shutil.copyfile(stored_path, dest_path)
+
+    def _evict(self, keep: str):
+        """按 mtime 从旧到新删除未被引用的文件，直到总大小不超过 max_bytes。"""
+        if self.max_bytes <= 0:
+            return
+        with self._lock:
+            entries, total = [], 0
+            for root, _, files in os.walk(self.store_dir):
+                for filename in files:
+                    path = os.path.join(root, filename)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    total += st.st_size
+                    if path != keep and st.st_nlink == 1 and not filename.endswith('.part'):
+                        entries.append((st.st_mtime, st.st_size, path))
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    continue
+
+_upload_store = None
+_upload_store_lock = threading.Lock()
+
+def get_upload_store() -> UploadStore:
+    """返回进程内共享的上传文件存储。"""
+    global _upload_store
+    with _upload_store_lock:
+        if _upload_store is None:
+            _upload_store = UploadStore()
+        return _upload_store
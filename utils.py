@@ -1,6 +1,22 @@
 # utils.py
+import os
 import time
+import queue
+import asyncio
+import hashlib
 import functools
+import threading
+import contextvars
+import metrics
+
+def _deadline_allows_retry(kwargs, delay) -> bool:
+    """
+    Whether another attempt still fits in the caller's time budget.
+    The budget is the optional `deadline` keyword argument of the decorated call:
+    an absolute time.monotonic() timestamp, forwarded to the function unchanged.
+    """
+    deadline = kwargs.get('deadline')
+    return deadline is None or time.monotonic() + delay < deadline
 
 def retry(max_retries=3, delay=2, allowed_exceptions=()):
     """
@@ -10,6 +26,9 @@ def retry(max_retries=3, delay=2, allowed_exceptions=()):
     :param delay: Delay between retries in seconds.
     :param allowed_exceptions: A tuple of exceptions that should trigger a retry. 
                                If empty, retries on any Exception.
+
+    If the call passes a `deadline` keyword argument (time.monotonic() timestamp),
+    retrying stops as soon as the next attempt could not start before the deadline.
     """
     def decorator(func):
         @functools.wraps(func)
@@ -27,8 +46,127 @@ def retry(max_retries=3, delay=2, allowed_exceptions=()):
                     if attempts >= max_retries:
                         print(f"Function '{func.__name__}' failed after {max_retries} attempts. Re-raising last exception.")
                         raise e
+                    if not _deadline_allows_retry(kwargs, delay):
+                        print(f"Function '{func.__name__}' failed after {attempts} attempts and the deadline leaves no time to retry. Re-raising last exception.")
+                        raise e
                     
                     print(f"Attempt {attempts}/{max_retries} for '{func.__name__}' failed with error: {e}. Retrying in {delay} seconds...")
+                    metrics.incr("retries", function=func.__name__)
                     time.sleep(delay)
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
+
+def async_retry(max_retries=3, delay=2, allowed_exceptions=()):
+    """
+    The coroutine counterpart of `retry`: waits with asyncio.sleep instead of
+    blocking the thread between attempts. Honours the same `deadline` keyword argument.
+
+    :param max_retries: Maximum number of retries.
+    :param delay: Delay between retries in seconds.
+    :param allowed_exceptions: A tuple of exceptions that should trigger a retry.
+                               If empty, retries on any Exception.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            attempts = 0
+            while attempts < max_retries:
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    if allowed_exceptions and not isinstance(e, allowed_exceptions):
+                        raise
+
+                    attempts += 1
+                    if attempts >= max_retries:
+                        print(f"Function '{func.__name__}' failed after {max_retries} attempts. Re-raising last exception.")
+                        raise e
+                    if not _deadline_allows_retry(kwargs, delay):
+                        print(f"Function '{func.__name__}' failed after {attempts} attempts and the deadline leaves no time to retry. Re-raising last exception.")
+                        raise e
+
+                    print(f"Attempt {attempts}/{max_retries} for '{func.__name__}' failed with error: {e}. Retrying in {delay} seconds...")
+                    metrics.incr("retries", function=func.__name__)
+                    await asyncio.sleep(delay)
+        return wrapper
+    return decorator
+
+# Digests already known for a file, keyed by its inode, size and mtime; hard links share an inode,
+# so a file hashed while it was written (see upload_store.py) is not read again through another link.
+_file_hash_memo = {}
+_file_hash_memo_lock = threading.Lock()
+
+def _file_identity(path: str) -> tuple:
+    st = os.stat(path)
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+def remember_file_hash(path: str, digest: str):
+    """Record the SHA-256 digest of a file whose contents were hashed elsewhere."""
+    identity = _file_identity(path)
+    with _file_hash_memo_lock:
+        _file_hash_memo[identity] = digest
+
+def hash_file(path: str, block_size: int = 1024 * 1024) -> str:
+    """Compute the SHA-256 hex digest of a file, reading it in fixed-size blocks."""
+    identity = _file_identity(path)
+    with _file_hash_memo_lock:
+        digest = _file_hash_memo.get(identity)
+    if digest is not None:
+        return digest
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    with _file_hash_memo_lock:
+        _file_hash_memo[identity] = digest.hexdigest()
+    return digest.hexdigest()
+
+
+class _GeneratorFailure:
+    """Wraps an exception raised inside a generator run by multiplex_generators."""
+    def __init__(self, exc):
+        self.exc = exc
+
+_GENERATOR_DONE = object()
+
+def multiplex_generators(generators: dict):
+    """
+    Drive several generators concurrently, one worker thread each, and yield
+    (key, item) tuples in the order the items are produced.
+
+    :param generators: Mapping of key -> generator.
+    If any generator raises, the exception is re-raised in the consumer. When the
+    consumer stops early, workers stop after their current item.
+    Each worker runs in a copy of the consumer's context, so context variables
+    (such as the current job's metrics) stay visible inside the generators.
+    """
+    items = queue.Queue()
+    stop = threading.Event()
+
+    def drain(key, generator):
+        try:
+            for item in generator:
+                if stop.is_set():
+                    break
+                items.put((key, item))
+        except Exception as e:
+            items.put((key, _GeneratorFailure(e)))
+        finally:
+            items.put((key, _GENERATOR_DONE))
+
+    for key, generator in generators.items():
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(drain, key, generator), daemon=True).start()
+
+    try:
+        remaining = len(generators)
+        while remaining:
+            key, item = items.get()
+            if item is _GENERATOR_DONE:
+                remaining -= 1
+            elif isinstance(item, _GeneratorFailure):
+                raise item.exc
+            else:
+                yield key, item
+    finally:
+        stop.set()
@@ -0,0 +1,123 @@
+# boundary_planner.py
+import math
+import subprocess
+import numpy as np
+
+# 能量包络的解码参数：低采样率单声道足以反映语音能量
+ENVELOPE_SAMPLE_RATE = 4000
+# 每帧 50ms，平滑窗口 0.5s
+FRAME_SECONDS = 0.05
+SMOOTHING_SECONDS = 0.5
+# 距离目标切分点的惩罚（每偏离 (max-min) 的距离相当于多少 dB 的能量）
+DISTANCE_PENALTY_DB = 12.0
+
+class FixedBoundaryPlanner:
+    """按固定时长切分（原有行为）。"""
+
+    def __init__(self, chunk_duration: int = 600):
+        self.chunk_duration = chunk_duration
+
+    @property
+    def cache_signature(self) -> str:
+        """参与缓存键计算的切分参数描述。"""
+        return f"fixed:{self.chunk_duration}"
+
+    def plan(self, media_path: str, duration: float) -> list[float]:
+        """返回切分点（秒，不含 0 与总时长）。"""
+        num_chunks = math.ceil(duration / self.chunk_duration)
+        return [i * self.chunk_duration for i in range(1, num_chunks)]
+
+class SilenceBoundaryPlanner:
+    """
+    静音感知的切分：解码一次低采样率单声道包络，用 NumPy 计算帧能量，
+    在 [min_duration, max_duration] 范围内挑选靠近目标时长的低能量位置作为切分点，
+    避免把一句话切成两半。
+    """
+
+    def __init__(self, target_duration: float = 300, min_duration: float = 180, max_duration: float = 420):
+        if not 0 < min_duration <= target_duration <= max_duration:
+            raise ValueError("切分时长需满足 0 < min_duration <= target_duration <= max_duration")
+        self.target_duration = target_duration
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+
+    @property
+    def cache_signature(self) -> str:
+        """参与缓存键计算的切分参数描述。"""
+        return f"silence:{self.target_duration}:{self.min_duration}:{self.max_duration}"
+
+    def plan(self, media_path: str, duration: float) -> list[float]:
+        """返回切分点（秒，不含 0 与总时长）。"""
+        if duration <= self.max_duration:
+            return []
+        frame_db = compute_frame_energy_db(media_path)
+        return pick_silence_boundaries(frame_db, FRAME_SECONDS, duration,
+                                       self.target_duration, self.min_duration, self.max_duration)
+
+def compute_frame_energy_db(media_path: str) -> np.ndarray:
+    """
+    用 ffmpeg 解码一次低采样率单声道 PCM，流式计算每帧的能量 (dBFS)。
+    按块读取标准输出，内存占用与媒体时长无关（只保留每帧一个浮点数）。
+    """
+    frame_samples = int(ENVELOPE_SAMPLE_RATE * FRAME_SECONDS)
+    command = [
+        'ffmpeg', '-nostdin', '-v', 'error', '-i', media_path,
+        '-vn', '-ac', '1', '-ar', str(ENVELOPE_SAMPLE_RATE), '-f', 's16le', 'pipe:1'
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    block_bytes = frame_samples * 2 * 2000  # 每次读取 2000 帧（100 秒）
+    energies = []
+    remainder = b''
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            data = remainder + data
+            usable = len(data) - len(data) % (frame_samples * 2)
+            remainder = data[usable:]
+            samples = np.frombuffer(data[:usable], dtype=np.int16).astype(np.float32)
+            frames = samples.reshape(-1, frame_samples)
+            energies.append(np.mean(frames * frames, axis=1))
+    finally:
+        process.stdout.close()
+        return_code = process.wait()
+    if return_code != 0:
+        raise subprocess.CalledProcessError(return_code, command)
+
+    if not energies:
+        return np.zeros(0, dtype=np.float32)
+    mean_square = np.concatenate(energies)
+    return 10 * np.log10(mean_square / (32768.0 ** 2) + 1e-10)
+
+def pick_silence_boundaries(frame_db: np.ndarray, frame_seconds: float, duration: float,
+                            target: float, min_len: float, max_len: float) -> list[float]:
+    """
+    在每个候选窗口 [start+min_len, start+max_len] 内选择得分最低的帧作为切分点，
+    得分 = 平滑后的帧能量 + 偏离目标时长的距离惩罚。
+    """
+    if frame_db.size == 0:
+        return []
+    smooth_frames = max(1, int(SMOOTHING_SECONDS / frame_seconds))
+    kernel = np.ones(smooth_frames, dtype=np.float32) / smooth_frames
+    smoothed = np.convolve(frame_db, kernel, mode='same')
+    frame_times = (np.arange(smoothed.size) + 0.5) * frame_seconds
+
+    boundaries = []
+    start = 0.0
+    while duration - start > max_len:
+        lo = np.searchsorted(frame_times, start + min_len)
+        hi = np.searchsorted(frame_times, start + max_len)
+        if hi <= lo:
+            cut = start + target
+        else:
+            window_times = frame_times[lo:hi]
+            distance = np.abs(window_times - (start + target)) / (max_len - min_len)
+            scores = smoothed[lo:hi] + DISTANCE_PENALTY_DB * distance
+            cut = float(window_times[np.argmin(scores)])
+        # 避免剩余部分过短：最后一块不足 min_len 时把切分点往前挪
+        if duration - cut < min_len:
+            cut = max(start + min_len, duration - min_len)
+        boundaries.append(round(cut, 3))
+        start = cut
+    return boundaries
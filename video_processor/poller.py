@@ -0,0 +1,214 @@
+# poller.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import httpx
+import metrics
+from video_processor.transcriber import (
+    QUERY_URL,
+    STATUS_SUCCESS,
+    STATUS_PROCESSING,
+    STATUS_QUEUED,
+    THROTTLE_STATUS_CODES,
+    build_query_headers,
+)
+from scheduler import get_provider_scheduler, parse_retry_after
+
+# 轮询间隔的上下界（秒）
+POLL_MIN_INTERVAL = 0.5
+POLL_MAX_INTERVAL = 15.0
+# 同一状态下连续轮询时的退避倍数
+POLL_BACKOFF_FACTOR = 1.6
+# 预估的识别耗时与音频时长之比，用于决定首次轮询时间和基础间隔
+EXPECTED_REAL_TIME_FACTOR = 0.05
+# 超时 = 基础超时 + 音频时长 × 系数，长音频允许更长的等待
+POLL_BASE_TIMEOUT = 120.0
+POLL_TIMEOUT_PER_AUDIO_SECOND = 1.0
+
+class _PendingTask:
+    """一个等待结果的转录任务及其轮询状态。"""
+
+    def __init__(self, task_id: str, x_tt_logid: str, audio_seconds: float, future: asyncio.Future, now: float,
+                 job_deadline: float | None = None, priority: int = 0):
+        self.task_id = task_id
+        self.priority = priority
+        self.x_tt_logid = x_tt_logid
+        self.audio_seconds = audio_seconds
+        self.future = future
+        self.submitted_at = now
+        self.deadline = now + POLL_BASE_TIMEOUT + audio_seconds * POLL_TIMEOUT_PER_AUDIO_SECOND
+        if job_deadline is not None:
+            self.deadline = min(self.deadline, job_deadline)
+        self.status = None
+        self.same_status_polls = 0
+        self.attempts = 0
+        # 轮询由共享的调度协程执行，不在调用方的上下文中，因此在登记时记下所属任务与音频块
+        self.metrics = metrics.current_job_metrics()
+        self.chunk_id = metrics.current_chunk_id()
+
+def _timeout_error(pending: _PendingTask) -> Exception:
+    return Exception(f"转录任务超时，{pending.audio_seconds:.0f} 秒音频在 {pending.attempts} 次查询后仍未完成")
+
+def next_poll_interval(status: str | None, same_status_polls: int, audio_seconds: float, elapsed: float = 0.0) -> float:
+    """
+    根据当前状态、音频时长与已等待时间计算下一次轮询的间隔：
+    - 排队中 (20000002)、首次轮询或网络错误后：以预估识别耗时的一半为基础间隔，同一状态下连续轮询时指数退避；
+    - 处理中 (20000001)：预估完成前取剩余时间的一半，越接近预估完成时间轮询越密；
+      超过预估时间后从最小间隔开始指数退避。
+    最终间隔在上下界之间，并加入抖动避免所有任务同时轮询。
+    """
+    expected = audio_seconds * EXPECTED_REAL_TIME_FACTOR
+    if status == STATUS_PROCESSING:
+        remaining = expected - elapsed
+        if remaining > 0:
+            interval = remaining / 2
+        else:
+            interval = POLL_MIN_INTERVAL * (POLL_BACKOFF_FACTOR ** same_status_polls)
+    else:
+        interval = max(POLL_MIN_INTERVAL, expected / 2) * (POLL_BACKOFF_FACTOR ** same_status_polls)
+    interval = min(POLL_MAX_INTERVAL, max(POLL_MIN_INTERVAL, interval))
+    return random.uniform(interval / 2, interval)
+
+class AdaptivePoller:
+    """
+    所有在途转录任务共享的轮询调度器。
+    任务按下一次轮询时间放入最小堆，由单个调度协程在到期时发起查询；
+    查询到结果后立即交给等待中的调用方，未完成的任务按自适应间隔重新入堆。
+    每次查询前先从豆包调度器取一个令牌（不占用并发槽位），查询与提交共用 DOUBAO_REQUESTS_PER_SECOND，
+    限流暂停期间也不再查询。
+    """
+
+    def __init__(self, get_client, doubao_app_id: str, doubao_token: str):
+        self._get_client = get_client
+        self.doubao_app_id = doubao_app_id
+        self.doubao_token = doubao_token
+        self._heap = []
+        self._sequence = itertools.count()
+        self._wakeup = None
+        self._runner = None
+        self._in_flight = set()  # 持有进行中的查询协程，防止被垃圾回收
+
+    async def wait_for_result(self, task_id: str, x_tt_logid: str, audio_seconds: float, deadline: float | None = None,
+                              priority: int = 0) -> dict:
+        """
+        登记一个已提交的任务并等待其结果，返回任务完成时的完整 API 响应。
+        deadline: 所属任务的截止时间（time.monotonic() 时间戳，与事件循环时钟一致），早于默认超时时生效。
+        priority: 查询请求在调度器中的优先级，与提交时相同。
+        """
+        loop = asyncio.get_running_loop()
+        pending = _PendingTask(task_id, x_tt_logid, audio_seconds, loop.create_future(), loop.time(), deadline, priority)
+        self._schedule(pending, next_poll_interval(None, 0, audio_seconds))
+        return await pending.future
+
+    def _schedule(self, pending: _PendingTask, delay: float):
+        """(需在事件循环中调用) 将任务放入轮询堆，必要时唤醒或启动调度协程。"""
+        loop = asyncio.get_running_loop()
+        heapq.heappush(self._heap, (loop.time() + delay, next(self._sequence), pending))
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._runner is None:
+            self._runner = loop.create_task(self._run())
+
+    async def _run(self):
+        """调度协程：等待最早到期的任务，到期后并发发起查询。"""
+        loop = asyncio.get_running_loop()
+        while self._heap:
+            due_time = self._heap[0][0]
+            delay = due_time - loop.time()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            while self._heap and self._heap[0][0] <= loop.time():
+                _, _, pending = heapq.heappop(self._heap)
+                if not pending.future.done():  # 调用方已取消的任务不再轮询
+                    poll_task = loop.create_task(self._poll_once(pending))
+                    self._in_flight.add(poll_task)
+                    poll_task.add_done_callback(self._in_flight.discard)
+        self._runner = None
+
+    async def _poll_once(self, pending: _PendingTask):
+        """查询一次任务状态；任何意外错误都交给等待中的调用方，避免其永远挂起。"""
+        try:
+            await self._query_and_dispatch(pending)
+        except Exception as e:
+            if not pending.future.done():
+                pending.future.set_exception(e)
+
+    async def _query_and_dispatch(self, pending: _PendingTask):
+        """查询一次任务状态，并完成、失败或重新调度该任务。"""
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.wait_for(get_provider_scheduler("doubao").acquire_token_async(pending.priority),
+                                   timeout=max(0.0, pending.deadline - loop.time()))
+        except asyncio.TimeoutError:
+            if not pending.future.done():
+                pending.future.set_exception(_timeout_error(pending))
+            return
+        pending.attempts += 1
+        headers = build_query_headers(pending.task_id, pending.x_tt_logid, self.doubao_app_id, self.doubao_token)
+        started = time.perf_counter()
+        try:
+            response = await self._get_client().post(QUERY_URL, content="{}", headers=headers)
+            status_code = response.headers.get('X-Api-Status-Code', "")
+        except httpx.TransportError as e:
+            print(f"  > ⚠️ 查询失败 (第 {pending.attempts} 次): {str(e)}")
+            status_code = None
+        else:
+            if response.status_code == 429 or status_code in THROTTLE_STATUS_CODES:
+                # 查询被限流：按网络错误处理（退避后再查），同时通知调度器暂缓新的提交
+                print(f"  > ⚠️ 查询被限流 (第 {pending.attempts} 次)")
+                get_provider_scheduler("doubao").report_throttled(parse_retry_after(response.headers.get("Retry-After")))
+                status_code = None
+        if pending.metrics is not None:
+            pending.metrics.record("asr_poll", started, time.perf_counter() - started, pending.chunk_id,
+                                   attempt=pending.attempts, status=status_code)
+
+        if pending.future.done():
+            return
+
+        if status_code == STATUS_SUCCESS:  # 任务完成
+            try:
+                result = response.json()
+            except ValueError as e:
+                pending.future.set_exception(Exception(f"无法解析API响应: {e}"))
+                return
+            print(f"  > ✅ 转录成功! 话语数: {len(result.get('result', {}).get('utterances', []))}")
+            pending.future.set_result(result)
+            return
+
+        if status_code is not None and status_code not in (STATUS_PROCESSING, STATUS_QUEUED):  # 任务失败
+            error_msg = f"任务失败: {response.headers.get('X-Api-Message', '未知错误')}"
+            print(f"  > ❌ {error_msg}")
+            pending.future.set_exception(Exception(error_msg))
+            return
+
+        if loop.time() >= pending.deadline:
+            pending.future.set_exception(_timeout_error(pending))
+            return
+
+        # 处理中、排队中或网络错误：状态不变时继续退避，状态变化时重置退避
+        if status_code is None or status_code == pending.status:
+            pending.same_status_polls += 1
+        else:
+            pending.status = status_code
+            pending.same_status_polls = 0
+
+        elapsed = loop.time() - pending.submitted_at
+        interval = next_poll_interval(pending.status, pending.same_status_polls, pending.audio_seconds, elapsed)
+        interval = min(interval, max(0.0, pending.deadline - loop.time()))
+        state = "排队中" if pending.status == STATUS_QUEUED else "处理中"
+        print(f"  > ⌛ 任务{state} (第 {pending.attempts} 次查询), {interval:.1f}秒后重试...")
+        self._schedule(pending, interval)
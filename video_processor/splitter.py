@@ -1,15 +1,40 @@
 # splitter.py
 import subprocess
 import os
-import math
+import glob
+import wave
+import queue
+import bisect
+import threading
+import contextvars
 import concurrent.futures
+import metrics
 from utils import retry # <-- Import the retry decorator
+from limits import concurrency_limit
+from video_processor.boundary_planner import FixedBoundaryPlanner
+
+# 切分模式：
+#   single_pass - 只解码一次输入，由 ffmpeg segment 复用器一次性写出所有音频块
+#   per_chunk   - 每个音频块单独启动一个 ffmpeg 进程（旧路径，保留用于对比和兜底）
+SPLIT_MODE_SINGLE_PASS = "single_pass"
+SPLIT_MODE_PER_CHUNK = "per_chunk"
+SPLIT_MODES = (SPLIT_MODE_SINGLE_PASS, SPLIT_MODE_PER_CHUNK)
+
+# 音频块直接输出为语音识别所需的格式：16kHz、单声道、16-bit PCM WAV，
+# 转录阶段无需再解码/重采样。
+ASR_SAMPLE_RATE = 16000
+ASR_CHANNELS = 1
+CHUNK_EXT = ".wav"
+# segment 复用器在时长恰为切分点整数倍时可能多写出一个几毫秒的尾块，短于该值的尾块直接丢弃
+MIN_TAIL_SECONDS = 0.5
+ASR_AUDIO_ARGS = ['-vn', '-ac', str(ASR_CHANNELS), '-ar', str(ASR_SAMPLE_RATE), '-acodec', 'pcm_s16le', '-map_metadata', '-1']
 
 def get_media_duration(media_path: str) -> float | None:
     """使用 ffprobe 获取媒体文件总时长（秒），适用于视频和音频。"""
     command = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', media_path]
     try:
-        result = subprocess.run(command, check=True, capture_output=True, text=True)
+        with metrics.span("get_media_duration"):
+            result = subprocess.run(command, check=True, capture_output=True, text=True)
         return float(result.stdout)
     except FileNotFoundError:
         print("错误：找不到 'ffprobe' 命令。请确保 FFmpeg 已经完全安装，并且其 bin 目录已添加到了系统的 PATH 环境变量中。")
@@ -24,22 +49,22 @@ def get_media_duration(media_path: str) -> float | None:
 @retry(max_retries=3, delay=2, allowed_exceptions=(subprocess.CalledProcessError,)) # <-- Apply retry decorator
 def _process_chunk(args) -> str | None:
     """(工作函数) 处理单个音频块的生成。"""
-    media_path, output_dir, chunk_duration, i, num_chunks = args
-    start_time = i * chunk_duration
-    output_filename = os.path.join(output_dir, f"chunk_{i+1:03d}.mp3")
+    media_path, output_dir, start_time, chunk_duration, i, num_chunks = args
+    output_filename = os.path.join(output_dir, f"chunk_{i+1:03d}{CHUNK_EXT}")
     
     command = [
         'ffmpeg', '-i', media_path, 
         '-ss', str(start_time), 
         '-t', str(chunk_duration), 
-        '-vn', '-acodec', 'libmp3lame', 
-        '-q:a', '2', '-y', output_filename
+        *ASR_AUDIO_ARGS,
+        '-y', output_filename
     ]
     
     try:
         print(f"开始生成第 {i+1}/{num_chunks} 个音频块: {output_filename}")
         # Capture stderr and stdout to prevent them from printing directly unless an error occurs
-        subprocess.run(command, check=True, capture_output=True, text=True)
+        with concurrency_limit("ffmpeg"), metrics.span("split_chunk", chunk=f"chunk_{i+1:03d}"):
+            subprocess.run(command, check=True, capture_output=True, text=True)
         print(f"完成生成第 {i+1}/{num_chunks} 个音频块。")
         return output_filename
     except subprocess.CalledProcessError as e:
@@ -51,13 +76,141 @@ def _process_chunk(args) -> str | None:
         # This is a setup error, no point in retrying.
         return None
 
-def split_media_to_audio_chunks_generator(media_path: str, output_dir: str, chunk_duration: int = 600):
+def _wav_duration(wav_path: str) -> float:
+    """读取 WAV 文件时长（秒），无法解析时返回 0。"""
+    try:
+        with wave.open(wav_path, 'rb') as wav_file:
+            return wav_file.getnframes() / wav_file.getframerate()
+    except (wave.Error, EOFError, OSError):
+        return 0.0
+
+def _run_segment_process(command: list[str], num_chunks: int, events: queue.Queue):
+    """
+    (线程) 在 ffmpeg 并发上限内启动切分进程并逐行转发其 `-progress` 输出，进程退出后立即归还名额。
+    放入 events 的事件: ('started', 进程) 或 ('error', 错误信息)；之后为 ('line', 输出行) 与 ('exit', (返回码, 标准错误))。
     """
-    (生成器版本) 将媒体文件切分为音频块，并实时产出进度。
-    产出事件: ('progress', 已完成数量, 总数量)
+    with concurrency_limit("ffmpeg"), metrics.span("split_single_pass", chunks=num_chunks):
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        except FileNotFoundError:
+            events.put(('error', "错误：找不到 'ffmpeg' 命令。请确保 FFmpeg 已经完全安装，并且其 bin 目录已添加到了系统的 PATH 环境变量中。"))
+            return
+        except OSError as e:
+            events.put(('error', f"无法启动 ffmpeg: {e}"))
+            return
+        events.put(('started', process))
+        stderr = ""
+        try:
+            for line in process.stdout:
+                events.put(('line', line))
+            stderr = process.stderr.read()
+        finally:
+            events.put(('exit', (process.wait(), stderr)))
+
+def _segment_media_single_pass(media_path: str, output_dir: str, boundaries: list[float]):
+    """
+    (生成器) 只启动一个 ffmpeg 进程，解码一次输入并通过 segment 复用器写出全部音频块。
+    通过 `-progress pipe:1` 读取已处理的时间位置，每写完一个音频块立即产出该块及进度。
+    进程由后台线程启动和读取，ffmpeg 并发名额只在进程运行期间占用，不会在调用方处理产出的音频块时一直持有。
+    产出事件: ('chunk', 块索引(从0开始), 音频块路径)
+              ('progress', 已完成数量, 总数量)
               ('result', 输出文件列表)
               ('error', 错误信息)
     """
+    # 清理上一次运行残留的音频块，避免混入本次结果
+    for stale in glob.glob(os.path.join(output_dir, f"chunk_*{CHUNK_EXT}")):
+        os.remove(stale)
+
+    num_chunks = len(boundaries) + 1
+    output_pattern = os.path.join(output_dir, f"chunk_%03d{CHUNK_EXT}")
+    if boundaries:
+        segment_args = ['-segment_times', ','.join(f"{t:.3f}" for t in boundaries)]
+    else:
+        segment_args = ['-segment_time', '86400']  # 不切分，整段输出为一个音频块
+    command = [
+        'ffmpeg', '-nostdin', '-v', 'error', '-nostats',
+        '-i', media_path,
+        *ASR_AUDIO_ARGS,
+        '-f', 'segment',
+        *segment_args,
+        '-segment_start_number', '1',
+        '-reset_timestamps', '1',
+        '-progress', 'pipe:1',
+        '-y', output_pattern
+    ]
+
+    events = queue.Queue()
+    reader = threading.Thread(target=contextvars.copy_context().run, args=(_run_segment_process, command, num_chunks, events),
+                              name="ffmpeg-segment-reader", daemon=True)
+    reader.start()
+    event_type, payload = events.get()
+    if event_type == 'error':
+        yield 'error', payload, None
+        return
+    process = payload
+
+    print(f"开始单次解码切分，共 {num_chunks} 个音频块...")
+    completed_count = 0
+    try:
+        while True:
+            event_type, payload = events.get()
+            if event_type == 'exit':
+                return_code, stderr = payload
+                break
+            key, _, value = payload.strip().partition('=')
+            # out_time_us / out_time_ms 的单位实际都是微秒
+            if key not in ('out_time_us', 'out_time_ms') or not value.isdigit():
+                continue
+            # 当前位置越过某个切分点，说明该切分点之前的音频块已写完；最后一块要等进程结束
+            finished = min(bisect.bisect_right(boundaries, int(value) / 1_000_000), num_chunks - 1)
+            while completed_count < finished:
+                completed_count += 1
+                print(f"完成生成第 {completed_count}/{num_chunks} 个音频块。")
+                yield 'chunk', completed_count - 1, os.path.join(output_dir, f"chunk_{completed_count:03d}{CHUNK_EXT}")
+                yield 'progress', completed_count, num_chunks
+    finally:
+        # 调用方提前结束时终止进程，读取线程随即读到输出结束并归还名额
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+    if return_code != 0:
+        print(f"单次解码切分失败: {stderr}")
+        yield 'error', f"ffmpeg 切分失败 (返回码 {return_code}): {stderr.strip()}", None
+        return
+
+    output_files = sorted(glob.glob(os.path.join(output_dir, f"chunk_*{CHUNK_EXT}")))
+    if len(output_files) > 1 and _wav_duration(output_files[-1]) < MIN_TAIL_SECONDS:
+        os.remove(output_files.pop())
+    if not output_files:
+        yield 'error', "未能成功生成任何音频块。", None
+        return
+
+    # ffprobe 时长与实际切分结果可能有一块的出入，以实际写出的文件为准
+    total = len(output_files)
+    while completed_count < total:
+        completed_count += 1
+        yield 'chunk', completed_count - 1, output_files[completed_count - 1]
+        yield 'progress', completed_count, total
+
+    yield 'result', output_files
+
+def split_media_to_audio_chunks_generator(media_path: str, output_dir: str, chunk_duration: int = 600, mode: str = SPLIT_MODE_SINGLE_PASS, planner=None):
+    """
+    (生成器版本) 将媒体文件切分为音频块，每写完一个音频块立即产出其路径，并实时产出进度。
+    mode: 'single_pass' 只解码一次输入并一次性写出所有音频块；
+          'per_chunk' 为每个音频块单独启动 ffmpeg 进程。
+    planner: 切分点规划器（FixedBoundaryPlanner 或 SilenceBoundaryPlanner），
+             默认按 chunk_duration 固定切分。
+    产出事件: ('chunk', 块索引(从0开始), 音频块路径)  -- 按完成顺序，不保证按索引顺序
+              ('progress', 已完成数量, 总数量)
+              ('result', 输出文件列表)
+              ('error', 错误信息)
+    """
+    if mode not in SPLIT_MODES:
+        yield 'error', f"错误：未知的切分模式 '{mode}'，可选值为 {list(SPLIT_MODES)}。", None
+        return
+
     if not os.path.exists(media_path):
         yield 'error', f"错误：媒体文件 '{media_path}' 不存在。", None
         return
@@ -74,24 +227,37 @@ def split_media_to_audio_chunks_generator(media_path: str, output_dir: str, chun
         yield 'error', "无法获取媒体文件时长。", None
         return
 
-    num_chunks = math.ceil(duration / chunk_duration)
-    if num_chunks == 0:
-        yield 'result', []
+    if planner is None:
+        planner = FixedBoundaryPlanner(chunk_duration)
+    try:
+        with concurrency_limit("ffmpeg"):
+            boundaries = planner.plan(media_path, duration)
+    except Exception as e:
+        yield 'error', f"规划切分点失败: {e}", None
         return
-        
+
+    num_chunks = len(boundaries) + 1
     print(f"媒体总时长: {duration:.2f}秒, 将被切分为 {num_chunks} 个音频块。")
 
-    tasks_args = [(media_path, output_dir, chunk_duration, i, num_chunks) for i in range(num_chunks)]
+    if mode == SPLIT_MODE_SINGLE_PASS:
+        yield from _segment_media_single_pass(media_path, output_dir, boundaries)
+        return
+
+    starts = [0.0] + boundaries
+    ends = boundaries + [duration]
+    tasks_args = [(media_path, output_dir, starts[i], ends[i] - starts[i], i, num_chunks) for i in range(num_chunks)]
     
     output_files = []
     completed_count = 0
     with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
-        future_to_args = {executor.submit(_process_chunk, args): args for args in tasks_args}
+        # 每个工作线程使用调用方上下文的副本，音频块的耗时记录到当前任务
+        future_to_args = {executor.submit(contextvars.copy_context().run, _process_chunk, args): args for args in tasks_args}
         for future in concurrent.futures.as_completed(future_to_args):
             try:
                 result = future.result()
                 if result:
                     output_files.append(result)
+                    yield 'chunk', future_to_args[future][3], result
             except Exception as e:
                 # If a chunk fails after all retries, the exception is raised here.
                 yield 'error', f"一个音频块在多次尝试后仍然无法处理，已停止。错误: {e}", None
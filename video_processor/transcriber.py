@@ -6,135 +6,219 @@ sys.path.append(project_root)
 
 import os
 import json
-import time
-import uuid
-import base64
-import requests
+import wave
+import tempfile
+import threading
+import subprocess
+import concurrent.futures
 from pydub import AudioSegment
 import io
-from utils import retry
+import metrics
+from utils import hash_file
+from cache import DiskCache, make_cache_key, make_file_cache_key
+from limits import concurrency_limit
+from config import CACHE_DIR, ASR_CACHE_MAX_MB, DOUBAO_ASR_BASE_URL, ASR_UPLOAD_BITRATE
+from video_processor.splitter import ASR_SAMPLE_RATE, ASR_CHANNELS
 
-# 定义可重试的异常类型
-RETRYABLE_EXCEPTIONS = (requests.exceptions.RequestException,)
-@retry(max_retries=3, delay=5, allowed_exceptions=RETRYABLE_EXCEPTIONS)
-def transcribe_single_audio_chunk(audio_path: str, doubao_app_id: str,doubao_token: str) -> str | None:
-    """使用豆包语音识别API转录单个音频文件"""
-    print(f"  > 正在转录: {os.path.basename(audio_path)}")
-    
-    try:
-        # 1. 准备API请求参数
-        task_id = str(uuid.uuid4())
-        base64_data, audio_format = read_and_convert_audio(audio_path)
-        
-        headers = {
-            "X-Api-App-Key": doubao_app_id,
-            "X-Api-Access-Key": doubao_token,
-            "X-Api-Resource-Id": "volc.bigasr.auc",
-            "X-Api-Request-Id": task_id,
-            "X-Api-Sequence": "-1"
-        }
+# 语音识别 API 要求的采样位宽: 16-bit PCM
+ASR_SAMPLE_WIDTH = 2
+ASR_WAV_BYTES_PER_SECOND = ASR_SAMPLE_RATE * ASR_CHANNELS * ASR_SAMPLE_WIDTH
 
-        payload = {
-            "user": {"uid": "transcriber_agent"},
-            "audio": {
-                "data": base64_data,
-                "format": audio_format,
-                "codec": "raw",
-                "rate": 16000,
-                "bits": 16,
-                "channel": 1
-            },
-            "request": {
-                "model_name": "bigmodel",
-                "show_utterances": True,
-                "corpus": {"correct_table_name": "", "context": ""}
-            }
-        }
-        
-        # 2. 提交转录任务
-        submit_url = "https://openspeech.bytedance.com/api/v3/auc/bigmodel/submit"
-        response = requests.post(submit_url, data=json.dumps(payload), headers=headers)
-        
-        # 检查提交响应
-        if 'X-Api-Status-Code' not in response.headers or response.headers["X-Api-Status-Code"] != "20000000":
-            error_msg = f"提交失败: {response.headers.get('X-Api-Message', '未知错误')}"
-            print(f"  > ❌ {error_msg}")
-            raise Exception(error_msg)
-        
-        x_tt_logid = response.headers.get("X-Tt-Logid", "")
-        print(f"  > ✅ 任务提交成功! Task ID: {task_id}, Log ID: {x_tt_logid}")
-        
-        # 3. 轮询任务结果
-        return poll_transcription_result(task_id, x_tt_logid,doubao_app_id,doubao_token)
-    
-    except Exception as e:
-        print(f"  > ❌ 转录过程中发生错误: {str(e)}")
-        raise e
+# 上传格式 -> (ffmpeg 编码参数, 请求体中的 audio.codec)。wav 为未压缩的 16-bit PCM（与切分器输出相同）
+UPLOAD_ENCODINGS = {
+    "ogg": (['-c:a', 'libopus', '-b:a', ASR_UPLOAD_BITRATE, '-application', 'voip'], "opus"),
+    "mp3": (['-c:a', 'libmp3lame', '-b:a', ASR_UPLOAD_BITRATE], "raw"),
+    "wav": (['-c:a', 'pcm_s16le'], "raw"),
+}
 
-def read_and_convert_audio(audio_path: str):
-    """读取并转换音频为API所需格式"""
-    try:
-        # 读取音频文件
-        audio = AudioSegment.from_file(audio_path)
-        
-        # 转换为API要求的格式: 16kHz采样率, 单声道
-        audio = audio.set_frame_rate(16000).set_channels(1)
-        
-        # 导出为WAV格式到内存缓冲区
-        wav_buffer = io.BytesIO()
-        audio.export(wav_buffer, format="wav")
-        wav_buffer.seek(0)
-        
-        # 转为Base64编码
-        audio_data = wav_buffer.read()
-        return base64.b64encode(audio_data).decode('utf-8'), "wav"
-        
-    except Exception as e:
-        print(f"  > ❌ 音频转换失败: {str(e)}")
-        raise
+# 非标准格式的音频需要解码重采样，这属于 CPU 密集型工作，放到进程池中执行以避开 GIL
+_conversion_pool = None
+_conversion_pool_lock = threading.Lock()
 
-def poll_transcription_result(task_id: str, x_tt_logid: str,doubao_app_id: str,doubao_token: str,max_attempts: int = 60, interval: int = 2) -> str:
-    """轮询转录结果"""
-    query_url = "https://openspeech.bytedance.com/api/v3/auc/bigmodel/query"
-    
-    headers = {
+def _get_conversion_pool() -> concurrent.futures.ProcessPoolExecutor:
+    """惰性创建全局共享的音频转换进程池。"""
+    global _conversion_pool
+    with _conversion_pool_lock:
+        if _conversion_pool is None:
+            _conversion_pool = concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count())
+        return _conversion_pool
+
+# 豆包录音文件识别（大模型版）的资源与模型标识，同时也是 ASR 缓存键的一部分
+ASR_RESOURCE_ID = "volc.bigasr.auc"
+ASR_MODEL_NAME = "bigmodel"
+
+# --- ASR 结果缓存 ---
+# 以规范化后（16kHz 单声道 WAV）音频内容的哈希 + 资源/模型标识为键，条目为 {"text", "utterances"}。
+_asr_cache = DiskCache(os.path.join(CACHE_DIR, "asr"), ASR_CACHE_MAX_MB * 1024 * 1024, name="ASR")
+
+def get_asr_cache() -> DiskCache:
+    """返回全局共享的 ASR 结果缓存（可读取 hits/misses 计数）。"""
+    return _asr_cache
+
+def asr_cache_key(audio_data: bytes) -> str:
+    """根据规范化后的音频字节和 ASR 资源/模型标识计算缓存键。"""
+    return make_cache_key("asr", ASR_RESOURCE_ID, ASR_MODEL_NAME, audio_data)
+
+def asr_audio_key(audio_path: str) -> tuple[str, float]:
+    """
+    返回 (缓存键, 音频秒数)，键与 asr_cache_key(read_asr_audio_bytes(audio_path)) 相同。
+    已符合格式的 WAV（切分器的默认输出）按块读取计算，不把整个音频块读入内存；时长按 WAV 字节数换算。
+    """
+    if is_asr_ready_wav(audio_path):
+        return (make_file_cache_key(audio_path, "asr", ASR_RESOURCE_ID, ASR_MODEL_NAME),
+                os.path.getsize(audio_path) / ASR_WAV_BYTES_PER_SECOND)
+    audio_data = read_asr_audio_bytes(audio_path)
+    return asr_cache_key(audio_data), len(audio_data) / ASR_WAV_BYTES_PER_SECOND
+
+def media_cache_key(media_path: str, split_signature: str) -> str:
+    """整份媒体文件的缓存键：源文件内容哈希 + 切分参数描述 + ASR 资源/模型标识。"""
+    return make_cache_key("media", hash_file(media_path), split_signature, ASR_RESOURCE_ID, ASR_MODEL_NAME)
+
+def save_media_chunk_manifest(media_key: str, audio_chunks: list[str]):
+    """记录整份媒体对应的各音频块缓存键与时长，供下次完整命中时跳过切分与转录。"""
+    chunk_keys, durations_ms = [], []
+    for chunk in audio_chunks:
+        chunk_key, audio_seconds = asr_audio_key(chunk)
+        chunk_keys.append(chunk_key)
+        durations_ms.append(round(audio_seconds * 1000))
+    _asr_cache.set(media_key, {"chunk_keys": chunk_keys, "durations_ms": durations_ms})
+
+def get_cached_media_transcripts(media_key: str) -> list[dict] | None:
+    """
+    若整份媒体的所有音频块都已缓存，按块顺序返回转录结果 {"text", "utterances", "duration_ms"} 列表；否则返回 None。
+    """
+    manifest = _asr_cache.get(media_key)
+    if not manifest:
+        return None
+    results = []
+    for chunk_key, duration_ms in zip(manifest["chunk_keys"], manifest["durations_ms"]):
+        entry = _asr_cache.get(chunk_key)
+        if entry is None:
+            return None
+        results.append({**entry, "duration_ms": duration_ms})
+    return results or None
+
+# 豆包录音文件识别接口
+SUBMIT_URL = f"{DOUBAO_ASR_BASE_URL}/api/v3/auc/bigmodel/submit"
+QUERY_URL = f"{DOUBAO_ASR_BASE_URL}/api/v3/auc/bigmodel/query"
+
+# 接口状态码
+STATUS_SUCCESS = "20000000"
+STATUS_PROCESSING = "20000001"  # 处理中
+STATUS_QUEUED = "20000002"  # 排队中
+# 服务繁忙 / 限流类状态码：不视为任务失败，由调度器退避后重试（HTTP 429 同样处理）
+THROTTLE_STATUS_CODES = {"55000031"}
+
+def build_submit_headers(task_id: str, doubao_app_id: str, doubao_token: str) -> dict:
+    """构造提交任务的请求头"""
+    return {
+        "X-Api-App-Key": doubao_app_id,
+        "X-Api-Access-Key": doubao_token,
+        "X-Api-Resource-Id": ASR_RESOURCE_ID,
+        "X-Api-Request-Id": task_id,
+        "X-Api-Sequence": "-1"
+    }
+
+def build_query_headers(task_id: str, x_tt_logid: str, doubao_app_id: str, doubao_token: str) -> dict:
+    """构造查询任务结果的请求头"""
+    return {
         "X-Api-App-Key": doubao_app_id,
         "X-Api-Access-Key": doubao_token,
-        "X-Api-Resource-Id": "volc.bigasr.auc",
+        "X-Api-Resource-Id": ASR_RESOURCE_ID,
         "X-Api-Request-Id": task_id,
         "X-Tt-Logid": x_tt_logid
     }
-    
-    for attempt in range(1, max_attempts + 1):
-        try:
-            # 发送查询请求
-            response = requests.post(query_url, json.dumps({}), headers=headers)
-            
-            # 检查响应状态
-            status_code = response.headers.get('X-Api-Status-Code', "")
-            
-            if status_code == '20000000':  # 任务完成
-                result = response.json()
-                transcript = extract_transcript_text(result)
-                print(f"  > ✅ 转录成功! 字符数: {len(transcript)}")
-                return transcript
-                
-            elif status_code in ('20000001', '20000002'):  # 处理中或排队中
-                wait_time = interval
-                print(f"  > ⌛ 任务处理中 ({attempt}/{max_attempts}), {wait_time}秒后重试...")
-                time.sleep(wait_time)
-                
-            else:  # 任务失败
-                error_msg = f"任务失败: {response.headers.get('X-Api-Message', '未知错误')}"
-                print(f"  > ❌ {error_msg}")
-                raise Exception(error_msg)
-                
-        except requests.exceptions.RequestException as e:
-            print(f"  > ⚠️ 查询失败 (尝试 {attempt}/{max_attempts}): {str(e)}")
-            time.sleep(interval)
-    
-    # 达到最大尝试次数仍未完成
-    raise Exception(f"转录任务超时，尝试 {max_attempts} 次后仍未完成")
+
+def build_submit_payload(base64_data: str, upload_format: str = "wav") -> dict:
+    """构造提交任务的请求体"""
+    return {
+        "user": {"uid": "transcriber_agent"},
+        "audio": {
+            "data": base64_data,
+            "format": upload_format,
+            "codec": UPLOAD_ENCODINGS[upload_format][1],
+            "rate": ASR_SAMPLE_RATE,
+            "bits": ASR_SAMPLE_WIDTH * 8,
+            "channel": ASR_CHANNELS
+        },
+        "request": {
+            "model_name": ASR_MODEL_NAME,
+            "show_utterances": True,
+            "corpus": {"correct_table_name": "", "context": ""}
+        }
+    }
+
+# 请求体中音频数据的占位符，用于把请求体拆成数据前后两段
+_DATA_PLACEHOLDER = "\0AUDIO_DATA\0"
+
+def build_submit_body_frame(upload_format: str) -> tuple[bytes, bytes]:
+    """
+    把提交请求体拆成 (音频数据之前的部分, 之后的部分)，中间按块填入 Base64 数据即为完整的 JSON，
+    无需在内存中拼出整个 Base64 字符串或请求体。
+    """
+    body = json.dumps(build_submit_payload(_DATA_PLACEHOLDER, upload_format))
+    prefix, suffix = body.split(json.dumps(_DATA_PLACEHOLDER)[1:-1])
+    return prefix.encode('utf-8'), suffix.encode('utf-8')
+
+def encode_upload_audio(audio_path: str, upload_format: str) -> str:
+    """
+    用 ffmpeg 把音频块编码为上传格式（16kHz 单声道），写入音频块旁边的临时文件并返回其路径，由调用方删除。
+    上传格式为 wav 且音频块已符合要求时直接返回原路径。编码失败时抛出 subprocess.CalledProcessError。
+    """
+    if upload_format == "wav" and is_asr_ready_wav(audio_path):
+        return audio_path
+    codec_args = UPLOAD_ENCODINGS[upload_format][0]
+    fd, upload_path = tempfile.mkstemp(dir=os.path.dirname(audio_path) or ".",
+                                       prefix=os.path.basename(audio_path) + ".", suffix=f".{upload_format}")
+    os.close(fd)
+    command = ['ffmpeg', '-v', 'error', '-i', audio_path, '-vn', '-ac', str(ASR_CHANNELS), '-ar', str(ASR_SAMPLE_RATE),
+               *codec_args, '-map_metadata', '-1', '-y', upload_path]
+    try:
+        # 单独的并发上限：编码与切分分别计数，切分进程占满 "ffmpeg" 名额时，已切出的音频块仍可编码上传
+        with concurrency_limit("asr_encode"), metrics.span("encode_audio", format=upload_format) as attrs:
+            subprocess.run(command, check=True, capture_output=True)
+            attrs["bytes"] = os.path.getsize(upload_path)
+    except BaseException:
+        os.remove(upload_path)
+        raise
+    return upload_path
+
+def transcribe_single_audio_chunk(audio_path: str, doubao_app_id: str,doubao_token: str) -> str | None:
+    """
+    使用豆包语音识别API转录单个音频文件（优先读取 ASR 结果缓存）。
+    同步包装：实际的提交与轮询由共享连接池的异步转录引擎完成，本函数只阻塞等待结果并返回其中的文字稿。
+    需要话语时间戳时使用 transcription_engine.submit_transcription。
+    """
+    from video_processor.transcription_engine import submit_transcription
+    return submit_transcription(audio_path, doubao_app_id, doubao_token).result()["text"]
+
+def is_asr_ready_wav(audio_path: str) -> bool:
+    """判断文件是否已经是 API 所需的 16kHz 单声道 16-bit PCM WAV（切分器的默认输出）。"""
+    try:
+        with wave.open(audio_path, 'rb') as wav_file:
+            return (wav_file.getframerate() == ASR_SAMPLE_RATE
+                    and wav_file.getnchannels() == ASR_CHANNELS
+                    and wav_file.getsampwidth() == ASR_SAMPLE_WIDTH
+                    and wav_file.getcomptype() == 'NONE')
+    except (wave.Error, EOFError, OSError):
+        return False
+
+def _convert_to_asr_wav(audio_path: str) -> bytes:
+    """(进程池工作函数) 解码任意格式音频并转换为 16kHz 单声道 WAV 字节。"""
+    audio = AudioSegment.from_file(audio_path)
+    audio = audio.set_frame_rate(ASR_SAMPLE_RATE).set_channels(ASR_CHANNELS).set_sample_width(ASR_SAMPLE_WIDTH)
+    wav_buffer = io.BytesIO()
+    audio.export(wav_buffer, format="wav")
+    return wav_buffer.getvalue()
+
+def read_asr_audio_bytes(audio_path: str) -> bytes:
+    """读取 API 所需格式的 WAV 字节；格式已符合时直接读取，否则在进程池中转换。"""
+    if is_asr_ready_wav(audio_path):
+        with open(audio_path, 'rb') as f:
+            return f.read()
+    print(f"  > 音频格式不符合要求，正在转换: {os.path.basename(audio_path)}")
+    with metrics.span("convert_audio"):
+        return _get_conversion_pool().submit(_convert_to_asr_wav, audio_path).result()
 
 def extract_transcript_text(api_response: dict) -> str:
     """从API响应中提取转录文本"""
@@ -154,6 +238,18 @@ def extract_transcript_text(api_response: dict) -> str:
         print(f"  > ❌ 解析转录结果失败: {str(e)}")
         raise Exception("无法解析API响应")
 
+def extract_utterances(api_response: dict) -> list[dict]:
+    """从API响应中提取话语列表，仅保留文本与起止时间（毫秒）"""
+    utterances = api_response.get('result', {}).get('utterances', [])
+    return [
+        {
+            "text": utt.get('text', ''),
+            "start_time": utt.get('start_time', 0),
+            "end_time": utt.get('end_time', 0),
+        }
+        for utt in utterances
+    ]
+
 # 下面是测试模块功能
 
 # import concurrent.futures
@@ -0,0 +1,154 @@
+# transcript_store.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import os
+import mmap
+import struct
+import tempfile
+import numpy as np
+import metrics
+
+# 带时间戳的文字稿：把各音频块的话语（utterance）按列存为定长数组，文本拼接为一个 UTF-8 缓冲区。
+# 保存在 source_transcript.txt 旁边的二进制文件中，读取时用 mmap 直接映射为 NumPy 数组，
+# 多小时的录音也只需按时间二分查找即可取出任意时间段的话语，不必重新转录或解析整份文字稿。
+#
+# 文件格式（小端序，各数组按 8 字节对齐）：
+#   头部: 魔数 b"LATS", 版本 (uint32), 话语数 n (uint64), 音频块数 m (uint64), 文本字节数 (uint64)
+#   chunk_offsets_ms  int64[m + 1]   各音频块在整份媒体中的起始时间，最后一项为总时长
+#   chunk             int32[n]       话语所属的音频块序号
+#   start_ms, end_ms  int64[n]       话语在整份媒体中的起止时间
+#   text_offsets      int64[n + 1]   话语文本在文本缓冲区中的字节偏移
+#   text              uint8[文本字节数]
+
+MAGIC = b"LATS"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sIQQQ")
+
+def _aligned(size: int) -> int:
+    return (size + 7) // 8 * 8
+
+class TimedTranscript:
+    """按时间索引的文字稿，数组可以是内存中的，也可以是 mmap 映射的只读视图。"""
+
+    def __init__(self, chunk_offsets_ms: np.ndarray, chunk: np.ndarray, start_ms: np.ndarray, end_ms: np.ndarray,
+                 text_offsets: np.ndarray, text: bytes | memoryview | np.ndarray, _mmap=None):
+        self.chunk_offsets_ms = chunk_offsets_ms
+        self.chunk = chunk
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.text_offsets = text_offsets
+        self._text = text
+        self._mmap = _mmap
+        # 结束时间的前缀最大值单调不减，用于二分查找与某时间段有重叠的第一条话语
+        self._max_end_ms = np.maximum.accumulate(end_ms) if len(end_ms) else end_ms
+
+    @classmethod
+    def from_chunks(cls, chunk_results: list[dict]) -> "TimedTranscript":
+        """
+        由各音频块的转录结果 {"text", "utterances", "duration_ms"}（按块顺序）构建。
+        话语时间相对于所在音频块，按前面各块的累计时长换算为整份媒体中的时间。
+        """
+        chunk_offsets = [0]
+        chunk_ids, starts, ends, texts = [], [], [], []
+        for index, result in enumerate(chunk_results):
+            offset = chunk_offsets[-1]
+            for utterance in result.get("utterances") or []:
+                chunk_ids.append(index)
+                starts.append(offset + int(utterance.get("start_time", 0)))
+                ends.append(offset + int(utterance.get("end_time", 0)))
+                texts.append(utterance.get("text", "").encode("utf-8"))
+            chunk_offsets.append(offset + int(result["duration_ms"]))
+
+        text_offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in texts], out=text_offsets[1:])
+        return cls(np.array(chunk_offsets, dtype=np.int64), np.array(chunk_ids, dtype=np.int32),
+                   np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64), text_offsets, b"".join(texts))
+
+    def __len__(self) -> int:
+        return len(self.start_ms)
+
+    @property
+    def duration_ms(self) -> int:
+        return int(self.chunk_offsets_ms[-1])
+
+    def text_of(self, index: int) -> str:
+        """第 index 条话语的文本。"""
+        begin, end = int(self.text_offsets[index]), int(self.text_offsets[index + 1])
+        return bytes(self._text[begin:end]).decode("utf-8")
+
+    def range_indices(self, start_ms: int, end_ms: int) -> range:
+        """与时间段 [start_ms, end_ms) 有重叠的话语序号（二分查找，O(log n)）。"""
+        first = int(np.searchsorted(self._max_end_ms, start_ms, side="right"))
+        last = int(np.searchsorted(self.start_ms, end_ms, side="left"))
+        return range(first, max(first, last))
+
+    def utterances_between(self, start_ms: int, end_ms: int) -> list[tuple[int, int, str]]:
+        """时间段 [start_ms, end_ms) 内的话语 [(开始毫秒, 结束毫秒, 文本), ...]。"""
+        return [(int(self.start_ms[i]), int(self.end_ms[i]), self.text_of(i))
+                for i in self.range_indices(start_ms, end_ms)]
+
+    def text_between(self, start_ms: int, end_ms: int, timestamps: bool = False) -> str:
+        """时间段内的文字稿，每条话语一行；timestamps 为 True 时每行前加上 [时:分:秒]。"""
+        return "\n".join(f"[{format_timestamp(start)}] {text}" if timestamps else text
+                         for start, _, text in self.utterances_between(start_ms, end_ms))
+
+    def chunks_between(self, start_ms: int, end_ms: int) -> list[int]:
+        """覆盖时间段 [start_ms, end_ms) 的音频块序号，可用于只重新转录这一段。"""
+        first = max(0, int(np.searchsorted(self.chunk_offsets_ms, start_ms, side="right")) - 1)
+        last = int(np.searchsorted(self.chunk_offsets_ms, end_ms, side="left"))
+        return list(range(first, min(max(first + 1, last), len(self.chunk_offsets_ms) - 1)))
+
+    # --- 序列化 ---
+
+    def save(self, path: str):
+        """写入二进制文件（先写临时文件再 os.replace）。"""
+        arrays = [
+            self.chunk_offsets_ms.astype("<i8", copy=False),
+            self.chunk.astype("<i4", copy=False),
+            self.start_ms.astype("<i8", copy=False),
+            self.end_ms.astype("<i8", copy=False),
+            self.text_offsets.astype("<i8", copy=False),
+        ]
+        text = bytes(self._text)
+        with metrics.span("file_write", file=os.path.basename(path), bytes=len(text)):
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(self), len(self.chunk_offsets_ms) - 1, len(text)))
+                    f.write(b"\0" * (_aligned(_HEADER.size) - _HEADER.size))
+                    for array in arrays:
+                        data = array.tobytes()
+                        f.write(data)
+                        f.write(b"\0" * (_aligned(len(data)) - len(data)))
+                    f.write(text)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    @classmethod
+    def load(cls, path: str) -> "TimedTranscript":
+        """以只读 mmap 打开二进制文件，各数组是映射内存上的视图，不会把整份文件读入内存。"""
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, num_chunks, text_bytes = _HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            mapped.close()
+            raise ValueError(f"不是有效的时间索引文件或版本不受支持: {path}")
+
+        position = _aligned(_HEADER.size)
+        arrays = []
+        for dtype, length in (("<i8", num_chunks + 1), ("<i4", count), ("<i8", count), ("<i8", count), ("<i8", count + 1)):
+            array = np.frombuffer(mapped, dtype=dtype, count=length, offset=position)
+            arrays.append(array)
+            position += _aligned(array.nbytes)
+        text = np.frombuffer(mapped, dtype=np.uint8, count=text_bytes, offset=position)
+        return cls(*arrays, text, _mmap=mapped)
+
+def format_timestamp(milliseconds: int) -> str:
+    seconds = int(milliseconds) // 1000
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
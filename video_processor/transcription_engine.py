@@ -0,0 +1,315 @@
+# transcription_engine.py
+import sys
+from pathlib import Path
+project_root = str(Path(__file__).resolve().parent.parent)
+sys.path.append(project_root)
+
+import os
+import math
+import time
+import uuid
+import base64
+import asyncio
+import threading
+import subprocess
+import concurrent.futures
+import httpx
+import metrics
+from utils import async_retry
+from config import ASR_MAX_CONNECTIONS, RATE_LIMIT_MAX_RETRIES, ASR_UPLOAD_FORMAT, ASR_UPLOAD_BLOCK_BYTES
+from config import ASR_HEDGE_ENABLED, ASR_HEDGE_PERCENTILE, ASR_HEDGE_MIN_COMPLETED, ASR_HEDGE_MIN_SECONDS
+from scheduler import RateLimitedError, get_provider_scheduler, parse_retry_after
+from video_processor.poller import AdaptivePoller
+from video_processor.transcriber import (
+    SUBMIT_URL,
+    STATUS_SUCCESS,
+    THROTTLE_STATUS_CODES,
+    UPLOAD_ENCODINGS,
+    build_submit_headers,
+    build_submit_body_frame,
+    encode_upload_audio,
+    asr_audio_key,
+    get_asr_cache,
+    extract_transcript_text,
+    extract_utterances,
+)
+
+# 定义可重试的异常类型（网络层错误）
+RETRYABLE_EXCEPTIONS = (httpx.TransportError,)
+
+# 尚无足够的已完成音频块时，每隔多少秒重新检查一次是否需要对冲
+HEDGE_CHECK_INTERVAL = 1.0
+
+class SiblingStats:
+    """
+    同一任务中各音频块的转录耗时，用于识别拖后腿的音频块。
+    只在后台事件循环中读写，无需加锁。
+    """
+
+    def __init__(self, percentile: float = ASR_HEDGE_PERCENTILE, min_completed: int = ASR_HEDGE_MIN_COMPLETED,
+                 min_seconds: float = ASR_HEDGE_MIN_SECONDS):
+        self.percentile = percentile
+        self.min_completed = min_completed
+        self.min_seconds = min_seconds
+        self.durations = []
+        self.hedges = 0
+
+    def record(self, seconds: float):
+        self.durations.append(seconds)
+
+    def hedge_threshold(self) -> float | None:
+        """已完成音频块耗时的指定分位数（最近秩法），不足 min_completed 个样本时返回 None。"""
+        if len(self.durations) < self.min_completed:
+            return None
+        ordered = sorted(self.durations)
+        rank = max(1, math.ceil(self.percentile / 100 * len(ordered)))
+        return max(self.min_seconds, ordered[rank - 1])
+
+class AsyncTranscriptionEngine:
+    """
+    基于 asyncio 的转录引擎。
+    所有提交与轮询共享同一个 keep-alive 连接池；等待结果时只占用协程而不占用线程，
+    因此可以同时保持数百个音频块在途。所有在途任务的结果查询由同一个自适应轮询调度器负责。
+    提交速率与在途任务数由共享的 "doubao" 服务商调度器控制（见 scheduler.py）。
+    """
+
+    def __init__(self, doubao_app_id: str, doubao_token: str, max_connections: int = ASR_MAX_CONNECTIONS,
+                 upload_format: str = ASR_UPLOAD_FORMAT, upload_block_bytes: int = ASR_UPLOAD_BLOCK_BYTES):
+        self.doubao_app_id = doubao_app_id
+        self.doubao_token = doubao_token
+        self.max_connections = max_connections
+        self.upload_format = upload_format if upload_format in UPLOAD_ENCODINGS else "wav"
+        # Base64 每 3 个字节编码为 4 个字符，块大小取 3 的倍数，各块编码结果直接拼接即为整体的编码
+        self.upload_block_bytes = max(3, upload_block_bytes // 3 * 3)
+        self._scheduler = get_provider_scheduler("doubao")
+        self._client = None
+        self._poller = AdaptivePoller(self._get_client, doubao_app_id, doubao_token)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """(需在事件循环中调用) 惰性创建共享的 HTTP 连接池。"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=httpx.Timeout(120, connect=10),
+            )
+        return self._client
+
+    def _prepare_upload(self, audio_path: str) -> tuple[str, str]:
+        """(在线程中调用) 把音频块编码为上传格式，返回 (上传文件路径, 格式)；编码失败时改为上传 WAV。"""
+        try:
+            return encode_upload_audio(audio_path, self.upload_format), self.upload_format
+        except (subprocess.CalledProcessError, OSError) as e:
+            if self.upload_format == "wav":
+                raise
+            print(f"  > ⚠️ 音频编码为 {self.upload_format} 失败，改为上传 WAV: {e}")
+            return encode_upload_audio(audio_path, "wav"), "wav"
+
+    async def _stream_body(self, upload_path: str, prefix: bytes, suffix: bytes):
+        """
+        按块读取上传文件并逐块做 Base64 编码，与 JSON 的前后两段一起作为流式请求体发送。
+        读取与编码的累计耗时记为 read_audio 区间（不含等待发送的时间）。
+        """
+        yield prefix
+        job_metrics = metrics.current_job_metrics()
+        read_started, read_seconds, read_bytes = time.perf_counter(), 0.0, 0
+        with open(upload_path, 'rb') as f:
+            while True:
+                started = time.perf_counter()
+                block = await asyncio.to_thread(f.read, self.upload_block_bytes)
+                encoded = base64.b64encode(block)
+                read_seconds += time.perf_counter() - started
+                if not block:
+                    break
+                read_bytes += len(block)
+                yield encoded
+        if job_metrics is not None:
+            job_metrics.record("read_audio", read_started, read_seconds, metrics.current_chunk_id(), bytes=read_bytes)
+        yield suffix
+
+    async def submit(self, upload_path: str, upload_format: str = "wav") -> tuple[str, str]:
+        """
+        提交转录任务，返回 (task_id, x_tt_logid)。
+        请求体边读文件边编码边发送，内存中只保留一个数据块；长度可以预先算出，因此仍以 Content-Length 发送。
+        """
+        task_id = str(uuid.uuid4())
+        headers = build_submit_headers(task_id, self.doubao_app_id, self.doubao_token)
+        prefix, suffix = build_submit_body_frame(upload_format)
+        body_length = len(prefix) + 4 * math.ceil(os.path.getsize(upload_path) / 3) + len(suffix)
+        headers["Content-Length"] = str(body_length)
+        metrics.incr("asr_upload_bytes", body_length, format=upload_format)
+        with metrics.span("asr_submit", bytes=body_length, format=upload_format):
+            response = await self._get_client().post(
+                SUBMIT_URL, content=self._stream_body(upload_path, prefix, suffix), headers=headers)
+
+        # 检查提交响应；限流与服务繁忙交给调度器退避后重试
+        status_code = response.headers.get("X-Api-Status-Code")
+        if response.status_code == 429 or status_code in THROTTLE_STATUS_CODES:
+            raise RateLimitedError(f"提交被限流: {response.headers.get('X-Api-Message', status_code or response.status_code)}",
+                                   parse_retry_after(response.headers.get("Retry-After")))
+        if status_code != STATUS_SUCCESS:
+            error_msg = f"提交失败: {response.headers.get('X-Api-Message', '未知错误')}"
+            print(f"  > ❌ {error_msg}")
+            raise Exception(error_msg)
+
+        x_tt_logid = response.headers.get("X-Tt-Logid", "")
+        print(f"  > ✅ 任务提交成功! Task ID: {task_id}, Log ID: {x_tt_logid}")
+        return task_id, x_tt_logid
+
+    @async_retry(max_retries=3, delay=5, allowed_exceptions=RETRYABLE_EXCEPTIONS)
+    async def transcribe(self, audio_path: str, priority: int = 0, deadline: float | None = None,
+                         on_submitted=None) -> dict:
+        """
+        转录单个音频文件（优先读取 ASR 结果缓存，命中时不占用调度器配额）。
+        返回 {"text": 文字稿, "utterances": 带起止时间（毫秒）的话语列表, "duration_ms": 音频块时长}。
+        priority: 调度优先级，数值越小越先获得提交机会。
+        deadline: 任务的截止时间（time.monotonic() 时间戳，需以关键字参数传入）；
+                  超过截止时间后不再重试，轮询也不会等到截止时间之后。
+        on_submitted: 任务提交成功时调用的回调（无参数，需以关键字参数传入），用于从提交时刻起计算耗时。
+        """
+        print(f"  > 正在转录: {os.path.basename(audio_path)}")
+        chunk_id = os.path.splitext(os.path.basename(audio_path))[0]
+        try:
+            with metrics.chunk_scope(chunk_id), metrics.span("asr_transcribe") as attrs:
+                # 哈希与编码放到线程中执行，避免阻塞事件循环；音频块按块读取，不整块读入内存。
+                # 缓存键与时长始终按规范化的 WAV 计算，与上传格式无关
+                cache_key, audio_seconds = await asyncio.to_thread(asr_audio_key, audio_path)
+                cached = get_asr_cache().get(cache_key)
+                if cached is not None:
+                    print(f"  > ✅ 命中转录缓存: {os.path.basename(audio_path)}")
+                    attrs["cache_hit"] = True
+                    return {**cached, "duration_ms": round(audio_seconds * 1000)}
+
+                # 压缩后的上传文件写在磁盘上，排队等待调度期间不占用内存
+                upload_path, upload_format = await asyncio.to_thread(self._prepare_upload, audio_path)
+                try:
+                    for attempt in range(1, RATE_LIMIT_MAX_RETRIES + 1):
+                        async with self._scheduler.async_slot(priority):
+                            try:
+                                task_id, x_tt_logid = await self.submit(upload_path, upload_format)
+                            except RateLimitedError as e:
+                                self._scheduler.report_throttled(e.retry_after)
+                                if attempt == RATE_LIMIT_MAX_RETRIES or (deadline is not None and time.monotonic() >= deadline):
+                                    raise
+                                metrics.incr("retries", function="asr_submit")
+                                continue
+                            self._scheduler.report_success()
+                            if on_submitted is not None:
+                                on_submitted()
+                            api_response = await self._poller.wait_for_result(task_id, x_tt_logid, audio_seconds, deadline, priority)
+                            break
+                finally:
+                    if upload_path != audio_path and os.path.exists(upload_path):
+                        os.remove(upload_path)
+
+                result = {"text": extract_transcript_text(api_response), "utterances": extract_utterances(api_response)}
+                get_asr_cache().set(cache_key, result)
+                return {**result, "duration_ms": round(audio_seconds * 1000)}
+
+        except Exception as e:
+            print(f"  > ❌ 转录过程中发生错误: {str(e)}")
+            raise
+
+    async def transcribe_hedged(self, audio_path: str, siblings: SiblingStats, priority: int = 0,
+                                deadline: float | None = None) -> dict:
+        """
+        带对冲的转录：提交成功后的耗时超过同一任务中兄弟音频块的分位数阈值时，再提交一份相同的任务，
+        先成功返回的结果生效，另一份随即取消。每个音频块最多对冲一次。
+        耗时从提交成功时算起，排队等待调度槽位（包括限流暂停）的时间不计入；调度器暂停期间不发起对冲。
+        """
+        loop = asyncio.get_running_loop()
+        submitted_at = None
+
+        def mark_submitted():
+            nonlocal submitted_at
+            if submitted_at is None:
+                submitted_at = loop.time()
+
+        tasks = {asyncio.ensure_future(self.transcribe(audio_path, priority, deadline=deadline, on_submitted=mark_submitted))}
+        hedged = False
+        last_error = None
+        try:
+            while tasks:
+                timeout = None
+                threshold = None
+                if not hedged:
+                    threshold = siblings.hedge_threshold()
+                    if threshold is None or submitted_at is None or self._scheduler.paused:
+                        timeout = HEDGE_CHECK_INTERVAL
+                    else:
+                        timeout = max(0.0, submitted_at + threshold - loop.time())
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is None:
+                        if submitted_at is not None:
+                            siblings.record(loop.time() - submitted_at)
+                        return task.result()
+                    last_error = task.exception()
+
+                if (not hedged and threshold is not None and submitted_at is not None and tasks
+                        and not self._scheduler.paused and loop.time() - submitted_at >= threshold):
+                    hedged = True
+                    siblings.hedges += 1
+                    metrics.incr("asr_hedges")
+                    print(f"  > ⏱️ {os.path.basename(audio_path)} 提交后已耗时 {loop.time() - submitted_at:.1f} 秒，"
+                          f"超过同批音频块的 {siblings.percentile:.0f} 分位 ({threshold:.1f} 秒)，提交对冲请求")
+                    tasks.add(asyncio.ensure_future(self.transcribe(audio_path, priority, deadline=deadline)))
+            raise last_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def transcribe_many(self, audio_paths: list[str]) -> list[dict]:
+        """并发转录多个音频文件，按输入顺序返回各自的转录结果。"""
+        return await asyncio.gather(*(self.transcribe(path) for path in audio_paths))
+
+    async def aclose(self):
+        """关闭共享连接池。"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+# --- 同步调用入口 ---
+# 在一个后台线程中运行共享的事件循环；同步代码通过 run_coroutine_threadsafe 提交协程，
+# 拿到的是 concurrent.futures.Future，可以直接配合 as_completed 使用。
+_loop = None
+_engines = {}
+_loop_lock = threading.Lock()
+
+def _get_event_loop() -> asyncio.AbstractEventLoop:
+    """惰性启动后台事件循环线程。"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="transcription-engine", daemon=True).start()
+        return _loop
+
+def set_max_in_flight(limit: int):
+    """设置全局在途转录任务上限（即 "doubao" 服务商调度器的并发数）。"""
+    get_provider_scheduler("doubao").configure(max_concurrency=limit)
+
+def get_transcription_engine(doubao_app_id: str, doubao_token: str) -> AsyncTranscriptionEngine:
+    """按凭据返回共享的转录引擎实例（同一凭据共享一个连接池）。"""
+    _get_event_loop()
+    with _loop_lock:
+        key = (doubao_app_id, doubao_token)
+        if key not in _engines:
+            _engines[key] = AsyncTranscriptionEngine(doubao_app_id, doubao_token)
+        return _engines[key]
+
+def submit_transcription(audio_path: str, doubao_app_id: str, doubao_token: str, priority: int = 0,
+                         deadline: float | None = None, siblings: SiblingStats | None = None) -> concurrent.futures.Future:
+    """
+    在后台事件循环中转录音频文件，立即返回 Future。priority 越小越优先提交。
+    deadline: 任务截止时间（time.monotonic() 时间戳）。
+    siblings: 同一任务各音频块共享的耗时统计；传入且启用对冲时，拖后腿的音频块会被对冲。
+    """
+    engine = get_transcription_engine(doubao_app_id, doubao_token)
+    if siblings is not None and ASR_HEDGE_ENABLED:
+        coroutine = engine.transcribe_hedged(audio_path, siblings, priority, deadline)
+    else:
+        coroutine = engine.transcribe(audio_path, priority, deadline=deadline)
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_event_loop())
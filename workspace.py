@@ -0,0 +1,199 @@
+# workspace.py
+# 每次处理任务使用独立的工作目录（上传文件、音频块、文字稿、生成结果），并发任务互不干扰。
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+from config import WORKSPACE_ROOT, WORKSPACE_CLEANUP, WORKSPACE_QUOTA_MB, WORKSPACE_RETENTION_HOURS
+
+# 清理策略：always 任务结束后总是删除；on_success 仅在成功时删除（失败的保留以便排查）；never 总是保留
+CLEANUP_POLICIES = ("always", "on_success", "never")
+
+# 16kHz 单声道 16-bit WAV 每秒音频的字节数，用于预估音频块占用的磁盘空间
+ASR_WAV_BYTES_PER_SECOND = 16000 * 2
+
+JOB_METADATA_FILE = "job.json"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+class WorkspaceQuotaError(Exception):
+    """工作目录总占用超出磁盘配额，且无法通过清理过期任务腾出空间。"""
+
+# 同一进程内的配额检查与目录创建需要串行，避免多个任务同时通过检查
+_quota_lock = threading.Lock()
+# (受 _quota_lock 保护) 各工作目录根下运行中任务已预留、尚未释放的字节数。
+# 预留的数据是逐步写入的，配额检查时需要计入，否则同时开始的任务会各自通过检查
+_reserved_bytes = {}
+
+def directory_size(path: str) -> int:
+    """统计目录下所有文件的总字节数。"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for filename in files:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                continue
+    return total
+
+def estimate_job_bytes(input_path: str, media_seconds: float | None = None) -> int:
+    """预估一次任务需要的额外磁盘空间：媒体文件按切分出的 WAV 音频块计算，文档按文字稿约等于原文件大小计算。"""
+    if media_seconds:
+        return int(media_seconds * ASR_WAV_BYTES_PER_SECOND)
+    try:
+        return os.path.getsize(input_path)
+    except OSError:
+        return 0
+
+class JobWorkspace:
+    """
+    单个任务的工作目录 `<root>/<job_id>/`：
+    - job_id 由时间戳与随机后缀组成，按字典序即按创建时间排序；
+    - 目录中的 job.json 记录任务状态，供配额清理判断哪些目录可以删除；
+    - finish() 按清理策略删除或保留目录。
+    """
+
+    def __init__(self, root: str, job_id: str, cleanup: str):
+        if cleanup not in CLEANUP_POLICIES:
+            raise ValueError(f"未知的清理策略: {cleanup}，可选值: {', '.join(CLEANUP_POLICIES)}")
+        self.root = root
+        self.job_id = job_id
+        self.path = os.path.join(root, job_id)
+        self.cleanup = cleanup
+        self.finished = False
+        self.reserved_bytes = 0
+
+    @classmethod
+    def create(cls, root: str = WORKSPACE_ROOT, cleanup: str = WORKSPACE_CLEANUP,
+               quota_mb: float = WORKSPACE_QUOTA_MB) -> "JobWorkspace":
+        """创建新的工作目录；超出配额时先清理过期/已结束的任务目录，仍不足则抛出 WorkspaceQuotaError。"""
+        job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        workspace = cls(root, job_id, cleanup)
+        with _quota_lock:
+            ensure_quota(root, 0, quota_mb, _reserved_bytes.get(root, 0))
+            os.makedirs(workspace.path)
+            workspace._write_metadata(STATUS_RUNNING)
+        return workspace
+
+    @classmethod
+    def open(cls, root: str, job_id: str, cleanup: str = WORKSPACE_CLEANUP) -> "JobWorkspace":
+        """打开已有的工作目录（例如按任务 ID 继续执行失败的任务），并重新标记为运行中。"""
+        workspace = cls(root, job_id, cleanup)
+        if not os.path.isdir(workspace.path):
+            raise FileNotFoundError(f"任务 {job_id} 的工作目录不存在（可能已被清理）")
+        workspace._write_metadata(STATUS_RUNNING)
+        return workspace
+
+    def file_path(self, name: str) -> str:
+        """工作目录中的文件路径（只取文件名部分，防止上传文件名中的路径穿越）。"""
+        return os.path.join(self.path, os.path.basename(name))
+
+    @property
+    def chunks_dir(self) -> str:
+        return os.path.join(self.path, "chunks")
+
+    def reserve(self, extra_bytes: int, quota_mb: float = WORKSPACE_QUOTA_MB):
+        """
+        在开始处理前确认剩余配额足以容纳预计写入的数据（计入其他任务已预留的部分），不足时抛出 WorkspaceQuotaError。
+        成功时预留这部分空间，直到 finish() 释放。
+        """
+        with _quota_lock:
+            ensure_quota(self.root, extra_bytes, quota_mb, _reserved_bytes.get(self.root, 0))
+            _reserved_bytes[self.root] = _reserved_bytes.get(self.root, 0) + extra_bytes
+            self.reserved_bytes += extra_bytes
+
+    def _release_reservation(self):
+        with _quota_lock:
+            remaining = _reserved_bytes.get(self.root, 0) - self.reserved_bytes
+            if remaining > 0:
+                _reserved_bytes[self.root] = remaining
+            else:
+                _reserved_bytes.pop(self.root, None)
+            self.reserved_bytes = 0
+
+    def _write_metadata(self, status: str):
+        metadata = {"job_id": self.job_id, "status": status, "pid": os.getpid(), "updated_at": time.time()}
+        with open(os.path.join(self.path, JOB_METADATA_FILE), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f)
+
+    def finish(self, succeeded: bool):
+        """标记任务结束，并按清理策略删除或保留工作目录。"""
+        if self.finished:
+            return
+        self.finished = True
+        self._release_reservation()
+        if self.cleanup == "always" or (self.cleanup == "on_success" and succeeded):
+            shutil.rmtree(self.path, ignore_errors=True)
+            return
+        try:
+            self._write_metadata(STATUS_SUCCEEDED if succeeded else STATUS_FAILED)
+        except OSError as e:
+            print(f"警告：无法更新任务状态 {self.job_id}: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish(exc_type is None)
+        return False
+
+def _is_removable(job_path: str, now: float, retention_seconds: float) -> bool:
+    """已结束的任务目录可以删除；运行中的目录超过保留时长未更新则视为残留（进程已崩溃）。"""
+    try:
+        with open(os.path.join(job_path, JOB_METADATA_FILE), 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        status, updated_at = metadata.get("status"), metadata.get("updated_at", 0)
+    except (OSError, ValueError):
+        status, updated_at = None, os.path.getmtime(job_path)
+    if status == STATUS_RUNNING:
+        return now - updated_at > retention_seconds
+    return True
+
+def purge_workspaces(root: str = WORKSPACE_ROOT, retention_hours: float = WORKSPACE_RETENTION_HOURS,
+                     bytes_to_free: int = 0) -> int:
+    """
+    清理工作目录：删除保留时长已过的已结束任务；若仍需腾出 bytes_to_free 字节，
+    再按创建时间从旧到新删除其余已结束的任务。运行中的任务不会被删除。返回释放的字节数。
+    """
+    if not os.path.isdir(root):
+        return 0
+    now = time.time()
+    retention_seconds = retention_hours * 3600
+    freed = 0
+    remaining = []
+    for job_id in sorted(os.listdir(root)):
+        job_path = os.path.join(root, job_id)
+        if not os.path.isdir(job_path) or not _is_removable(job_path, now, retention_seconds):
+            continue
+        if now - os.path.getmtime(job_path) > retention_seconds:
+            freed += directory_size(job_path)
+            shutil.rmtree(job_path, ignore_errors=True)
+        else:
+            remaining.append(job_path)
+
+    for job_path in remaining:
+        if freed >= bytes_to_free:
+            break
+        freed += directory_size(job_path)
+        shutil.rmtree(job_path, ignore_errors=True)
+    return freed
+
+def ensure_quota(root: str, extra_bytes: int, quota_mb: float, reserved_bytes: int = 0):
+    """
+    (需持有 _quota_lock) 保证写入 extra_bytes 后工作目录总占用不超过配额；quota_mb <= 0 表示不限制。
+    reserved_bytes 为运行中任务已预留的字节数，按已占用计算（其中已写入磁盘的部分会被重复计入，偏保守）。
+    """
+    if quota_mb <= 0:
+        return
+    quota_bytes = int(quota_mb * 1024 * 1024)
+    used = (directory_size(root) if os.path.isdir(root) else 0) + reserved_bytes
+    if used + extra_bytes <= quota_bytes:
+        return
+    used -= purge_workspaces(root, bytes_to_free=used + extra_bytes - quota_bytes)
+    if used + extra_bytes > quota_bytes:
+        raise WorkspaceQuotaError(
+            f"工作目录磁盘配额不足：已用 {used / 1024 / 1024:.0f} MB，"
+            f"本任务预计需要 {extra_bytes / 1024 / 1024:.0f} MB，配额 {quota_mb:.0f} MB。请稍后重试。")